@@ -10,6 +10,7 @@ from app.database import get_db
 from app.api.deps import get_current_user, get_current_admin
 from app.models import Activity, User, Reward
 from app.schemas.activity import ActivityCreate, ActivityUpdate, ActivityResponse, ActivityListResponse
+from app.services.catalog_service import catalog_service
 from app.utils.logger import logger
 
 router = APIRouter()
@@ -75,6 +76,7 @@ def create_activity(
     )
     db.add(new_activity)
     db.commit()
+    catalog_service.invalidate()
     db.refresh(new_activity)
     logger.info(f"Admin {current_user.username} created activity: {new_activity.id} - {new_activity.title}")
     return new_activity
@@ -106,6 +108,7 @@ def update_activity(
         setattr(activity, key, value)
     
     db.commit()
+    catalog_service.invalidate()
     db.refresh(activity)
     logger.info(f"Admin {current_user.username} updated activity: {activity.id}")
     return activity
@@ -124,6 +127,7 @@ def delete_activity(
     
     db.delete(activity)
     db.commit()
+    catalog_service.invalidate()
     logger.info(f"Admin {current_user.username} deleted activity: {activity_id}")
     return {"message": "活动已删除"}
 
@@ -155,6 +159,7 @@ def update_activity_status(
     
     activity.status = payload.status
     db.commit()
+    catalog_service.invalidate()
     db.refresh(activity)
     logger.info(f"Admin {current_user.username} updated status of activity {activity.id} to {payload.status}")
     return activity
@@ -196,6 +201,14 @@ def participate_activity(
     
     db.commit()
     
+    # 已参与的活动不再出现在推荐中
+    from app.services.participation_service import participation_index
+    from app.services.popularity_service import popularity_service
+    from app.services.recommendation_service import clear_recommendation_cache
+    participation_index.add(current_user.id, activity_id)
+    popularity_service.record(activity_id, "participation")
+    clear_recommendation_cache(current_user.id)
+    
     logger.info(f"User {current_user.id} participated in activity {activity_id}, reward: {reward.id}")
     return {
         "message": "参与成功",
@@ -1,5 +1,5 @@
 """管理员API路由"""
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from typing import Optional
@@ -12,8 +12,9 @@ from app.utils.logger import logger
 from app.schemas.admin import (
     DashboardResponse, AdminUserListResponse, PotentialAnalysisResponse,
     StrategyItem, SystemLogResponse, UserStatsResponse, ActivityStatsResponse,
-    ConfigResponse, ModelInfoResponse, ClusterItem, TrendItem, FeatureItem,
-    ClusterStatsItem, ClusterRebuildResponse
+    ConfigResponse, ConfigUpdateRequest, ModelInfoResponse, ClusterItem, TrendItem, FeatureItem,
+    ClusterStatsItem, ClusterRebuildResponse, GlobalImportanceResponse,
+    ModelVersionItem, ModelVersionListResponse
 )
 
 router = APIRouter()
@@ -48,15 +49,21 @@ def get_dashboard(
         for tag, count in cluster_stats
     ]
     
-    # 特征重要性（模拟数据，实际应从模型获取）
-    feature_importance = [
-        {"name": "social_influence", "label": "社交影响", "importance": 0.25},
-        {"name": "incentive_sensitivity", "label": "激励敏感度", "importance": 0.22},
-        {"name": "tech_adoption", "label": "技术接受度", "importance": 0.18},
-        {"name": "environment_factor", "label": "环境因素", "importance": 0.15},
-        {"name": "psychology_factor", "label": "心理因素", "importance": 0.12},
-        {"name": "personal_innovativeness", "label": "个人创新性", "importance": 0.08},
-    ]
+    # 特征重要性：优先读取当前模型版本的全局SHAP缓存，未计算时使用默认数据
+    from app.ml.predict import get_model
+    from app.services.importance_service import importance_service
+    cached_importance = importance_service.get_cached(get_model().version)
+    if cached_importance:
+        feature_importance = cached_importance["features"]
+    else:
+        feature_importance = [
+            {"name": "social_influence", "label": "社交影响", "importance": 0.25},
+            {"name": "incentive_sensitivity", "label": "激励敏感度", "importance": 0.22},
+            {"name": "tech_adoption", "label": "技术接受度", "importance": 0.18},
+            {"name": "environment_factor", "label": "环境因素", "importance": 0.15},
+            {"name": "psychology_factor", "label": "心理因素", "importance": 0.12},
+            {"name": "personal_innovativeness", "label": "个人创新性", "importance": 0.08},
+        ]
     
     # 推荐效果趋势（模拟7天数据）
     from datetime import datetime, timedelta
@@ -364,32 +371,26 @@ def get_recommendation_config(
     current_user: User = Depends(get_current_admin)
 ):
     """获取推荐系统配置"""
-    import json
-    import os
-    config_path = os.path.join(os.path.dirname(__file__), '../../config/recommendation_config.json')
-    try:
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        return ConfigResponse(**config.get('inference', {}))
-    except Exception:
-        return ConfigResponse(
-            max_recommendations=10,
-            cold_start_count=5,
-            min_score=0.3,
-            diversity_weight=0.2
-        )
+    from app.config_loader import rec_config
+    return ConfigResponse(**rec_config.get_config())
 
 
 @router.put("/config/")
 @router.put("/config")
 def update_recommendation_config(
-    config: dict,
+    config: ConfigUpdateRequest,
     current_user: User = Depends(get_current_admin)
 ):
-    """更新推荐系统配置"""
-    # 这里可以保存到配置文件或数据库
+    """更新推荐系统配置（立即生效并写回配置文件）"""
+    from app.config_loader import rec_config
+    from app.services.recommendation_service import clear_recommendation_cache
+    
+    config = config.model_dump(exclude_none=True)
+    rec_config.update_config(config)
+    # 缓存的排序按旧配置生成
+    clear_recommendation_cache()
     logger.info(f"Admin {current_user.username} updated recommendation config: {config}")
-    return {"message": "配置已更新", "config": config}
+    return {"message": "配置已更新", "config": rec_config.get_config()}
 
 
 # ============ 模型管理API ============
@@ -407,21 +408,30 @@ def get_model_info(
     model = get_model()
     model_path = os.path.join(os.path.dirname(__file__), '../../best_rf_model.pkl')
     
-    # 获取模型文件修改时间
-    trained_at = None
-    if os.path.exists(model_path):
+    # 注册中心版本读取清单中的发布时间，否则取模型文件修改时间
+    trained_at = model.manifest.get("created_at")
+    if trained_at is None and os.path.exists(model_path):
         mtime = os.path.getmtime(model_path)
         trained_at = datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
     
     feature_importance = model.get_feature_importance() if model else []
     
+    # 注册中心版本使用训练时记录的测试集指标；旧版模型文件没有评估记录，指标返回空
+    manifest = model.manifest
+    metrics = manifest.get("metrics", {})
+    
     return ModelInfoResponse(
-        model_type="RandomForest",
+        version=model.version,
+        model_type=manifest.get("model_type", "RandomForest"),
         trained_at=trained_at,
-        accuracy=0.85,
-        auc=0.89,
-        train_samples=1000,
-        test_samples=200,
+        accuracy=metrics.get("accuracy"),
+        auc=metrics.get("auc"),
+        recall=metrics.get("recall"),
+        precision=metrics.get("precision"),
+        train_samples=manifest.get("train_samples"),
+        test_samples=manifest.get("test_samples"),
+        benchmark=manifest.get("benchmark") or model.get_benchmark(),
+        meets_targets=manifest.get("meets_targets"),
         feature_importance={f.get("feature", f"f{i}"): f.get("importance", 0) for i, f in enumerate(feature_importance[:6])}
     )
 
@@ -429,16 +439,211 @@ def get_model_info(
 @router.post("/model/train/")
 @router.post("/model/train")
 def train_model(
-    current_user: User = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    params: dict = None,
+    activate: bool = False,
+    current_user: User = Depends(get_current_admin)
 ):
-    """重新训练模型"""
-    from app.utils.logger import logger
+    """重新训练模型（后台任务，完成后发布到模型注册中心）
+    
+    - **params**: 覆盖 training.random_forest 的参数（可选）
+    - **activate**: 训练完成后是否立即激活新版本
+    """
+    from app.services.training_service import training_service
+    
+    if not training_service.mark_pending():
+        raise HTTPException(status_code=409, detail="已有训练任务在执行，请稍后查看训练结果")
+    
+    background_tasks.add_task(training_service.run, params, activate)
     logger.info(f"管理员 {current_user.username} 启动模型训练")
-    # 实际训练应该在后台任务中进行
     return {"message": "模型训练已启动，请稍后查看训练结果"}
 
 
+@router.get("/model/train/status/")
+@router.get("/model/train/status")
+def get_train_status(
+    current_user: User = Depends(get_current_admin)
+):
+    """获取模型训练任务进度"""
+    from app.services.training_service import training_service
+    return training_service.get_status()
+
+
+@router.post("/model/search/")
+@router.post("/model/search")
+def start_hyperparameter_search(
+    background_tasks: BackgroundTasks,
+    search: dict = None,
+    train_best: bool = False,
+    activate: bool = False,
+    current_user: User = Depends(get_current_admin)
+):
+    """启动超参数搜索（后台任务）
+    
+    - **search**: 覆盖 training.search 的搜索配置（可选）
+    - **train_best**: 搜索完成后用推荐候选（满足目标指标且延迟最低）的参数训练并发布新版本
+    - **activate**: 发布后是否立即激活
+    """
+    from app.services.search_service import search_service
+    
+    if not search_service.mark_pending():
+        raise HTTPException(status_code=409, detail="已有超参数搜索任务在执行")
+    
+    background_tasks.add_task(search_service.run, search, train_best, activate)
+    logger.info(f"管理员 {current_user.username} 启动超参数搜索")
+    return {"message": "超参数搜索已启动，请稍后查看排行榜"}
+
+
+@router.get("/model/search/")
+@router.get("/model/search")
+def get_hyperparameter_search(
+    current_user: User = Depends(get_current_admin)
+):
+    """获取超参数搜索进度与最近一次的排行榜"""
+    from app.services.search_service import search_service
+    return {
+        "status": search_service.get_status(),
+        "result": search_service.get_latest_leaderboard(),
+    }
+
+
+@router.get("/model/lookup-table/")
+@router.get("/model/lookup-table")
+def get_lookup_table_status(
+    current_user: User = Depends(get_current_admin)
+):
+    """获取分数查找表状态与误差报告"""
+    from app.services.lookup_service import lookup_service
+    return {"enabled": lookup_service.enabled(), **lookup_service.get_status()}
+
+
+@router.post("/model/lookup-table/rebuild/")
+@router.post("/model/lookup-table/rebuild")
+def rebuild_lookup_table(
+    current_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """为当前模型与活动目录重建分数查找表（后台执行）"""
+    from app.ml.predict import get_model
+    from app.services.catalog_service import catalog_service
+    from app.services.lookup_service import lookup_service
+    
+    if not lookup_service.enabled():
+        raise HTTPException(status_code=400, detail="分数查找表未启用（inference.lookup_table.enabled）")
+    if not lookup_service.ensure(get_model(), catalog_service.get_snapshot(db), force=True):
+        raise HTTPException(status_code=409, detail="查找表正在构建中")
+    logger.info(f"管理员 {current_user.username} 重建分数查找表")
+    return {"message": "查找表重建已启动"}
+
+
+@router.get("/model/versions/")
+@router.get("/model/versions")
+def list_model_versions(
+    current_user: User = Depends(get_current_admin)
+):
+    """获取模型注册中心的版本列表"""
+    from app.ml.predict import get_model, get_registry
+    from app.services.model_service import model_service
+    
+    return ModelVersionListResponse(
+        serving_version=get_model().version,
+        active_version=get_registry().get_active_version(),
+        loader_status=model_service.get_status(),
+        versions=[ModelVersionItem(**item) for item in model_service.list_versions()]
+    )
+
+
+@router.post("/model/versions/{version}/activate/")
+@router.post("/model/versions/{version}/activate")
+def activate_model_version(
+    version: str,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_admin)
+):
+    """激活指定模型版本（后台加载预热后原子切换，无需重启）"""
+    from app.services.model_service import model_service
+    
+    try:
+        started = model_service.begin_activation(version)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not started:
+        raise HTTPException(status_code=409, detail="已有模型正在加载，请稍后重试")
+    
+    background_tasks.add_task(model_service.activate, version)
+    logger.info(f"管理员 {current_user.username} 激活模型版本: {version}")
+    return {"message": "模型版本加载中，完成后自动切换", "version": version}
+
+
+@router.post("/model/rollback/")
+@router.post("/model/rollback")
+def rollback_model_version(
+    current_user: User = Depends(get_current_admin)
+):
+    """回滚到上一个激活的模型版本"""
+    from app.services.model_service import model_service
+    
+    try:
+        target = model_service.rollback()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if target is None:
+        raise HTTPException(status_code=400, detail="没有可回滚的模型版本")
+    
+    logger.info(f"管理员 {current_user.username} 回滚模型版本到: {target}")
+    return {"message": "模型回滚中，完成后自动切换", "version": target}
+
+
+@router.get("/model/shap-importance/")
+@router.get("/model/shap-importance")
+def get_shap_importance(
+    current_user: User = Depends(get_current_admin)
+):
+    """获取当前模型版本的全局SHAP特征重要性（读取缓存）"""
+    from app.ml.predict import get_model
+    from app.services.importance_service import importance_service
+    
+    model_version = get_model().version
+    job_status = importance_service.get_status()
+    cached = importance_service.get_cached(model_version)
+    
+    if cached:
+        status = "completed"
+    elif job_status["model_version"] == model_version:
+        status = job_status["state"]
+    else:
+        status = "not_computed"
+    
+    return GlobalImportanceResponse(
+        version=model_version,
+        status=status,
+        progress=1.0 if cached else job_status["progress"],
+        computed_at=cached["computed_at"] if cached else None,
+        sample_size=cached["sample_size"] if cached else 0,
+        features=[FeatureItem(**item) for item in cached["features"]] if cached else []
+    )
+
+
+@router.post("/model/shap-importance/")
+@router.post("/model/shap-importance")
+def compute_shap_importance(
+    background_tasks: BackgroundTasks,
+    sample_size: Optional[int] = Query(None, ge=10, le=100000),
+    current_user: User = Depends(get_current_admin)
+):
+    """启动全局SHAP特征重要性后台计算"""
+    from app.ml.predict import get_model
+    from app.services.importance_service import importance_service
+    
+    model_version = get_model().version
+    if not importance_service.mark_pending(model_version):
+        return {"message": "全局SHAP计算正在进行中", "version": model_version}
+    
+    background_tasks.add_task(importance_service.run, sample_size)
+    logger.info(f"管理员 {current_user.username} 启动全局SHAP计算，模型版本: {model_version}")
+    return {"message": "全局SHAP计算已启动", "version": model_version}
+
+
 # ============ 聚类管理API ============
 
 @router.get("/clusters/")
@@ -470,6 +675,94 @@ def rebuild_clusters(
     return ClusterRebuildResponse(**result)
 
 
+@router.get("/clusters/shortlists/")
+@router.get("/clusters/shortlists")
+def get_cluster_shortlists(
+    current_user: User = Depends(get_current_admin)
+):
+    """获取聚类候选短名单状态与召回率报告"""
+    from app.services.shortlist_service import shortlist_service
+    return {"enabled": shortlist_service.enabled(), **shortlist_service.get_status()}
+
+
+@router.post("/clusters/shortlists/rebuild/")
+@router.post("/clusters/shortlists/rebuild")
+def rebuild_cluster_shortlists(
+    current_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """为当前模型与活动目录重建聚类候选短名单（后台执行）"""
+    from app.ml.predict import get_model
+    from app.services.catalog_service import catalog_service
+    from app.services.shortlist_service import shortlist_service
+
+    if not shortlist_service.enabled():
+        raise HTTPException(status_code=400, detail="聚类短名单未启用（inference.cluster_shortlist.enabled）")
+    if not shortlist_service.ensure(get_model(), catalog_service.get_snapshot(db), force=True):
+        raise HTTPException(status_code=409, detail="短名单正在构建中")
+    logger.info(f"管理员 {current_user.username} 重建聚类候选短名单")
+    return {"message": "短名单重建已启动"}
+
+
+@router.get("/prewarm/")
+@router.get("/prewarm")
+def get_prewarm_status(
+    current_user: User = Depends(get_current_admin)
+):
+    """获取推荐缓存预热进度"""
+    from app.services.prewarm_service import prewarm_service
+    return prewarm_service.get_status()
+
+
+@router.post("/prewarm/")
+@router.post("/prewarm")
+def start_prewarm(
+    current_user: User = Depends(get_current_admin)
+):
+    """为最近活跃的用户重新预热推荐缓存（后台执行）"""
+    from app.services.prewarm_service import prewarm_service
+
+    if not prewarm_service.config().get("enabled", True):
+        raise HTTPException(status_code=400, detail="推荐缓存预热未启用（inference.prewarm.enabled）")
+    if not prewarm_service.start():
+        raise HTTPException(status_code=409, detail="预热正在执行中")
+    logger.info(f"管理员 {current_user.username} 启动推荐缓存预热")
+    return {"message": "推荐缓存预热已启动"}
+
+
+@router.get("/participation-index/")
+@router.get("/participation-index")
+def get_participation_index_stats(
+    current_user: User = Depends(get_current_admin)
+):
+    """获取参与记录索引的规模与内存占用"""
+    from app.services.participation_service import participation_index
+    return {"enabled": participation_index.enabled(), **participation_index.get_stats()}
+
+
+@router.get("/serving-stats/")
+@router.get("/serving-stats")
+def get_serving_stats(
+    current_user: User = Depends(get_current_admin)
+):
+    """获取推荐/解释接口按服务层级（model / cached / stale / shortlist / rule / popularity）的请求数与耗时分位数，
+    并发请求合并的执行/共享/等待超时次数，推荐缓存的 hit / stale_hit / miss 与后台刷新队列，按用户限流的放行/拒绝次数，准入控制各类别的并发、队列深度与丢弃次数，以及截止时间工作线程池的提交/拒绝/取消次数"""
+    from app.services.recommendation_service import recommendation_service
+    from app.utils.admission import admission_controller
+    from app.utils.deadline import worker_pool
+    from app.utils.metrics import serving_metrics
+    from app.utils.rate_limit import rate_limiter
+    from app.utils.singleflight import get_all_stats
+    return {
+        **serving_metrics.get_stats(),
+        "coalescing": get_all_stats(),
+        "cache": recommendation_service.get_cache_stats(),
+        "rate_limit": rate_limiter.get_stats(),
+        "admission": admission_controller.get_stats(),
+        "worker_pool": worker_pool().get_stats(),
+    }
+
+
 # ============ 日志API ============
 
 @router.get("/logs/")
@@ -3,10 +3,10 @@
 文件名：app/api/recommendations.py
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
-from typing import List
+from typing import List, Optional
 import traceback
 
 from app.database import get_db
@@ -23,6 +23,7 @@ router = APIRouter()
 
 @router.get("/", response_model=List[schemas.RecommendationResponse])
 def get_recommendations(
+    response: Response,
     limit: int = 10,
     refresh: bool = False,
     current_user: User = Depends(get_current_user),
@@ -33,16 +34,18 @@ def get_recommendations(
     
     - **limit**: 返回的推荐数量（默认10）
     
-    返回按接受概率排序的活动推荐列表
+    返回按接受概率排序的活动推荐列表；响应头 X-Serving-Tier 为本次使用的服务层级（超时降级时不为 model）
     """
     try:
-        # 使用推荐服务获取个性化推荐
-        recommendations = recommendation_service.get_recommendations(
+        # 使用推荐服务获取个性化推荐（推荐流第一页）
+        feed = recommendation_service.get_feed(
             db=db,
             user_id=current_user.id,
             limit=limit,
             refresh=refresh
         )
+        recommendations = feed["items"]
+        response.headers["X-Serving-Tier"] = feed["serving_tier"]
         logger.info(f"[API] 用户ID: {current_user.id}, 返回推荐数量: {len(recommendations)}")
         return recommendations
         
@@ -54,6 +57,41 @@ def get_recommendations(
         )
 
 
+@router.get("/feed", response_model=schemas.RecommendationFeedResponse)
+def get_recommendation_feed(
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    refresh: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    分页获取推荐流
+    
+    - **limit**: 每页数量（默认10）
+    - **cursor**: 上一页返回的 next_cursor，首页不传
+    - **refresh**: 换一批（在已计算的排序内重新洗牌）
+    
+    同一排序版本内翻页结果不重复；next_cursor 为空表示没有更多推荐
+    """
+    try:
+        return recommendation_service.get_feed(
+            db=db,
+            user_id=current_user.id,
+            limit=limit,
+            cursor=cursor,
+            refresh=refresh
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error(f"获取推荐流失败: {str(e)}\n{traceback.format_exc()}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"获取推荐流失败: {str(e)}"
+        )
+
+
 @router.post("/{activity_id}/feedback")
 def record_feedback(
     activity_id: int,
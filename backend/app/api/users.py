@@ -6,7 +6,7 @@ from app.database import get_db
 from app.api.deps import get_current_user
 from app.models import User, UserProfile
 from app.services.profile_service import profile_service
-from app.services.recommendation_service import recommendation_service
+from app.services.recommendation_service import clear_recommendation_cache, recommendation_service
 from app.utils.logger import logger
 from app.schemas.profile import UserPreferences, UserProfileUpdate, UserProfileResponse
 from app.schemas.questionnaire import QuestionnaireSubmit
@@ -130,6 +130,7 @@ def update_user_preferences(
     profile.preference_incentive_types = ",".join(preferences.incentiveTypes)
     
     db.commit()
+    clear_recommendation_cache(current_user.id)
     
     logger.info(f"用户 {current_user.id} 更新偏好设置")
     return {"message": "偏好设置已更新"}
@@ -27,6 +27,8 @@ class Settings(BaseSettings):
     
     # 文件路径配置
     MODEL_DIR: str = "."  # 模型文件在backend根目录
+    MODEL_REGISTRY_DIR: str = "data/model_registry"  # 版本化模型注册中心
+    MODEL_REGISTRY_POLL_SECONDS: int = 10  # 多进程部署时感知激活版本变化的轮询间隔
     DATA_DIR: str = "data"
     LOG_DIR: str = "logs"
     
@@ -14,6 +14,7 @@ class RecommendationConfig:
     
     _instance: Optional['RecommendationConfig'] = None
     _config: Dict[str, Any] = {}
+    _revision: int = 0
     
     def __new__(cls):
         if cls._instance is None:
@@ -34,6 +35,7 @@ class RecommendationConfig:
                 self._config = json.load(f)
         else:
             self._config = self._get_default_config()
+        self._revision += 1
     
     def _get_default_config(self) -> Dict[str, Any]:
         """返回默认配置"""
@@ -69,6 +71,11 @@ class RecommendationConfig:
         
         return value
     
+    @property
+    def revision(self) -> int:
+        """配置版本号（每次加载或更新后递增，依赖配置的预编译结果据此失效）"""
+        return self._revision
+    
     @property
     def training(self) -> Dict[str, Any]:
         return self._config.get('training', {})
@@ -138,6 +145,8 @@ class RecommendationConfig:
                 self._config["inference"] = {}
             self._config["inference"]["diversity_weight"] = new_config["diversity_weight"]
         
+        self._revision += 1
+        
         # 保存到文件
         self._save_config()
     
@@ -3,14 +3,27 @@ FastAPI应用入口文件
 文件名：app/main.py
 """
 
-from fastapi import FastAPI
+import math
+
+from fastapi import FastAPI, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 
 from app.config import settings
 from app.database import engine, Base
 from app.api import auth, users, activities, recommendations, admin, rewards
+from app.ml.batching import micro_batcher
+from app.services.catalog_service import catalog_service
+from app.services.model_service import model_service
+from app.services.participation_service import participation_index
+from app.services.popularity_service import popularity_service
+from app.services.prewarm_service import prewarm_service
+from app.utils.admission import AdmissionRejected, admission_controller
+from app.utils.auth import token_subject
 from app.utils.logger import logger
+from app.utils.rate_limit import rate_limiter
 
 
 @asynccontextmanager
@@ -21,8 +34,36 @@ async def lifespan(app: FastAPI):
     # 创建数据库表
     Base.metadata.create_all(bind=engine)
     logger.info("✅ 数据库初始化完成")
+    # 构建参与记录索引（推荐时排除已参与的活动）
+    try:
+        participation_index.load()
+    except Exception as e:
+        logger.warning(f"参与记录索引构建失败，将在首次推荐时重试: {e}")
+    # 恢复活动热度计数（冷启动推荐与热度召回）
+    try:
+        popularity_service.start()
+    except Exception as e:
+        logger.warning(f"活动热度服务启动失败: {e}")
+    # 活动结束时间到达时自动切换状态
+    try:
+        catalog_service.start_scheduler()
+    except Exception as e:
+        logger.warning(f"活动状态调度器启动失败: {e}")
+    # 为最近活跃的用户预热推荐缓存（完成前就绪检查返回未就绪）
+    try:
+        prewarm_service.start()
+    except Exception as e:
+        logger.warning(f"推荐缓存预热启动失败: {e}")
+    # 限流存储（配置为 redis 但不可用时启动失败）
+    rate_limiter.start()
+    # 跟随模型注册中心的激活版本（多进程部署时由任一进程切换即可）
+    model_service.start_watcher()
     yield
     # 关闭时执行
+    model_service.stop_watcher()
+    micro_batcher.close()
+    catalog_service.stop_scheduler()
+    popularity_service.stop()
     logger.info("👋 关闭系统...")
 
 
@@ -34,6 +75,50 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+
+# 准入控制（最先注册，位于限流之内：超限的请求不占用排队名额）
+@app.middleware("http")
+async def admission_middleware(request: Request, call_next):
+    """按优先级类别限制并发（inference.admission），排队已满或超时返回503与Retry-After"""
+    request_class = admission_controller.classify(request.method, request.url.path) \
+        if admission_controller.enabled() else None
+    if request_class is None:
+        return await call_next(request)
+    try:
+        await admission_controller.acquire(request_class)
+    except AdmissionRejected as e:
+        logger.warning(f"请求被丢弃 ({e.request_class}, {e.reason}): {request.method} {request.url.path}")
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "服务繁忙，请稍后重试"},
+            headers={"Retry-After": str(admission_controller.retry_after_seconds())}
+        )
+    try:
+        return await call_next(request)
+    finally:
+        admission_controller.release(request_class)
+
+
+# 按登录用户限流（先于CORS注册，429响应同样带有CORS头）
+@app.middleware("http")
+async def rate_limit_middleware(request: Request, call_next):
+    """超过 inference.rate_limit 的请求返回429与Retry-After；未携带有效令牌的请求不限流（由接口鉴权拒绝）"""
+    if rate_limiter.enabled():
+        username = token_subject(request.headers.get("authorization"))
+        if username is not None:
+            if rate_limiter.is_shared():
+                allowed, wait = await run_in_threadpool(rate_limiter.check, username)
+            else:
+                allowed, wait = rate_limiter.check(username)
+            if not allowed:
+                return JSONResponse(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    content={"detail": "请求过于频繁，请稍后再试"},
+                    headers={"Retry-After": str(max(1, math.ceil(wait)))}
+                )
+    return await call_next(request)
+
+
 # 配置CORS
 app.add_middleware(
     CORSMiddleware,
@@ -62,4 +147,27 @@ async def root():
 @app.get("/api/v1/health")
 async def health_check():
     """健康检查"""
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+
+@app.get("/ready")
+@app.get("/api/v1/ready")
+def readiness_check(response: Response):
+    """就绪检查：模型已加载、活动目录已加载、启动预热已结束；未就绪返回503"""
+    from app.ml.predict import get_model
+    
+    model = get_model()
+    checks = {
+        "model_loaded": model.model is not None and hasattr(model.model, 'classes_'),
+        "catalog_loaded": catalog_service.is_loaded(),
+        "prewarm_done": prewarm_service.initial_done(),
+    }
+    ready = all(checks.values())
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {
+        "status": "ready" if ready else "not_ready",
+        "checks": checks,
+        "model_version": model.version,
+        "prewarm": prewarm_service.get_status(),
+    }
@@ -0,0 +1,265 @@
+"""
+打分请求微批处理
+文件名：app/ml/batching.py
+
+同步接口在线程池中并发执行，每个推荐请求各自调用一次 predict_proba，
+每次调用都有固定开销（输入校验、逐棵树的调度）。微批处理器在短时间窗口内
+（inference.batch.micro_batching.max_wait_ms，或累计到 max_rows 行）收集并发的打分请求，
+把矩阵堆叠后对同一模型只调用一次 predict_proba，再把各自的结果切片交还调用方。
+没有其它打分请求在进行时（bypass_when_idle），请求直接打分，不经过后台线程，
+避免低并发时每个请求多一次线程切换与等待窗口。
+
+吞吐对比：
+    python -m app.ml.batching --concurrency 1 4 16 64
+"""
+
+import argparse
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config_loader import rec_config
+from app.utils.logger import logger
+
+
+# 放入队列使后台线程退出
+_STOP = object()
+
+
+class MicroBatcher:
+    """收集并发打分请求，合并为一次批量预测"""
+
+    def __init__(self, max_wait_ms: float = None, max_rows: int = None):
+        self._max_wait_ms = max_wait_ms
+        self._max_rows = max_rows
+        self._queue: "queue.Queue[Tuple[Any, np.ndarray, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        # 已提交尚未完成的请求数（含直接打分的请求），为0时新请求不必等待合并
+        self._in_flight = 0
+        self._stats = {"requests": 0, "rows": 0, "batches": 0, "model_calls": 0, "bypassed": 0}
+
+    @staticmethod
+    def config() -> Dict[str, Any]:
+        return rec_config.get("inference.batch.micro_batching", {}) or {}
+
+    def enabled(self) -> bool:
+        return bool(self.config().get("enabled", False))
+
+    @property
+    def max_wait_ms(self) -> float:
+        return self._max_wait_ms if self._max_wait_ms is not None else self.config().get("max_wait_ms", 2.0)
+
+    @property
+    def max_rows(self) -> int:
+        return self._max_rows if self._max_rows is not None else self.config().get("max_rows", 4096)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["avg_requests_per_batch"] = stats["requests"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    # ============ 调用方 ============
+
+    def submit(self, model, X: np.ndarray, direct: Optional[Callable[..., Future]] = None) -> Future:
+        """提交打分请求，返回 Future（结果为正类概率数组）
+
+        Args:
+            direct: 空闲时直接打分的执行方式（如截止时间工作线程池），默认在当前线程执行
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        with self._lock:
+            idle = self._in_flight == 0
+            self._in_flight += 1
+        if idle and self.config().get("bypass_when_idle", True):
+            future = direct(model.score_batch, X) if direct is not None else self._score_inline(model, X)
+            with self._lock:
+                self._stats["bypassed"] += 1
+        else:
+            self._ensure_worker()
+            future = Future()
+            self._queue.put((model, X, future))
+        future.add_done_callback(self._on_done)
+        return future
+
+    @staticmethod
+    def _score_inline(model, X: np.ndarray) -> Future:
+        future: Future = Future()
+        try:
+            future.set_result(model.score_batch(X))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _on_done(self, future: Future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def score(self, model, X: np.ndarray) -> np.ndarray:
+        """提交并等待结果"""
+        return self.submit(model, X).result()
+
+    def close(self, timeout: float = 5.0):
+        """处理完已排队的请求后停止后台线程（调用方不再提交请求时使用，之后提交会重新启动线程）"""
+        with self._lock:
+            worker, self._worker = self._worker, None
+        if worker is not None and worker.is_alive():
+            self._queue.put(_STOP)
+            worker.join(timeout)
+
+    # ============ 后台线程 ============
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            rows = len(item[1])
+            deadline = time.perf_counter() + self.max_wait_ms / 1000
+            while rows < self.max_rows:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                rows += len(item[1])
+            self._execute(batch)
+
+    def _execute(self, batch: List[Tuple[Any, np.ndarray, Future]]):
+        """按模型实例分组（热切换期间新旧模型的请求不能混合），每组一次批量预测"""
+        groups: Dict[int, List[Tuple[Any, np.ndarray, Future]]] = {}
+        for item in batch:
+            groups.setdefault(id(item[0]), []).append(item)
+
+        for items in groups.values():
+            model = items[0][0]
+            try:
+                scores = model.score_batch(np.vstack([X for _, X, _ in items]))
+                offset = 0
+                for _, X, future in items:
+                    future.set_result(scores[offset:offset + len(X)])
+                    offset += len(X)
+            except Exception as e:
+                logger.error(f"微批打分失败: {e}")
+                for _, _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+
+        with self._lock:
+            self._stats["requests"] += len(batch)
+            self._stats["rows"] += sum(len(X) for _, X, _ in batch)
+            self._stats["batches"] += 1
+            self._stats["model_calls"] += len(groups)
+
+
+micro_batcher = MicroBatcher()
+
+
+def benchmark_throughput(
+    model,
+    n_activities: int = 50,
+    concurrency_levels: List[int] = (1, 4, 16, 64),
+    requests_per_worker: int = 20,
+    max_wait_ms: float = 2.0,
+    max_rows: int = 4096
+) -> List[Dict[str, Any]]:
+    """对比不同并发数下直接打分与微批打分的吞吐（请求/秒）"""
+    rng = np.random.default_rng(0)
+    activities = np.column_stack([
+        rng.integers(1, 100, n_activities),
+        rng.integers(0, 3, n_activities),
+        rng.integers(0, 3, n_activities),
+    ])
+
+    def make_request() -> np.ndarray:
+        user = rng.random(6)
+        return np.hstack([np.broadcast_to(user, (n_activities, 6)), activities])
+
+    results = []
+    for concurrency in concurrency_levels:
+        requests = [make_request() for _ in range(concurrency * requests_per_worker)]
+        row = {"concurrency": concurrency, "requests": len(requests), "rows_per_request": n_activities}
+        for mode in ("direct", "micro_batch"):
+            batcher = MicroBatcher(max_wait_ms=max_wait_ms, max_rows=max_rows) if mode == "micro_batch" else None
+            score = model.score_batch if batcher is None else (lambda X, b=batcher: b.score(model, X))
+            latencies = []
+
+            def worker(chunk):
+                for X in chunk:
+                    started = time.perf_counter()
+                    score(X)
+                    latencies.append(time.perf_counter() - started)
+
+            chunks = [requests[i::concurrency] for i in range(concurrency)]
+            started = time.perf_counter()
+            try:
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    list(pool.map(worker, chunks))
+            finally:
+                if batcher is not None:
+                    batcher.close()
+            elapsed = time.perf_counter() - started
+            row[mode] = {
+                "requests_per_sec": len(requests) / elapsed,
+                "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+                "latency_p99_ms": float(np.percentile(latencies, 99) * 1000),
+            }
+            if mode == "micro_batch":
+                row[mode]["avg_requests_per_batch"] = batcher.get_stats()["avg_requests_per_batch"]
+        row["speedup"] = row["micro_batch"]["requests_per_sec"] / row["direct"]["requests_per_sec"]
+        results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="微批打分吞吐对比")
+    parser.add_argument("--model", default="./best_rf_model.pkl")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--activities", type=int, default=50, help="每个请求的活动数")
+    parser.add_argument("--requests", type=int, default=20, help="每个并发线程的请求数")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    from app.ml.predict import RecommenderModel
+
+    model = RecommenderModel(model_path=args.model)
+    rows = benchmark_throughput(
+        model,
+        n_activities=args.activities,
+        concurrency_levels=args.concurrency,
+        requests_per_worker=args.requests,
+        max_wait_ms=args.max_wait_ms
+    )
+    print(f"{'并发':>6} {'直接 req/s':>12} {'微批 req/s':>12} {'加速':>6} {'直接p99ms':>10} {'微批p99ms':>10} {'批大小':>6}")
+    for r in rows:
+        print(
+            f"{r['concurrency']:>6} {r['direct']['requests_per_sec']:>12.1f} "
+            f"{r['micro_batch']['requests_per_sec']:>12.1f} {r['speedup']:>6.2f} "
+            f"{r['direct']['latency_p99_ms']:>10.2f} {r['micro_batch']['latency_p99_ms']:>10.2f} "
+            f"{r['micro_batch']['avg_requests_per_batch']:>6.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
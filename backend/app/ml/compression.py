@@ -0,0 +1,316 @@
+"""
+随机森林压缩
+文件名：app/ml/compression.py
+
+把线上随机森林压缩为推理更便宜的模型，两种方式：
+- prune：贪心挑选树的子集，使子森林的输出概率尽量接近原森林
+- distill：在合成的（用户因子 × 活动）样本上，以原森林输出概率为软标签训练限深的小森林
+
+两种方式产出的都是 sklearn 分类器，特征维度与原模型一致，可直接发布到模型注册中心，
+SHAP TreeExplainer 同样适用。压缩后在独立抽取的合成样本上报告概率MAE、
+每个用户的 Top-K 推荐重合度以及推理加速比。
+
+用法：
+    python -m app.ml.compression --method prune --max-trees 30
+    python -m app.ml.compression --method distill --publish
+"""
+
+import argparse
+import copy
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from app.config_loader import rec_config
+from app.ml.benchmark import benchmark_estimator
+from app.ml.features import (
+    ACTIVITY_TYPE_CODES, INCENTIVE_TYPE_CODES, USER_FEATURES, activity_feature_vector
+)
+from app.utils.logger import logger
+
+
+# 没有活动目录时使用的合成活动金额档位
+SYNTHETIC_AMOUNTS = [1, 5, 10, 20, 50, 100, 200]
+
+
+def synthetic_activity_matrix() -> np.ndarray:
+    """金额档位 × 激励类型 × 活动类型 的合成活动特征矩阵"""
+    return np.array([
+        [amount, incentive_code, activity_code]
+        for amount in SYNTHETIC_AMOUNTS
+        for incentive_code in INCENTIVE_TYPE_CODES.values()
+        for activity_code in ACTIVITY_TYPE_CODES.values()
+    ], dtype=float)
+
+
+def synthetic_samples(activity_matrix: np.ndarray, n_users: int, rng: np.random.Generator) -> np.ndarray:
+    """随机用户因子与全部活动做笛卡尔积，返回原始特征矩阵 (n_users * n_activities, 9)
+
+    行按用户分组排列，同一用户的活动连续，便于按用户计算 Top-K 重合度。
+    """
+    users = rng.random((n_users, len(USER_FEATURES)))
+    n_activities = len(activity_matrix)
+    return np.hstack([
+        np.repeat(users, n_activities, axis=0),
+        np.tile(activity_matrix, (n_users, 1)),
+    ])
+
+
+def _positive_proba(estimator, X: np.ndarray) -> np.ndarray:
+    return estimator.predict_proba(X)[:, 1]
+
+
+def prune_forest(
+    forest: RandomForestClassifier,
+    X: np.ndarray,
+    max_trees: int = 30,
+    mae_tolerance: float = 0.005
+) -> RandomForestClassifier:
+    """贪心选择树子集
+
+    每一步加入使子森林平均概率与原森林概率的MAE最小的树，
+    达到 mae_tolerance 或 max_trees 时停止。
+    """
+    tree_proba = np.stack([tree.predict_proba(X)[:, 1] for tree in forest.estimators_])
+    target = tree_proba.mean(axis=0)
+
+    selected: List[int] = []
+    remaining = np.arange(len(tree_proba))
+    running_sum = np.zeros_like(target)
+    for k in range(1, min(max_trees, len(tree_proba)) + 1):
+        errors = np.abs((running_sum + tree_proba[remaining]) / k - target).mean(axis=1)
+        best = int(np.argmin(errors))
+        selected.append(int(remaining[best]))
+        running_sum += tree_proba[remaining[best]]
+        remaining = np.delete(remaining, best)
+        if errors[best] <= mae_tolerance:
+            break
+
+    pruned = copy.deepcopy(forest)
+    pruned.estimators_ = [forest.estimators_[i] for i in selected]
+    pruned.n_estimators = len(selected)
+    return pruned
+
+
+def distill_forest(
+    teacher,
+    X: np.ndarray,
+    n_estimators: int = 10,
+    max_depth: int = 6,
+    random_state: int = 42
+) -> RandomForestClassifier:
+    """以教师模型的输出概率为软标签训练限深学生森林
+
+    每个样本复制为正负两条，权重分别为 p 与 1-p，
+    叶子节点的加权类别比例即逼近教师概率。
+    """
+    proba = _positive_proba(teacher, X)
+    n = len(X)
+    student = RandomForestClassifier(
+        n_estimators=n_estimators,
+        max_depth=max_depth,
+        max_features=None,
+        random_state=random_state
+    )
+    student.fit(
+        np.vstack([X, X]),
+        np.concatenate([np.zeros(n, dtype=int), np.ones(n, dtype=int)]),
+        sample_weight=np.concatenate([1 - proba, proba])
+    )
+    return student
+
+
+def fidelity_report(
+    teacher,
+    student,
+    X: np.ndarray,
+    n_activities: int,
+    top_k: int = 10
+) -> Dict[str, Any]:
+    """压缩模型相对原模型的保真度与加速比
+
+    Args:
+        X: 按用户分组排列的模型输入（每个用户 n_activities 行）
+        top_k: 计算推荐重合度的K
+    """
+    p_teacher = _positive_proba(teacher, X)
+    p_student = _positive_proba(student, X)
+    errors = np.abs(p_teacher - p_student)
+
+    # 每个用户在活动集合内的 Top-K 重合度（稳定排序，平分时按活动顺序）
+    k = min(top_k, n_activities)
+    teacher_rank = np.argsort(-p_teacher.reshape(-1, n_activities), axis=1, kind='stable')[:, :k]
+    student_rank = np.argsort(-p_student.reshape(-1, n_activities), axis=1, kind='stable')[:, :k]
+    overlap = [len(np.intersect1d(t, s)) / k for t, s in zip(teacher_rank, student_rank)]
+
+    teacher_bench = benchmark_estimator(teacher, X)
+    student_bench = benchmark_estimator(student, X)
+
+    def ratio(a: Optional[float], b: Optional[float]) -> Optional[float]:
+        return float(a / b) if a and b else None
+
+    return {
+        "samples": int(len(X)),
+        "probability_mae": float(errors.mean()),
+        "probability_max_error": float(errors.max()),
+        "top_k": k,
+        "top_k_overlap": float(np.mean(overlap)),
+        "teacher_trees": len(getattr(teacher, "estimators_", [])),
+        "student_trees": len(getattr(student, "estimators_", [])),
+        "teacher_benchmark": teacher_bench,
+        "student_benchmark": student_bench,
+        "speedup_p50": ratio(teacher_bench["latency_p50_ms"], student_bench["latency_p50_ms"]),
+        "speedup_p99": ratio(teacher_bench["latency_p99_ms"], student_bench["latency_p99_ms"]),
+        "speedup_batch": ratio(student_bench["batch_rows_per_sec"], teacher_bench["batch_rows_per_sec"]),
+    }
+
+
+def compress_model(
+    model,
+    method: str = "prune",
+    activity_matrix: np.ndarray = None,
+    cfg: Dict[str, Any] = None
+) -> Dict[str, Any]:
+    """压缩线上模型
+
+    Args:
+        model: RecommenderModel 实例（用其特征对齐逻辑生成模型输入）
+        method: prune 或 distill
+        activity_matrix: 活动特征矩阵，默认使用合成活动
+        cfg: 覆盖 training.compression 的配置
+
+    Returns:
+        {"model": 压缩后的估计器, "report": 保真度报告}
+    """
+    cfg = {**(rec_config.get("training.compression", {}) or {}), **(cfg or {})}
+    if model.model is None or not hasattr(model.model, "estimators_"):
+        raise ValueError("模型不是已训练的随机森林，无法压缩")
+
+    rng = np.random.default_rng(cfg.get("random_state", 42))
+    activity_matrix = synthetic_activity_matrix() if activity_matrix is None else activity_matrix
+    n_activities = len(activity_matrix)
+
+    # 拟合样本与评估样本分别抽取，报告反映压缩模型在新用户上的表现
+    X_fit = model.transform_features(synthetic_samples(activity_matrix, cfg.get("fit_users", 500), rng))
+    X_eval = model.transform_features(synthetic_samples(activity_matrix, cfg.get("eval_users", 200), rng))
+
+    if method == "prune":
+        compressed = prune_forest(
+            model.model, X_fit,
+            max_trees=cfg.get("max_trees", 30),
+            mae_tolerance=cfg.get("mae_tolerance", 0.005)
+        )
+    elif method == "distill":
+        compressed = distill_forest(
+            model.model, X_fit,
+            n_estimators=cfg.get("student_trees", 10),
+            max_depth=cfg.get("student_max_depth", 6),
+            random_state=cfg.get("random_state", 42)
+        )
+    else:
+        raise ValueError(f"未知的压缩方式: {method}")
+
+    report = fidelity_report(model.model, compressed, X_eval, n_activities, top_k=cfg.get("top_k", 10))
+    report.update({"method": method, "source_version": model.version})
+    logger.info(
+        f"模型压缩完成({method}): {report['teacher_trees']} → {report['student_trees']} 棵树, "
+        f"概率MAE {report['probability_mae']:.4f}, Top-{report['top_k']} 重合度 {report['top_k_overlap']:.3f}, "
+        f"p99 加速 {report['speedup_p99'] or 0:.1f}x"
+    )
+    return {"model": compressed, "report": report}
+
+
+def publish_compressed(registry, source, result: Dict[str, Any], model_path: str) -> Dict[str, Any]:
+    """把压缩模型发布到注册中心（不激活）
+
+    压缩模型的输入与原模型相同（经原模型的特征对齐），因此随同复制原模型加载的
+    scaler / factor_analyzer 文件，激活后的预处理与原模型一致。
+    """
+    files = {"model": model_path}
+    for role in ("scaler", "factor_analyzer"):
+        if role in source.artifact_paths:
+            files[role] = source.artifact_paths[role]
+    report = result["report"]
+    return registry.publish(
+        files=files,
+        metrics={
+            "probability_mae": report["probability_mae"],
+            "top_k_overlap": report["top_k_overlap"],
+        },
+        metadata={
+            "model_type": type(result["model"]).__name__,
+            "source": f"compression:{report['method']}",
+            "source_version": source.version,
+            "feature_names": source.input_feature_names(),
+            "benchmark": report["student_benchmark"],
+            "compression": report,
+        }
+    )
+
+
+def _load_catalog_matrix() -> Optional[np.ndarray]:
+    """读取数据库中进行中活动的特征矩阵，不可用时返回None"""
+    try:
+        from app.database import SessionLocal
+        from app.models import Activity
+
+        db = SessionLocal()
+        try:
+            activities = db.query(Activity).filter(Activity.status == "active").all()
+            if not activities:
+                return None
+            return np.array([
+                activity_feature_vector(a.incentive_amount, a.incentive_type, a.type)
+                for a in activities
+            ])
+        finally:
+            db.close()
+    except Exception as e:
+        logger.warning(f"读取活动目录失败，使用合成活动: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="随机森林压缩（剪枝/蒸馏）")
+    parser.add_argument("--model", default="./best_rf_model.pkl", help="原模型文件")
+    parser.add_argument("--method", choices=["prune", "distill"], default="prune")
+    parser.add_argument("--max-trees", type=int, help="剪枝保留的最大树数")
+    parser.add_argument("--student-trees", type=int, help="蒸馏学生模型的树数")
+    parser.add_argument("--student-max-depth", type=int, help="蒸馏学生模型的最大深度")
+    parser.add_argument("--use-catalog", action="store_true", help="使用数据库中的进行中活动代替合成活动")
+    parser.add_argument("--output", help="压缩模型输出路径，默认 data/models/<method>_model.pkl")
+    parser.add_argument("--publish", action="store_true", help="发布到模型注册中心（不激活）")
+    args = parser.parse_args()
+
+    from app.ml.predict import RecommenderModel, get_registry
+
+    overrides = {
+        key: value for key, value in {
+            "max_trees": args.max_trees,
+            "student_trees": args.student_trees,
+            "student_max_depth": args.student_max_depth,
+        }.items() if value is not None
+    }
+    source = RecommenderModel(model_path=args.model)
+    activity_matrix = _load_catalog_matrix() if args.use_catalog else None
+    result = compress_model(source, args.method, activity_matrix=activity_matrix, cfg=overrides)
+
+    output = args.output or os.path.join("data", "models", f"{args.method}_model.pkl")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    joblib.dump(result["model"], output)
+    with open(os.path.splitext(output)[0] + "_report.json", "w", encoding="utf-8") as f:
+        json.dump(result["report"], f, ensure_ascii=False, indent=2)
+
+    if args.publish:
+        manifest = publish_compressed(get_registry(), source, result, output)
+        print(f"已发布版本 {manifest['version']}")
+
+    print(json.dumps(result["report"], ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
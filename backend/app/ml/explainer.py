@@ -4,10 +4,83 @@ SHAP可解释性模块
 """
 
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Dict, Tuple
 import shap
 
 
+# 进程池工作进程内的解释器（每个进程只构建一次）
+_worker_explainer = None
+
+
+def _init_shap_worker(model):
+    """进程池初始化：在工作进程中构建TreeExplainer"""
+    global _worker_explainer
+    _worker_explainer = shap.TreeExplainer(model)
+
+
+def _positive_class_shap(shap_values) -> np.ndarray:
+    """取正类（接受推荐）的SHAP值矩阵"""
+    if isinstance(shap_values, list):
+        return shap_values[1]
+    shap_values = np.asarray(shap_values)
+    if shap_values.ndim == 3:
+        return shap_values[:, :, 1]
+    return shap_values
+
+
+def _shap_chunk_abs_sum(X_chunk: np.ndarray) -> Tuple[np.ndarray, int]:
+    """计算一个分块的 |SHAP| 按特征求和，返回 (求和向量, 样本数)"""
+    values = _positive_class_shap(_worker_explainer.shap_values(X_chunk))
+    return np.abs(values).sum(axis=0), len(X_chunk)
+
+
+def compute_mean_abs_shap(
+    model,
+    X: np.ndarray,
+    chunk_size: int = 200,
+    n_workers: int = 4,
+    progress_callback=None
+) -> np.ndarray:
+    """分块并行计算平均绝对SHAP值
+    
+    Args:
+        model: 训练好的树模型
+        X: 已对齐到模型输入维度的特征矩阵
+        chunk_size: 每个分块的样本数
+        n_workers: 工作进程数，<=1 时在当前进程内串行计算
+        progress_callback: 进度回调，参数为 (已完成分块数, 总分块数)
+        
+    Returns:
+        每个特征的平均 |SHAP| 值
+    """
+    chunks = [X[i:i + chunk_size] for i in range(0, len(X), chunk_size)]
+    total = np.zeros(X.shape[1])
+    count = 0
+    
+    if n_workers <= 1 or len(chunks) <= 1:
+        _init_shap_worker(model)
+        results = map(_shap_chunk_abs_sum, chunks)
+        for done, (abs_sum, n) in enumerate(results, start=1):
+            total += abs_sum
+            count += n
+            if progress_callback:
+                progress_callback(done, len(chunks))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            initializer=_init_shap_worker,
+            initargs=(model,)
+        ) as pool:
+            for done, (abs_sum, n) in enumerate(pool.map(_shap_chunk_abs_sum, chunks), start=1):
+                total += abs_sum
+                count += n
+                if progress_callback:
+                    progress_callback(done, len(chunks))
+    
+    return total / max(count, 1)
+
+
 class SHAPExplainer:
     """SHAP可解释性分析类"""
     
@@ -174,16 +247,26 @@ class SHAPExplainer:
         shap_values = self.explainer.shap_values(X)
         
         # 计算平均绝对SHAP值
-        if isinstance(shap_values, list):
-            mean_shap = np.abs(shap_values[1]).mean(axis=0)
-        else:
-            mean_shap = np.abs(shap_values).mean(axis=0)
-        
+        mean_shap = np.abs(_positive_class_shap(shap_values)).mean(axis=0)
+        return self.format_global_importance(mean_shap)
+    
+    def format_global_importance(self, mean_shap: np.ndarray, feature_names: List[str] = None) -> Dict:
+        """将平均绝对SHAP值格式化为按重要性排序的特征列表
+
+        Args:
+            feature_names: 模型输入各列的名称；未提供或数量不符时，仅在列数与原始特征相同时使用原始特征名，
+                否则使用中性名称 feature_i（降维后的列不对应任何原始特征）
+        """
         # 排序
         sorted_indices = np.argsort(mean_shap)[::-1]
         
         feature_count = len(mean_shap)
-        names = self.feature_names[:feature_count]
+        if feature_names is not None and len(feature_names) == feature_count:
+            names = list(feature_names)
+        elif feature_count == len(self.feature_names):
+            names = self.feature_names
+        else:
+            names = [f"feature_{i}" for i in range(feature_count)]
         return {
             "features": [
                 {
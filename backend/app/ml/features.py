@@ -0,0 +1,107 @@
+"""
+特征工程
+文件名：app/ml/features.py
+
+训练与线上推理共用的特征顺序与类别编码，保证两侧特征一致。
+"""
+
+from functools import lru_cache
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+
+# 模型特征顺序（前6个为用户因子，后3个为活动特征）
+USER_FEATURES = [
+    "factor_social", "factor_psych", "factor_incent",
+    "factor_tech", "factor_env", "factor_personal",
+]
+ACTIVITY_FEATURES = [
+    "incentive_amount", "incentive_type_encoded", "activity_type_encoded",
+]
+FEATURE_NAMES = USER_FEATURES + ACTIVITY_FEATURES
+
+# 类别编码（未知类别编码为0）
+INCENTIVE_TYPE_CODES = {"red_packet": 0, "points": 1, "coupon": 2}
+ACTIVITY_TYPE_CODES = {"invite": 0, "quiz": 1, "share": 2}
+
+DEFAULT_FACTOR = 0.5
+
+# 类型位掩码：低8位为活动类型，高8位为激励类型，未知类型使用各自的 other 位
+ACTIVITY_TYPE_BITS = {"invite": 1 << 0, "quiz": 1 << 1, "share": 1 << 2}
+INCENTIVE_TYPE_BITS = {"red_packet": 1 << 8, "points": 1 << 9, "coupon": 1 << 10}
+OTHER_ACTIVITY_TYPE_BIT = 1 << 7
+OTHER_INCENTIVE_TYPE_BIT = 1 << 15
+ALL_ACTIVITY_TYPES = 0x00FF
+ALL_INCENTIVE_TYPES = 0xFF00
+
+
+def encode_incentive_type(incentive_type: Optional[str]) -> int:
+    """编码激励类型"""
+    return INCENTIVE_TYPE_CODES.get(incentive_type, 0)
+
+
+def encode_activity_type(activity_type: Optional[str]) -> int:
+    """编码活动类型"""
+    return ACTIVITY_TYPE_CODES.get(activity_type, 0)
+
+
+def user_factor_vector(factors: Iterable[Optional[float]]) -> np.ndarray:
+    """用户因子向量，缺失值按默认值0.5处理（与画像读取时的 `or 0.5` 语义一致）"""
+    return np.array([float(v or DEFAULT_FACTOR) for v in factors])
+
+
+def activity_feature_vector(
+    incentive_amount,
+    incentive_type: Optional[str],
+    activity_type: Optional[str]
+) -> np.ndarray:
+    """活动特征向量"""
+    return np.array([
+        float(incentive_amount or 0),
+        encode_incentive_type(incentive_type),
+        encode_activity_type(activity_type),
+    ], dtype=float)
+
+
+def combine_features(user_vector: np.ndarray, activity_matrix: np.ndarray) -> np.ndarray:
+    """将一个用户的因子向量与多个活动的特征拼接为模型输入 (n_activities, 9)"""
+    activity_matrix = np.atleast_2d(activity_matrix)
+    user_block = np.broadcast_to(user_vector, (len(activity_matrix), len(user_vector)))
+    return np.hstack([user_block, activity_matrix])
+
+
+def features_to_vector(features: Dict[str, float]) -> np.ndarray:
+    """特征字典转为 (1, 9) 向量"""
+    return np.array([[features.get(f, 0) for f in FEATURE_NAMES]])
+
+
+def activity_type_bits(activity_type: Optional[str], incentive_type: Optional[str]) -> int:
+    """活动的类型位：活动类型位 | 激励类型位"""
+    return (
+        ACTIVITY_TYPE_BITS.get(activity_type, OTHER_ACTIVITY_TYPE_BIT)
+        | INCENTIVE_TYPE_BITS.get(incentive_type, OTHER_INCENTIVE_TYPE_BIT)
+    )
+
+
+@lru_cache(maxsize=1024)
+def preference_mask(activity_types: Optional[str], incentive_types: Optional[str]) -> int:
+    """用户偏好（逗号分隔的类型字符串）编译为位掩码；某一维未设置偏好时该维不限制"""
+    def bits(preference: Optional[str], table: Dict[str, int], other: int, all_bits: int) -> int:
+        names = [t.strip() for t in (preference or "").split(",") if t.strip()]
+        if not names:
+            return all_bits
+        mask = 0
+        for name in names:
+            mask |= table.get(name, other)
+        return mask
+
+    return (
+        bits(activity_types, ACTIVITY_TYPE_BITS, OTHER_ACTIVITY_TYPE_BIT, ALL_ACTIVITY_TYPES)
+        | bits(incentive_types, INCENTIVE_TYPE_BITS, OTHER_INCENTIVE_TYPE_BIT, ALL_INCENTIVE_TYPES)
+    )
+
+
+def matches_preference(type_bits: np.ndarray, mask: int) -> np.ndarray:
+    """活动类型与激励类型都在偏好内的活动（一次按位与）"""
+    return (type_bits & mask) == type_bits
@@ -0,0 +1,141 @@
+"""
+分数查找表
+文件名：app/ml/lookup.py
+
+模型输入只有6个取值在 [0, 1] 的用户因子和3个取值有限的活动特征。
+对每个不同的活动特征组合，在按 step 量化的用户因子网格上预先计算接受概率，
+线上对6维网格做多线性插值（每次查询读取 2^6 个网格点），不再遍历决策树。
+表以 .npy 文件保存，线上以只读内存映射方式打开。
+"""
+
+import itertools
+import os
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from app.ml.features import USER_FEATURES
+
+
+N_DIMS = len(USER_FEATURES)
+# 多线性插值的 2^6 个角点偏移
+_CORNER_OFFSETS = np.array(list(itertools.product((0, 1), repeat=N_DIMS)), dtype=np.int64)
+
+
+def grid_points(step: float) -> int:
+    """每个维度的网格点数"""
+    return int(round(1.0 / step)) + 1
+
+
+class ScoreLookupTable:
+    """量化用户因子网格上的分数表"""
+
+    def __init__(self, table: np.ndarray, feature_tuples: np.ndarray, step: float):
+        self.table = table  # (n_tuples, G**6)，float32
+        self.feature_tuples = feature_tuples
+        self.step = step
+        self.points = grid_points(step)
+        self._shape = (self.points,) * N_DIMS
+
+    @classmethod
+    def build(
+        cls,
+        score_fn: Callable[[np.ndarray], np.ndarray],
+        feature_tuples: np.ndarray,
+        step: float,
+        path: str,
+        chunk_rows: int = 200_000,
+        progress_callback: Optional[Callable[[float], None]] = None
+    ) -> "ScoreLookupTable":
+        """在网格上批量打分并写入 .npy 文件
+
+        Args:
+            score_fn: 输入原始特征矩阵 (n, 9)，返回正类概率 (n,)
+            feature_tuples: 不同的活动特征组合 (n_tuples, 3)
+            step: 用户因子量化步长
+            path: 输出文件路径（先写临时文件再原子替换）
+        """
+        points = grid_points(step)
+        cells = points ** N_DIMS
+        shape = (points,) * N_DIMS
+        axis = np.linspace(0.0, 1.0, points)
+
+        tmp_path = f"{path}.tmp.npy"
+        table = np.lib.format.open_memmap(
+            tmp_path, mode='w+', dtype=np.float32, shape=(len(feature_tuples), cells)
+        )
+        total = len(feature_tuples) * cells
+        done = 0
+        for row, activity in enumerate(feature_tuples):
+            for start in range(0, cells, chunk_rows):
+                flat = np.arange(start, min(start + chunk_rows, cells))
+                user_block = axis[np.column_stack(np.unravel_index(flat, shape))]
+                X = np.hstack([user_block, np.broadcast_to(activity, (len(flat), len(activity)))])
+                table[row, start:start + len(flat)] = score_fn(X)
+                done += len(flat)
+                if progress_callback:
+                    progress_callback(done / total)
+        table.flush()
+        del table
+        os.replace(tmp_path, path)
+        return cls.load(path, feature_tuples, step)
+
+    @classmethod
+    def load(cls, path: str, feature_tuples: np.ndarray, step: float) -> "ScoreLookupTable":
+        """以只读内存映射方式打开分数表"""
+        return cls(np.load(path, mmap_mode='r'), np.asarray(feature_tuples), step)
+
+    def score(self, user_vector: np.ndarray, tuple_rows: np.ndarray) -> np.ndarray:
+        """对一个用户、多个活动特征组合做多线性插值
+
+        Args:
+            user_vector: 6个用户因子
+            tuple_rows: 每个活动对应的特征组合下标 (n_activities,)
+        """
+        u = np.clip(np.asarray(user_vector, dtype=float)[:N_DIMS], 0.0, 1.0) / self.step
+        low = np.minimum(np.floor(u).astype(np.int64), self.points - 2)
+        frac = u - low
+
+        corners = low + _CORNER_OFFSETS  # (64, 6)
+        weights = np.prod(np.where(_CORNER_OFFSETS == 1, frac, 1.0 - frac), axis=1)  # (64,)
+        flat_index = np.ravel_multi_index(corners.T, self._shape)
+
+        # 同一组合只读取一次角点
+        unique_rows, inverse = np.unique(tuple_rows, return_inverse=True)
+        values = self.table[unique_rows[:, None], flat_index[None, :]]  # (n_unique, 64)
+        return (values @ weights)[inverse.reshape(-1)]
+
+
+def error_report(
+    table: ScoreLookupTable,
+    score_fn: Callable[[np.ndarray], np.ndarray],
+    n_users: int = 200,
+    top_k: int = 10,
+    random_state: int = 42
+) -> Dict[str, Any]:
+    """随机用户 × 全部活动特征组合上，查找表相对精确模型的误差"""
+    rng = np.random.default_rng(random_state)
+    users = rng.random((n_users, N_DIMS))
+    n_tuples = len(table.feature_tuples)
+    rows = np.arange(n_tuples)
+
+    exact = score_fn(np.hstack([
+        np.repeat(users, n_tuples, axis=0),
+        np.tile(table.feature_tuples, (n_users, 1)),
+    ])).reshape(n_users, n_tuples)
+    approx = np.vstack([table.score(user, rows) for user in users])
+    errors = np.abs(exact - approx)
+
+    k = min(top_k, n_tuples)
+    exact_top = np.argsort(-exact, axis=1, kind='stable')[:, :k]
+    approx_top = np.argsort(-approx, axis=1, kind='stable')[:, :k]
+    overlap = [len(np.intersect1d(e, a)) / k for e, a in zip(exact_top, approx_top)]
+
+    return {
+        "samples": int(errors.size),
+        "mae": float(errors.mean()),
+        "p99_abs_error": float(np.percentile(errors, 99)),
+        "max_abs_error": float(errors.max()),
+        "top_k": k,
+        "top_k_overlap": float(np.mean(overlap)),
+    }
@@ -8,42 +8,69 @@ import numpy as np
 import pandas as pd
 from typing import List, Dict, Optional
 import os
+import threading
 
+from app.config import settings
 from app.utils.logger import logger
 
 
 class RecommenderModel:
     """推荐预测模型类"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        model_path: str = "./best_rf_model.pkl",
+        scaler_path: str = "./scaler.pkl",
+        fa_path: str = "./factor_analyzer.pkl",
+        version: str = None,
+        manifest: Dict = None
+    ):
         self.model = None
         self.scaler = None
         self.factor_analyzer = None
+        self.explainer = None
+        self._benchmark = None
+        self.version = version or "default"
+        self.manifest = manifest or {}
+        # 实际加载的文件 {角色: 路径}（压缩模型发布时随同复制预处理文件）
+        self.artifact_paths: Dict[str, str] = {}
         self.feature_names = [
             "factor_social", "factor_psych", "factor_incent", 
             "factor_tech", "factor_env", "factor_personal",
             "incentive_amount", "incentive_type_encoded", "activity_type_encoded"
         ]
-        self._load_model()
+        self._load_model(model_path, scaler_path, fa_path)
     
-    def _load_model(self):
+    @classmethod
+    def from_registry(cls, registry, version: str) -> "RecommenderModel":
+        """从模型注册中心加载指定版本（校验文件校验和）"""
+        paths = registry.resolve_files(version)
+        return cls(
+            model_path=paths.get("model"),
+            scaler_path=paths.get("scaler"),
+            fa_path=paths.get("factor_analyzer"),
+            version=version,
+            manifest=registry.get_manifest(version)
+        )
+    
+    def _load_model(self, rf_model_path: str, scaler_path: str, fa_path: str):
         """加载模型"""
-        # 优先加载预训练的随机森林模型
-        rf_model_path = "./best_rf_model.pkl"
-        scaler_path = "./scaler.pkl"
-        fa_path = "./factor_analyzer.pkl"
-        
         try:
-            if os.path.exists(rf_model_path):
+            if rf_model_path and os.path.exists(rf_model_path):
                 self.model = joblib.load(rf_model_path)
-                logger.info(f"成功加载预训练模型: {rf_model_path}")
+                self.artifact_paths["model"] = rf_model_path
+                if self.version == "default":
+                    self.version = f"rf-{self._file_digest(rf_model_path)}"
+                logger.info(f"成功加载预训练模型: {rf_model_path} (版本 {self.version})")
             
-            if os.path.exists(scaler_path):
+            if scaler_path and os.path.exists(scaler_path):
                 self.scaler = joblib.load(scaler_path)
+                self.artifact_paths["scaler"] = scaler_path
                 logger.info(f"成功加载标准化器: {scaler_path}")
             
-            if os.path.exists(fa_path):
+            if fa_path and os.path.exists(fa_path):
                 self.factor_analyzer = joblib.load(fa_path)
+                self.artifact_paths["factor_analyzer"] = fa_path
                 logger.info(f"成功加载因子分析器: {fa_path}")
         except Exception as e:
             logger.warning(f"加载预训练模型失败: {e}")
@@ -53,6 +80,12 @@ class RecommenderModel:
             self.model = self._create_default_model()
             logger.info("使用默认模型")
     
+    @staticmethod
+    def _file_digest(path: str, length: int = 12) -> str:
+        """计算模型文件摘要，作为模型版本号"""
+        from app.ml.registry import file_sha256
+        return file_sha256(path)[:length]
+    
     def _create_default_model(self):
         """创建默认模型（用于冷启动）"""
         from sklearn.ensemble import RandomForestClassifier
@@ -63,6 +96,32 @@ class RecommenderModel:
             n_jobs=-1
         )
     
+    def warm_up(self):
+        """构建SHAP解释器并预热推理路径（在切换为线上模型之前调用）"""
+        from app.ml.explainer import SHAPExplainer
+        
+        if self.model is not None and hasattr(self.model, 'classes_'):
+            explainer = SHAPExplainer()
+            try:
+                explainer.fit(self.model)
+                self.explainer = explainer
+            except Exception as e:
+                logger.warning(f"SHAP解释器初始化失败: {e}")
+        
+        # 用默认画像跑一遍单条与批量预测，触发惰性初始化
+        sample = np.full((1, len(self.feature_names)), 0.5)
+        self.predict_proba_single(sample)
+        self.predict_proba(np.repeat(sample, 32, axis=0))
+        if self.explainer is not None:
+            self.explainer.explain_prediction(self.transform_features(sample), self.feature_names)
+        return self
+    
+    def get_explainer(self):
+        """获取与当前模型绑定的SHAP解释器（按需构建）"""
+        if self.explainer is None:
+            self.warm_up()
+        return self.explainer
+    
     def predict_proba(self, X: np.ndarray) -> np.ndarray:
         """预测概率"""
         if self.model is None:
@@ -101,10 +160,10 @@ class RecommenderModel:
                     pass
             # 手动降维：将6个用户因子分组平均
             if actual >= 6:
-                f1 = (X[0, 0] + X[0, 1]) / 2  # 社会+心理
-                f2 = (X[0, 2] + X[0, 3]) / 2  # 激励+技术
-                f3 = (X[0, 4] + X[0, 5]) / 2  # 环境+个人
-                return np.array([[f1, f2, f3]])
+                f1 = (X[:, 0] + X[:, 1]) / 2  # 社会+心理
+                f2 = (X[:, 2] + X[:, 3]) / 2  # 激励+技术
+                f3 = (X[:, 4] + X[:, 5]) / 2  # 环境+个人
+                return np.column_stack([f1, f2, f3])
         
         # 截断或补零
         if actual > expected:
@@ -113,6 +172,10 @@ class RecommenderModel:
             pad = np.zeros((X.shape[0], expected - actual))
             return np.concatenate([X, pad], axis=1)
     
+    def transform_features(self, X: np.ndarray) -> np.ndarray:
+        """将原始特征矩阵对齐为模型输入（用于SHAP等需要模型原始输入的场景）"""
+        return self._align_features(np.asarray(X, dtype=float), self._get_expected_features())
+    
     def predict_proba_single(self, X: np.ndarray) -> float:
         """单样本预测概率
         
@@ -140,6 +203,20 @@ class RecommenderModel:
             logger.error(f"预测失败: {e}")
             return self._rule_based_score(X)
     
+    def score_batch(self, X: np.ndarray) -> np.ndarray:
+        """批量预测正类概率（一次 predict_proba）；模型不可用时逐行使用规则评分"""
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        if self.model is not None and hasattr(self.model, 'classes_'):
+            try:
+                return self.model.predict_proba(self.transform_features(X))[:, 1]
+            except Exception as e:
+                logger.error(f"批量预测失败: {e}")
+        return self.rule_based_scores(X)
+    
+    def rule_based_scores(self, X: np.ndarray) -> np.ndarray:
+        """逐行规则评分（模型不可用或推理超时时的降级）"""
+        return np.array([self._rule_based_score(row) for row in np.atleast_2d(X)])
+    
     def _rule_based_score(self, X: np.ndarray) -> float:
         """基于规则的评分（模型不可用时的回退方案）"""
         if X is None:
@@ -156,12 +233,47 @@ class RecommenderModel:
             base_score = min(base_score + bonus, 0.95)
         return max(0.1, min(0.95, base_score))
     
+    def get_benchmark(self) -> Optional[Dict]:
+        """推理性能基准（清单中未记录时，用随机画像 × 活动样本现场测量一次并缓存）"""
+        if self.manifest.get("benchmark"):
+            return self.manifest["benchmark"]
+        if self.model is None or not hasattr(self.model, 'classes_'):
+            return None
+        if self._benchmark is None:
+            from app.ml.benchmark import benchmark_estimator
+            from app.ml.features import ACTIVITY_TYPE_CODES, INCENTIVE_TYPE_CODES
+            
+            rng = np.random.default_rng(0)
+            n = 1000
+            X_raw = np.column_stack([
+                rng.random((n, 6)),
+                rng.integers(1, 100, n),
+                rng.integers(0, len(INCENTIVE_TYPE_CODES), n),
+                rng.integers(0, len(ACTIVITY_TYPE_CODES), n),
+            ])
+            self._benchmark = benchmark_estimator(self.model, self.transform_features(X_raw))
+        return self._benchmark
+    
     def predict(self, X: np.ndarray) -> np.ndarray:
         """预测类别"""
         if self.model is None:
             return np.zeros(X.shape[0])
         return self.model.predict(X)
     
+    def input_feature_names(self) -> List[str]:
+        """模型输入（transform_features 之后）各列的名称
+
+        优先使用清单中的 feature_names 或模型记录的 feature_names_in_，维度不符时：
+        输入维度与原始特征相同则为原始特征名，否则（如因子分析后的3维模型）使用中性名称 feature_i。
+        """
+        n_features = getattr(self.model, 'n_features_in_', len(self.feature_names))
+        for names in (self.manifest.get("feature_names"), getattr(self.model, 'feature_names_in_', None)):
+            if names is not None and len(names) == n_features:
+                return [str(name) for name in names]
+        if n_features == len(self.feature_names):
+            return list(self.feature_names)
+        return [f"feature_{i}" for i in range(n_features)]
+    
     def get_feature_importance(self) -> List[Dict]:
         """获取特征重要性"""
         if self.model is None:
@@ -179,12 +291,48 @@ class RecommenderModel:
         ]
 
 
-# 全局模型实例
+# 全局模型实例（热切换时整体替换引用，进行中的请求继续使用旧实例）
 _model_instance = None
+_model_lock = threading.Lock()
+_registry = None
+
+
+def get_registry():
+    """获取模型注册中心"""
+    global _registry
+    if _registry is None:
+        from app.ml.registry import ModelRegistry
+        _registry = ModelRegistry(settings.MODEL_REGISTRY_DIR)
+    return _registry
+
+
+def _load_initial_model() -> RecommenderModel:
+    """启动时加载：优先注册中心的激活版本，否则回退到工作目录下的模型文件"""
+    registry = get_registry()
+    version = registry.get_active_version()
+    if version:
+        try:
+            return RecommenderModel.from_registry(registry, version)
+        except Exception as e:
+            logger.warning(f"加载注册中心模型 {version} 失败，回退到默认模型文件: {e}")
+    return RecommenderModel()
+
 
 def get_model() -> RecommenderModel:
     """获取全局模型实例"""
     global _model_instance
     if _model_instance is None:
-        _model_instance = RecommenderModel()
+        with _model_lock:
+            if _model_instance is None:
+                _model_instance = _load_initial_model()
     return _model_instance
+
+
+def swap_model(new_model: RecommenderModel) -> RecommenderModel:
+    """原子替换全局模型实例，返回被替换的旧实例"""
+    global _model_instance
+    with _model_lock:
+        old_model = _model_instance
+        _model_instance = new_model
+    logger.info(f"线上模型已切换: {old_model.version if old_model else None} -> {new_model.version}")
+    return old_model
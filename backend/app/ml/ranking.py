@@ -0,0 +1,66 @@
+"""
+排序工具
+文件名：app/ml/ranking.py
+
+排序阶段以并列的 NumPy 数组（活动下标、分数）表示候选，只对最终选中的活动生成展示字段。
+多样性重排（MMR）只作用于候选集合的前若干名。
+"""
+
+from typing import Optional
+
+import numpy as np
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """分数最高的 k 个下标，按分数降序（同分按下标升序）
+
+    先用 argpartition 在 O(n) 内选出前 k 个，只对这 k 个排序。
+    """
+    n = len(scores)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    selected = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+    return selected[np.lexsort((selected, -scores[selected]))]
+
+
+def sample_head(n: int, k: int, pool: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """从排名前 pool 的名次中随机抽取 k 个，按名次升序返回"""
+    pool = min(pool, n)
+    if pool <= k:
+        return np.arange(pool)
+    rng = rng or np.random.default_rng()
+    return np.sort(rng.choice(pool, size=k, replace=False))
+
+
+def diversity_codes(activity_features: np.ndarray, amount_buckets) -> np.ndarray:
+    """多样性比较用的类别编码：活动类型、激励类型、激励金额档位
+
+    Args:
+        activity_features: 活动特征矩阵 (n, 3)，列为 金额、激励类型编码、活动类型编码
+    """
+    return np.column_stack([
+        activity_features[:, 2],
+        activity_features[:, 1],
+        np.digitize(activity_features[:, 0], amount_buckets),
+    ]).astype(np.int64)
+
+
+def mmr_rerank(relevance: np.ndarray, codes: np.ndarray, k: int, diversity_weight: float) -> np.ndarray:
+    """最大边际相关（MMR）重排，返回依次选中的 k 个下标
+
+    每一步选择 (1-w)·相关度 − w·与已选活动的最大相似度 最大的候选，相似度为 codes 各列相同的比例。
+    维护每个候选与已选集合的最大相似度，每步 O(N)，共 O(K·N)。得分相同时取下标小者。
+    """
+    n = len(relevance)
+    k = min(k, n)
+    selected = np.empty(k, dtype=np.int64)
+    max_similarity = np.zeros(n)
+    available = np.ones(n, dtype=bool)
+    for step in range(k):
+        gain = np.where(available, (1 - diversity_weight) * relevance - diversity_weight * max_similarity, -np.inf)
+        best = int(np.argmax(gain))
+        selected[step] = best
+        available[best] = False
+        np.maximum(max_similarity, (codes == codes[best]).mean(axis=1), out=max_similarity)
+    return selected
@@ -0,0 +1,224 @@
+"""
+模型注册中心
+文件名：app/ml/registry.py
+
+目录结构：
+    <registry_dir>/
+        active.json                 当前激活版本及激活历史
+        <version>/
+            manifest.json           版本清单（文件校验和、指标、参数）
+            model.pkl
+            scaler.pkl              （可选）
+            factor_analyzer.pkl     （可选）
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.utils.logger import logger
+
+
+MANIFEST_FILE = "manifest.json"
+ACTIVE_FILE = "active.json"
+MAX_ACTIVE_HISTORY = 20
+
+
+def file_sha256(path: str) -> str:
+    """计算文件的SHA256校验和"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _write_json_atomic(path: str, data: Dict[str, Any]):
+    """先写临时文件再原子替换，避免读到写了一半的JSON"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class ModelRegistry:
+    """版本化的模型注册中心"""
+
+    def __init__(self, registry_dir: str):
+        self.registry_dir = registry_dir
+
+    # ============ 版本清单 ============
+
+    def version_dir(self, version: str) -> str:
+        return os.path.join(self.registry_dir, version)
+
+    def get_manifest(self, version: str) -> Optional[Dict[str, Any]]:
+        """读取版本清单，不存在返回None"""
+        path = os.path.join(self.version_dir(version), MANIFEST_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def list_versions(self) -> List[Dict[str, Any]]:
+        """列出所有版本清单（按创建时间倒序）"""
+        if not os.path.isdir(self.registry_dir):
+            return []
+
+        manifests = []
+        for name in os.listdir(self.registry_dir):
+            if not os.path.isdir(self.version_dir(name)):
+                continue
+            try:
+                manifest = self.get_manifest(name)
+            except Exception as e:
+                logger.warning(f"读取模型清单失败 {name}: {e}")
+                continue
+            if manifest:
+                manifests.append(manifest)
+        manifests.sort(key=lambda m: m.get("created_at", ""), reverse=True)
+        return manifests
+
+    def update_manifest(self, version: str, **fields) -> Dict[str, Any]:
+        """合并更新版本清单中的字段"""
+        manifest = self.get_manifest(version)
+        if manifest is None:
+            raise ValueError(f"模型版本不存在: {version}")
+        manifest.update(fields)
+        _write_json_atomic(os.path.join(self.version_dir(version), MANIFEST_FILE), manifest)
+        return manifest
+
+    def resolve_files(self, version: str) -> Dict[str, str]:
+        """返回 {文件角色: 绝对路径}，并校验每个文件的SHA256
+
+        Raises:
+            ValueError: 版本不存在或校验和不匹配
+        """
+        manifest = self.get_manifest(version)
+        if manifest is None:
+            raise ValueError(f"模型版本不存在: {version}")
+
+        paths = {}
+        for role, entry in manifest.get("files", {}).items():
+            path = os.path.join(self.version_dir(version), entry["path"])
+            if not os.path.exists(path):
+                raise ValueError(f"模型文件缺失: {version}/{entry['path']}")
+            if file_sha256(path) != entry["sha256"]:
+                raise ValueError(f"模型文件校验失败: {version}/{entry['path']}")
+            paths[role] = path
+        return paths
+
+    def publish(
+        self,
+        files: Dict[str, str],
+        metrics: Dict[str, Any] = None,
+        metadata: Dict[str, Any] = None,
+        version: str = None
+    ) -> Dict[str, Any]:
+        """发布新模型版本
+
+        Args:
+            files: {文件角色: 源文件路径}，必须包含 "model"，可选 "scaler"、"factor_analyzer"
+            metrics: 评估指标
+            metadata: 其他元数据（模型类型、参数、训练样本数等）
+            version: 指定版本号，默认按时间和模型校验和生成
+
+        Returns:
+            版本清单
+        """
+        if "model" not in files:
+            raise ValueError("发布模型必须包含 model 文件")
+
+        model_digest = file_sha256(files["model"])
+        version = version or f"v{datetime.now().strftime('%Y%m%d%H%M%S')}-{model_digest[:8]}"
+        target_dir = self.version_dir(version)
+        if os.path.exists(target_dir):
+            raise ValueError(f"模型版本已存在: {version}")
+
+        # 先写入临时目录，全部完成后再重命名，保证版本目录要么完整要么不存在
+        tmp_dir = f"{target_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        file_entries = {}
+        for role, src in files.items():
+            filename = f"{role}.pkl"
+            shutil.copyfile(src, os.path.join(tmp_dir, filename))
+            file_entries[role] = {
+                "path": filename,
+                "sha256": file_sha256(os.path.join(tmp_dir, filename)),
+                "size_bytes": os.path.getsize(src),
+            }
+
+        manifest = {
+            "version": version,
+            "created_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "files": file_entries,
+            "metrics": metrics or {},
+            **(metadata or {}),
+        }
+        _write_json_atomic(os.path.join(tmp_dir, MANIFEST_FILE), manifest)
+        os.replace(tmp_dir, target_dir)
+
+        logger.info(f"模型版本已发布: {version}")
+        return manifest
+
+    # ============ 激活状态 ============
+
+    def _read_active(self) -> Dict[str, Any]:
+        path = os.path.join(self.registry_dir, ACTIVE_FILE)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"读取激活版本失败: {e}")
+            return {}
+
+    def get_active_version(self) -> Optional[str]:
+        return self._read_active().get("version")
+
+    def get_active_history(self) -> List[str]:
+        """激活历史（旧版本在前，不含当前版本）"""
+        return self._read_active().get("history", [])
+
+    def set_active(self, version: str, record_previous: bool = True):
+        """记录激活版本，原激活版本进入历史供回滚
+
+        回滚时（record_previous=False）不记录原版本，并把回滚目标及其之后的历史移除。
+        """
+        if self.get_manifest(version) is None:
+            raise ValueError(f"模型版本不存在: {version}")
+
+        active = self._read_active()
+        history = active.get("history", [])
+        previous = active.get("version")
+        if record_previous and previous and previous != version:
+            history.append(previous)
+        elif not record_previous and version in history:
+            history = history[:len(history) - 1 - history[::-1].index(version)]
+
+        os.makedirs(self.registry_dir, exist_ok=True)
+        _write_json_atomic(os.path.join(self.registry_dir, ACTIVE_FILE), {
+            "version": version,
+            "activated_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "history": history[-MAX_ACTIVE_HISTORY:],
+        })
+
+    def peek_rollback_target(self) -> Optional[str]:
+        """回滚目标（最近一次被替换且仍存在的版本），不修改历史；切换成功后由 set_active 移除"""
+        active = self._read_active()
+        current = active.get("version")
+        for candidate in reversed(active.get("history", [])):
+            if candidate != current and self.get_manifest(candidate) is not None:
+                return candidate
+        return None
+
+    def active_mtime(self) -> float:
+        """激活文件的修改时间（用于多进程间感知版本切换）"""
+        path = os.path.join(self.registry_dir, ACTIVE_FILE)
+        return os.path.getmtime(path) if os.path.exists(path) else 0.0
@@ -0,0 +1,293 @@
+"""
+超参数搜索
+文件名：app/ml/search.py
+
+在 training.search.param_space 上做网格或随机搜索，把（候选参数 × 交叉验证折）
+分发到进程池并行训练。训练数据写入临时 .npy 文件，各工作进程以内存映射方式
+只读共享，避免为每个任务序列化整份数据。开启逐次减半（successive halving）时，
+候选先在少量数据上评估，每轮只保留前 1/eta 进入下一轮，数据量按 eta 倍增长。
+排行榜按 AUC 排序，同时给出满足 training.target_metrics 且 p99 延迟最低的推荐候选。
+"""
+
+import itertools
+import math
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import StratifiedKFold
+
+from app.config_loader import rec_config
+from app.ml.benchmark import benchmark_estimator, meets_target_metrics, select_fastest
+from app.ml.train_model import evaluate_binary, rf_params_from_config, smote_oversample
+from app.utils.logger import logger
+
+
+# 每个候选按折取平均的指标
+SUMMARY_KEYS = (
+    "auc", "recall", "precision", "accuracy", "fit_seconds",
+    "latency_p50_ms", "latency_p99_ms", "batch_rows_per_sec", "serialized_bytes", "resident_bytes",
+)
+
+def _mean_or_none(values: List[Optional[float]]) -> Optional[float]:
+    """忽略缺失值取平均（批量基准测试被跳过时吞吐为None），全部缺失时返回None"""
+    present = [v for v in values if v is not None]
+    return float(np.mean(present)) if present else None
+
+
+# 工作进程内共享的内存映射训练数据
+_shared_data: Dict[str, np.ndarray] = {}
+
+# 折内基准测试的单条推理次数（各折取平均，少于最终模型的基准测试）
+BENCHMARK_SINGLE_ROWS = 100
+
+
+def _init_search_worker(x_path: str, y_path: str):
+    """进程池初始化：以只读内存映射方式打开训练数据"""
+    _shared_data["X"] = np.load(x_path, mmap_mode='r')
+    _shared_data["y"] = np.load(y_path, mmap_mode='r')
+
+
+def _evaluate_candidate_fold(task: Dict[str, Any]) -> Dict[str, Any]:
+    """在一个折上训练评估一个候选（进程池任务）"""
+    X, y = _shared_data["X"], _shared_data["y"]
+    train_idx, val_idx = task["train_idx"], task["val_idx"]
+
+    # 逐次减半的低资源轮次：按比例分层抽取训练子集
+    fraction = task["resource_fraction"]
+    if fraction < 1.0:
+        rng = np.random.default_rng(task["seed"])
+        subset = []
+        for label in np.unique(y[train_idx]):
+            label_idx = train_idx[y[train_idx] == label]
+            size = max(1, int(len(label_idx) * fraction))
+            subset.append(rng.choice(label_idx, size=size, replace=False))
+        train_idx = np.sort(np.concatenate(subset))
+
+    X_train, y_train = np.asarray(X[train_idx]), np.asarray(y[train_idx])
+    X_val, y_val = np.asarray(X[val_idx]), np.asarray(y[val_idx])
+
+    smote = task.get("smote") or {}
+    if smote.get("enabled"):
+        X_train, y_train = smote_oversample(
+            X_train, y_train,
+            sampling_strategy=smote.get("sampling_strategy", 0.8),
+            k_neighbors=smote.get("k_neighbors", 5),
+            random_state=smote.get("random_state", 42)
+        )
+
+    started = time.perf_counter()
+    model = RandomForestClassifier(**{**task["params"], "n_jobs": 1})
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - started
+
+    metrics = evaluate_binary(y_val, model.predict_proba(X_val)[:, 1], task["threshold"])
+    metrics.update(benchmark_estimator(model, X_val, n_single=BENCHMARK_SINGLE_ROWS))
+    metrics.update({
+        "candidate_id": task["candidate_id"],
+        "fold": task["fold"],
+        "fit_seconds": fit_seconds,
+    })
+    return metrics
+
+
+def sample_candidates(
+    param_space: Dict[str, Any],
+    method: str = "random",
+    n_candidates: int = 20,
+    random_state: int = 42
+) -> List[Dict[str, Any]]:
+    """从参数空间生成候选参数组合
+
+    参数空间的值可以是取值列表，也可以是 {"low": a, "high": b} 区间（仅随机搜索，
+    两端均为整数时按整数均匀采样）。网格搜索只使用列表形式的参数。
+    """
+    if method == "grid":
+        names = list(param_space)
+        values = [v if isinstance(v, list) else [v] for v in param_space.values()]
+        return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+    rng = np.random.default_rng(random_state)
+    candidates, seen = [], set()
+    # 离散空间较小时不可能凑满 n_candidates，限制尝试次数
+    for _ in range(n_candidates * 20):
+        if len(candidates) >= n_candidates:
+            break
+        candidate = {}
+        for name, space in param_space.items():
+            if isinstance(space, dict):
+                low, high = space["low"], space["high"]
+                if isinstance(low, int) and isinstance(high, int):
+                    candidate[name] = int(rng.integers(low, high + 1))
+                else:
+                    candidate[name] = float(rng.uniform(low, high))
+            elif isinstance(space, list):
+                candidate[name] = space[int(rng.integers(len(space)))]
+            else:
+                candidate[name] = space
+        key = tuple(sorted((k, str(v)) for k, v in candidate.items()))
+        if key not in seen:
+            seen.add(key)
+            candidates.append(candidate)
+    return candidates
+
+
+class HyperparameterSearch:
+    """基于进程池的并行超参数搜索"""
+
+    def __init__(self, search_cfg: Dict[str, Any] = None):
+        training_cfg = rec_config.training
+        self.search_cfg = search_cfg or training_cfg.get("search", {})
+        self.cv_cfg = training_cfg.get("cross_validation", {})
+        self.smote_cfg = training_cfg.get("smote", {})
+        self.threshold = training_cfg.get("threshold", {}).get("default", 0.5)
+        self.target_metrics = training_cfg.get("target_metrics", {})
+        self.random_state = self.search_cfg.get("random_state", 42)
+
+    def _resource_schedule(self, n_candidates: int) -> List[float]:
+        """每轮使用的训练数据比例，最后一轮为全量"""
+        halving = self.search_cfg.get("successive_halving", {})
+        if not halving.get("enabled", True) or n_candidates <= 1:
+            return [1.0]
+
+        eta = halving.get("eta", 3)
+        min_fraction = halving.get("min_resource_fraction", 0.2)
+        # 轮数：候选数按 eta 递减至1，且首轮数据比例不低于 min_resource_fraction，取两者较小者
+        rounds = 1 + min(
+            int(math.ceil(math.log(n_candidates, eta))),
+            int(math.floor(math.log(1 / min_fraction, eta) + 1e-9))
+        )
+        return [1.0 / eta ** (rounds - 1 - r) for r in range(rounds)]
+
+    def run(
+        self,
+        X: np.ndarray,
+        y: np.ndarray,
+        progress_callback: Optional[Callable[[int, int, int], None]] = None
+    ) -> Dict[str, Any]:
+        """执行搜索，返回排行榜
+
+        Args:
+            X, y: 训练数据
+            progress_callback: 进度回调，参数为 (当前轮次, 已完成任务数, 本轮任务总数)
+        """
+        base_params = rf_params_from_config()
+        candidates = [
+            {"candidate_id": i, "params": {**base_params, **params}, "rungs": []}
+            for i, params in enumerate(sample_candidates(
+                self.search_cfg.get("param_space", {}),
+                method=self.search_cfg.get("method", "random"),
+                n_candidates=self.search_cfg.get("n_candidates", 20),
+                random_state=self.random_state
+            ))
+        ]
+        if not candidates:
+            raise ValueError("参数空间为空，无法搜索")
+
+        n_splits = self.cv_cfg.get("n_splits", 5)
+        shuffle = self.cv_cfg.get("shuffle", True)
+        folds = list(StratifiedKFold(
+            n_splits=n_splits,
+            shuffle=shuffle,
+            random_state=self.random_state if shuffle else None
+        ).split(X, y))
+
+        eta = self.search_cfg.get("successive_halving", {}).get("eta", 3)
+        schedule = self._resource_schedule(len(candidates))
+        n_workers = self.search_cfg.get("n_workers") or os.cpu_count() or 1
+        started = time.time()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            x_path = os.path.join(tmp_dir, "X.npy")
+            y_path = os.path.join(tmp_dir, "y.npy")
+            np.save(x_path, np.ascontiguousarray(X, dtype=np.float64))
+            np.save(y_path, np.ascontiguousarray(y))
+
+            with ProcessPoolExecutor(
+                max_workers=n_workers,
+                initializer=_init_search_worker,
+                initargs=(x_path, y_path)
+            ) as pool:
+                survivors = candidates
+                for rung, fraction in enumerate(schedule):
+                    self._run_rung(pool, survivors, folds, rung, fraction, progress_callback)
+                    survivors.sort(key=lambda c: c["rungs"][-1]["auc"], reverse=True)
+                    if rung < len(schedule) - 1:
+                        keep = max(1, int(math.ceil(len(survivors) / eta)))
+                        for eliminated in survivors[keep:]:
+                            eliminated["eliminated_at_rung"] = rung
+                        survivors = survivors[:keep]
+
+        leaderboard = sorted(
+            candidates,
+            key=lambda c: (len(c["rungs"]), c["rungs"][-1]["auc"]),
+            reverse=True
+        )
+        for rank, candidate in enumerate(leaderboard, start=1):
+            candidate["rank"] = rank
+            candidate.update({k: candidate["rungs"][-1][k] for k in SUMMARY_KEYS})
+            candidate["meets_targets"] = meets_target_metrics(candidate, self.target_metrics)
+            candidate["resource_fraction"] = candidate["rungs"][-1]["resource_fraction"]
+
+        # 在全量数据轮次完成评估的候选中，选择满足目标指标且 p99 延迟最低的一个
+        finalists = [c for c in leaderboard if c["resource_fraction"] == 1.0]
+        selected = select_fastest(finalists, self.target_metrics)
+
+        logger.info(
+            f"超参数搜索完成: {len(candidates)} 个候选, {len(schedule)} 轮, "
+            f"最佳 AUC {leaderboard[0]['auc']:.4f}, 耗时 {time.time() - started:.1f}s"
+        )
+        return {
+            "method": self.search_cfg.get("method", "random"),
+            "n_candidates": len(candidates),
+            "resource_schedule": schedule,
+            "n_splits": n_splits,
+            "n_samples": int(len(y)),
+            "duration_seconds": round(time.time() - started, 2),
+            "best_params": leaderboard[0]["params"],
+            "target_metrics": self.target_metrics,
+            "selected_candidate_id": selected["candidate_id"],
+            "selected_params": selected["params"],
+            "leaderboard": leaderboard,
+        }
+
+    def _run_rung(self, pool, survivors, folds, rung, fraction, progress_callback):
+        """在一轮中评估全部存活候选的所有折，并汇总每个候选的平均指标"""
+        tasks = [
+            {
+                "candidate_id": c["candidate_id"],
+                "params": c["params"],
+                "fold": fold,
+                "train_idx": train_idx,
+                "val_idx": val_idx,
+                "resource_fraction": fraction,
+                "seed": self.random_state + fold,
+                "smote": self.smote_cfg,
+                "threshold": self.threshold,
+            }
+            for c in survivors
+            for fold, (train_idx, val_idx) in enumerate(folds)
+        ]
+
+        results: Dict[int, List[Dict[str, Any]]] = {}
+        futures = [pool.submit(_evaluate_candidate_fold, task) for task in tasks]
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            results.setdefault(result["candidate_id"], []).append(result)
+            if progress_callback:
+                progress_callback(rung, done, len(tasks))
+
+        for candidate in survivors:
+            fold_results = results[candidate["candidate_id"]]
+            summary = {
+                name: _mean_or_none([r.get(name) for r in fold_results])
+                for name in SUMMARY_KEYS
+            }
+            summary["auc_std"] = float(np.std([r["auc"] for r in fold_results]))
+            summary["rung"] = rung
+            summary["resource_fraction"] = fraction
+            candidate["rungs"].append(summary)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 
 # ============ Shared Items ============
@@ -91,15 +91,50 @@ class ConfigResponse(BaseModel):
     min_score: float
     diversity_weight: float
 
+class ConfigUpdateRequest(BaseModel):
+    """可在线修改的推荐配置（未提供的字段保持不变）"""
+    max_recommendations: Optional[int] = Field(None, gt=0)
+    cold_start_count: Optional[int] = Field(None, gt=0)
+    min_score: Optional[float] = Field(None, ge=0, le=1)
+    diversity_weight: Optional[float] = Field(None, ge=0, le=1)
+
 class ModelInfoResponse(BaseModel):
+    version: Optional[str] = None
     model_type: str
     trained_at: Optional[str]
-    accuracy: float
-    auc: float
-    train_samples: int
-    test_samples: int
+    accuracy: Optional[float] = None
+    auc: Optional[float] = None
+    recall: Optional[float] = None
+    precision: Optional[float] = None
+    train_samples: Optional[int] = None
+    test_samples: Optional[int] = None
+    benchmark: Optional[Dict[str, Any]] = None
+    meets_targets: Optional[bool] = None
     feature_importance: Dict[str, float]
 
+class ModelVersionItem(BaseModel):
+    version: str
+    created_at: Optional[str] = None
+    model_type: Optional[str] = None
+    metrics: Dict[str, Any] = {}
+    benchmark: Optional[Dict[str, Any]] = None
+    is_active: bool
+    is_serving: bool
+
+class ModelVersionListResponse(BaseModel):
+    serving_version: str
+    active_version: Optional[str] = None
+    loader_status: Dict[str, Any]
+    versions: List[ModelVersionItem]
+
+class GlobalImportanceResponse(BaseModel):
+    version: str
+    status: str
+    progress: float = 0.0
+    computed_at: Optional[str] = None
+    sample_size: int = 0
+    features: List[FeatureItem] = []
+
 class UserStatsResponse(BaseModel):
     total: int
     active: int
@@ -23,6 +23,14 @@ class RecommendationResponse(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class RecommendationFeedResponse(BaseModel):
+    """推荐流分页响应模式"""
+    items: List[RecommendationResponse]
+    next_cursor: Optional[str] = None
+    ranking_version: Optional[str] = None
+    serving_tier: Optional[str] = None  # model / cached / stale / shortlist / rule / popularity
+
+
 class FeedbackRequest(BaseModel):
     """反馈请求模式"""
     is_clicked: bool = False
@@ -36,6 +44,7 @@ class RecommendationDetailResponse(BaseModel):
     reason: str
     feature_importance: List[dict]
     force_plot_data: dict
+    serving_tier: Optional[str] = None  # model / cached / rule / none
     
     model_config = {"from_attributes": True}
 
@@ -0,0 +1,311 @@
+"""
+活动目录服务
+文件名：app/services/catalog_service.py
+
+在内存中维护可推荐活动的快照：展示字段列表、活动ID数组与模型所需的活动特征矩阵。
+推荐请求直接读取快照，不再每次查询活动表。活动增删改后调用 invalidate()，
+下一次读取时重新加载；另按 inference.cache.activity_list_ttl 定期重载，
+以便多进程部署时同步其它进程的修改。内容未变化时快照版本号保持不变。
+
+进行中的活动还按 start_time / end_time 建立时间区间索引：快照只包含当前时刻处于
+活动时间窗口内的活动，由二分查找得出，并缓存到下一个开始或结束时刻为止。
+结束时刻由时间轮调度器在 end_time 到达时把活动状态改为 ended，无需定期全表扫描。
+"""
+
+import hashlib
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.config_loader import rec_config
+from app.database import SessionLocal
+from app.ml.features import activity_feature_vector, activity_type_bits
+from app.models import Activity
+from app.utils.logger import logger
+from app.utils.timer_wheel import TimerWheel
+
+
+def _timestamp(value: Optional[datetime], default: float) -> float:
+    """活动时间转时间戳（与 datetime.now() 一致按本地时间解释），未设置时取 default"""
+    return value.timestamp() if value is not None else default
+
+
+class CatalogSnapshot:
+    """活动目录的只读快照"""
+
+    def __init__(self, version: int, digest: str, activities: List[Dict], only_active: bool):
+        self.version = version
+        self.digest = digest
+        self.activities = activities
+        self.only_active = only_active
+        self.loaded_at = time.time()
+
+        self.ids = np.array([a["activity_id"] for a in activities], dtype=np.int64)
+        self.index = {a["activity_id"]: i for i, a in enumerate(activities)}
+        self.features = np.array([
+            activity_feature_vector(a["incentive_amount"], a["incentive_type"], a["activity_type"])
+            for a in activities
+        ]).reshape(-1, 3)
+
+        # 类型位（活动类型位 | 激励类型位），与用户偏好位掩码按位与即可筛选
+        self.type_bits = np.array([
+            activity_type_bits(a["activity_type"], a["incentive_type"]) for a in activities
+        ], dtype=np.int32)
+
+        # 不同的活动特征组合（升序）及每个活动对应的组合下标
+        if len(activities):
+            self.feature_tuples, self.tuple_index = np.unique(self.features, axis=0, return_inverse=True)
+            self.tuple_index = self.tuple_index.reshape(-1)
+        else:
+            self.feature_tuples = np.empty((0, 3))
+            self.tuple_index = np.empty(0, dtype=np.int64)
+        self.feature_key = hashlib.sha1(self.feature_tuples.tobytes()).hexdigest()[:12]
+
+        # 倒排索引：属性值 → 活动下标数组（供召回阶段按需取子集，不扫描全量目录）
+        self.by_target_cluster = self._group("target_cluster")
+        self.by_activity_type = self._group("activity_type")
+        self.by_incentive_type = self._group("incentive_type")
+
+    def _group(self, field: str) -> Dict[str, np.ndarray]:
+        groups: Dict[str, List[int]] = {}
+        for i, activity in enumerate(self.activities):
+            value = activity[field]
+            if value not in (None, ""):
+                groups.setdefault(str(value), []).append(i)
+        return {k: np.array(v, dtype=np.int64) for k, v in groups.items()}
+
+    def __len__(self) -> int:
+        return len(self.activities)
+
+
+class ActivityWindowIndex:
+    """活动时间区间索引：开始、结束时间戳各自升序排列
+
+    未设置 start_time 视为已开始，未设置 end_time 视为不结束。
+    时刻 t 的进行中活动满足 start <= t < end。
+    """
+
+    def __init__(self, activities: List[Dict]):
+        self.starts = np.array([_timestamp(a["start_time"], -np.inf) for a in activities], dtype=float)
+        self.ends = np.array([_timestamp(a["end_time"], np.inf) for a in activities], dtype=float)
+        self.start_order = np.argsort(self.starts, kind="stable")
+        self.sorted_starts = self.starts[self.start_order]
+        self.sorted_ends = np.sort(self.ends)
+
+    def live(self, now: float) -> np.ndarray:
+        """时刻 now 处于时间窗口内的活动下标（升序）"""
+        started = self.start_order[:np.searchsorted(self.sorted_starts, now, side="right")]
+        return np.sort(started[self.ends[started] > now])
+
+    def not_ended(self, now: float) -> np.ndarray:
+        """时刻 now 尚未结束（进行中或未开始）的活动下标（升序）"""
+        return np.flatnonzero(self.ends > now)
+
+    def next_boundary(self, now: float) -> float:
+        """now 之后最近的开始或结束时刻（进行中集合在此之前不会变化）"""
+        boundary = np.inf
+        for values in (self.sorted_starts, self.sorted_ends):
+            i = np.searchsorted(values, now, side="right")
+            if i < len(values):
+                boundary = min(boundary, values[i])
+        return float(boundary)
+
+
+class ActivityCatalogService:
+    """活动目录快照的加载与失效"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._dirty = True
+        self._version = 0
+        self._listeners: List[Callable[[CatalogSnapshot], None]] = []
+        # 最近一次从数据库读取的活动及其时间区间索引
+        self._rows: Optional[List[Dict]] = None
+        self._only_active = True
+        self._windows: Optional[ActivityWindowIndex] = None
+        self._loaded_at = 0.0
+        self._next_boundary = np.inf
+        cfg = self.schedule_config()
+        self._scheduler = TimerWheel(
+            tick_seconds=cfg.get("tick_seconds", 1.0),
+            slots=cfg.get("slots", 3600),
+            name="activity-scheduler"
+        )
+
+    @staticmethod
+    def schedule_config() -> Dict:
+        return rec_config.get("inference.activity_schedule", {}) or {}
+
+    def add_listener(self, callback: Callable[[CatalogSnapshot], None]):
+        """注册目录内容变化回调（参数为新快照）"""
+        self._listeners.append(callback)
+
+    def is_loaded(self) -> bool:
+        """是否已加载过目录快照"""
+        return self._snapshot is not None
+
+    def invalidate(self):
+        """活动数据变更后调用，下一次读取时重新加载"""
+        self._dirty = True
+
+    def _is_fresh(self, now: float, ttl: float) -> bool:
+        return (
+            self._snapshot is not None and not self._dirty
+            and now - self._loaded_at < ttl and now < self._next_boundary
+        )
+
+    def get_snapshot(self, db: Session = None) -> CatalogSnapshot:
+        """获取当前目录快照（需要时重新加载；跨过活动开始/结束时刻时从内存重建）"""
+        ttl = rec_config.get("inference.cache.activity_list_ttl", 600)
+        if self._is_fresh(time.time(), ttl):
+            return self._snapshot
+
+        with self._lock:
+            now = time.time()
+            snapshot = self._snapshot
+            if self._is_fresh(now, ttl):
+                return snapshot
+            if self._dirty or self._rows is None or now - self._loaded_at >= ttl:
+                self._dirty = False
+                try:
+                    self._load(db)
+                except Exception as e:
+                    # 读取失败（含请求截止时间中断的查询）：下次读取时重试，已有快照时继续使用
+                    self._dirty = True
+                    if snapshot is None:
+                        raise
+                    logger.warning(f"活动目录重新加载失败，继续使用版本 {snapshot.version}: {e}")
+                    return snapshot
+            new_snapshot = self._build(now)
+            changed = snapshot is None or new_snapshot.digest != snapshot.digest
+            self._snapshot = new_snapshot
+
+        if changed:
+            logger.info(f"活动目录已加载: 版本 {new_snapshot.version}, {len(new_snapshot)} 个活动")
+            for callback in self._listeners:
+                try:
+                    callback(new_snapshot)
+                except Exception as e:
+                    logger.warning(f"活动目录变更回调失败: {e}")
+        return new_snapshot
+
+    def _load(self, db: Session = None):
+        """读取进行中的活动；没有进行中的活动时使用全部活动"""
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            only_active = True
+            rows = db.query(Activity).filter(Activity.status == "active").order_by(Activity.id).all()
+            if not rows:
+                only_active = False
+                rows = db.query(Activity).order_by(Activity.id).all()
+            activities = [self._to_row(a) for a in rows]
+        finally:
+            if own_session:
+                db.close()
+
+        self._rows = activities
+        self._only_active = only_active
+        self._windows = ActivityWindowIndex(activities) if only_active else None
+        self._loaded_at = time.time()
+        if only_active:
+            self._schedule_expiry(activities)
+
+    def _build(self, now: float) -> CatalogSnapshot:
+        """由已加载的活动构建 now 时刻的快照"""
+        activities = self._rows
+        if self._windows is not None:
+            live = self._windows.live(now)
+            if len(live) == 0:
+                # 没有处于时间窗口内的活动时不返回空目录：退回尚未结束的活动，都已结束时退回全部进行中状态的活动
+                live = self._windows.not_ended(now)
+                if len(live) == 0:
+                    live = np.arange(len(activities))
+            activities = [activities[i] for i in live]
+            self._next_boundary = self._windows.next_boundary(now)
+        else:
+            self._next_boundary = np.inf
+
+        only_active = self._only_active
+        digest = hashlib.sha1(repr([
+            (only_active, sorted(a.items(), key=lambda kv: kv[0])) for a in activities
+        ]).encode("utf-8")).hexdigest()
+        previous = self._snapshot
+        if previous is not None and previous.digest == digest:
+            version = previous.version
+        else:
+            self._version += 1
+            version = self._version
+        return CatalogSnapshot(version, digest, activities, only_active)
+
+    # ============ 活动状态定时切换 ============
+
+    def start_scheduler(self):
+        """加载活动目录并启动时间轮（end_time 到达时把进行中的活动改为已结束）"""
+        if not self.schedule_config().get("enabled", True):
+            return
+        self._scheduler.start()
+        self.get_snapshot()
+
+    def stop_scheduler(self):
+        self._scheduler.stop()
+
+    def _schedule_expiry(self, activities: List[Dict]):
+        """为设置了结束时间的进行中活动登记结束任务（已过期的在下一个刻度执行）"""
+        if not self.schedule_config().get("enabled", True):
+            return
+        scheduled = set()
+        for activity in activities:
+            if activity["end_time"] is None:
+                continue
+            activity_id = activity["activity_id"]
+            scheduled.add(activity_id)
+            self._scheduler.schedule(
+                activity_id,
+                activity["end_time"].timestamp(),
+                lambda activity_id=activity_id: self._expire(activity_id)
+            )
+        # 已不在进行中的活动取消原有任务
+        for activity_id in self._scheduler.keys():
+            if activity_id not in scheduled:
+                self._scheduler.cancel(activity_id)
+
+    def _expire(self, activity_id: int):
+        """把到达结束时间的活动状态改为 ended（结束时间已被修改或状态已变化时不处理）"""
+        db = SessionLocal()
+        try:
+            updated = db.query(Activity).filter(
+                Activity.id == activity_id,
+                Activity.status == "active",
+                Activity.end_time <= datetime.now()
+            ).update({"status": "ended"}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        if updated:
+            logger.info(f"活动 {activity_id} 已到结束时间，状态切换为 ended")
+            self.invalidate()
+
+    @staticmethod
+    def _to_row(activity: Activity) -> Dict:
+        """推荐结果需要的活动字段"""
+        return {
+            "activity_id": activity.id,
+            "title": activity.title,
+            "description": activity.description,
+            "activity_type": activity.type,
+            "incentive_type": activity.incentive_type,
+            "incentive_amount": float(activity.incentive_amount or 0),
+            "target_cluster": activity.target_cluster,
+            "start_time": activity.start_time,
+            "end_time": activity.end_time,
+            "status": activity.status,
+        }
+
+
+catalog_service = ActivityCatalogService()
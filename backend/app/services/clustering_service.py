@@ -8,6 +8,11 @@ import json
 import os
 from app.models import UserProfile, User
 from app.utils.logger import logger
+from app.utils.singleflight import SingleFlight
+
+
+# 聚类统计为全表聚合，并发请求合并为一次
+cluster_stats_flight = SingleFlight("cluster_stats")
 
 
 # 从配置文件加载聚类标签
@@ -84,6 +89,10 @@ class ClusteringService:
             
             db.commit()
             
+            # 各聚类的候选短名单依赖聚类结果
+            from app.services.shortlist_service import shortlist_service
+            shortlist_service.on_clusters_changed()
+            
             # 返回结果
             return {
                 "message": "聚类完成",
@@ -130,11 +139,18 @@ class ClusteringService:
     @staticmethod
     def get_cluster_stats(db: Session) -> List[Dict[str, Any]]:
         """
-        获取聚类统计信息
+        获取聚类统计信息（并发请求合并为一次聚合查询）
         
         Returns:
             各聚类的统计数据
         """
+        compute = lambda: ClusteringService._compute_cluster_stats(db)
+        ok, stats = cluster_stats_flight.do("cluster_stats", compute)
+        return stats if ok else compute()
+    
+    @staticmethod
+    def _compute_cluster_stats(db: Session) -> List[Dict[str, Any]]:
+        """按聚类标签聚合用户数与各因子均值"""
         stats = db.query(
             UserProfile.cluster_tag,
             func.count(UserProfile.id).label("count"),
@@ -3,19 +3,27 @@ from sqlalchemy.orm import Session
 from typing import Dict
 from app.ml.predict import get_model
 from app.ml.explainer import SHAPExplainer
+from app.utils.deadline import Deadline, DeadlineExceeded, run_in_worker, statement_timeout
+from app.utils.metrics import serving_metrics
+from app.utils.singleflight import SingleFlight
+
+
+# 同一用户对同一活动的并发解释请求合并为一次
+explanation_flight = SingleFlight("explanation")
 
 
 class ExplainService:
     """推荐解释业务逻辑"""
     
-    def __init__(self):
-        self.model = get_model()
-        self.explainer = SHAPExplainer()
-        try:
-            if self.model.model is not None:
-                self.explainer.fit(self.model.model)
-        except Exception:
-            pass
+    @property
+    def model(self):
+        """当前线上模型（模型热切换后自动指向新版本）"""
+        return get_model()
+    
+    @property
+    def explainer(self) -> SHAPExplainer:
+        """与当前线上模型绑定的SHAP解释器"""
+        return self.model.get_explainer()
     
     def explain_recommendation(self, db: Session, recommendation_id: int):
         """解释推荐理由"""
@@ -25,21 +33,47 @@ class ExplainService:
         """获取特征重要性"""
         return {"features": {}}
     
-    def get_explanation(self, db: Session, user_id: int, activity_id: int) -> Dict:
-        """获取推荐解释详情"""
+    def get_explanation(self, db: Session, user_id: int, activity_id: int, deadline: Deadline = None) -> Dict:
+        """获取推荐解释详情
+        
+        模型预测受 inference.timeout 约束，超时依次使用用户缓存排序中的分数、规则评分，
+        实际使用的层级记录在返回值的 serving_tier 中。同一用户对同一活动的并发请求只计算一次。
+        """
+        deadline = deadline or Deadline.from_config()
+        compute = lambda: self._compute_explanation(db, user_id, activity_id, deadline)
+        ok, result = explanation_flight.do(
+            (user_id, activity_id), compute, deadline.timeout_ms(explanation_flight.default_timeout_ms())
+        )
+        # 共享的结果由调用方各自补充字段，返回副本
+        return dict(result if ok else compute())
+    
+    def _compute_explanation(self, db: Session, user_id: int, activity_id: int, deadline: Deadline) -> Dict:
+        """计算推荐解释详情"""
         from app.models import UserProfile, Activity
         from app.utils.logger import logger
         import numpy as np
         
-        profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
-        activity = db.query(Activity).filter(Activity.id == activity_id).first()
+        # 固定本次请求使用的模型实例
+        model = self.model
+        
+        try:
+            with statement_timeout(db, deadline, "profile", Deadline.stage_budget("db_query_ms")):
+                profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+                activity = db.query(Activity).filter(Activity.id == activity_id).first()
+            message = "数据不足，无法生成详细解释"
+        except DeadlineExceeded as e:
+            logger.warning(f"用户 {user_id} 活动 {activity_id} 解释{e}")
+            profile = activity = None
+            message = "解释生成超时，请稍后重试"
         
         if not profile or not activity:
+            serving_metrics.record("explanation", "none", deadline.elapsed_ms())
             return {
                 "score": 0.5,
-                "explanation": "数据不足，无法生成详细解释",
+                "explanation": message,
                 "feature_importance": [],
-                "force_plot_data": {}
+                "force_plot_data": {},
+                "serving_tier": "none"
             }
         
         # 构建特征向量
@@ -58,7 +92,7 @@ class ExplainService:
             activity_type_map.get(activity.type, 0)
         ]])
         
-        score = self.model.predict_proba_single(features)
+        score, tier = self._predict_with_deadline(model, features, user_id, activity_id, deadline)
         
         # 生成详细解释文本
         explanation_text = self._generate_detailed_explanation(profile, activity, score)
@@ -66,15 +100,34 @@ class ExplainService:
         # 获取特征重要性
         feature_importance = self._get_formatted_feature_importance(profile)
         
-        logger.info(f"为用户 {user_id} 生成活动 {activity_id} 的解释")
+        logger.info(f"为用户 {user_id} 生成活动 {activity_id} 的解释 (tier={tier})")
+        serving_metrics.record("explanation", tier, deadline.elapsed_ms())
         
         return {
             "score": float(score),
             "explanation": explanation_text,
             "feature_importance": feature_importance,
-            "force_plot_data": {}
+            "force_plot_data": {},
+            "serving_tier": tier
         }
     
+    def _predict_with_deadline(self, model, features, user_id: int, activity_id: int, deadline: Deadline):
+        """在预算内预测接受概率，返回 (分数, 服务层级)；超时依次使用缓存排序中的分数、规则评分"""
+        from app.services.recommendation_service import recommendation_service
+        from app.utils.logger import logger
+        
+        try:
+            deadline.check("profile")
+            future = run_in_worker(model.predict_proba_single, features)
+            return deadline.wait(future, "model_predict", Deadline.stage_budget("model_predict_ms")), "model"
+        except DeadlineExceeded as e:
+            logger.warning(f"用户 {user_id} 活动 {activity_id} 解释{e}，降级处理")
+        
+        cached = recommendation_service.cached_score(user_id, activity_id)
+        if cached is not None:
+            return cached, "cached"
+        return float(model.rule_based_scores(features)[0]), "rule"
+    
     def _generate_detailed_explanation(self, profile, activity, score: float) -> str:
         """生成详细的推荐解释文本"""
         explanations = []
@@ -139,9 +192,26 @@ class ExplainService:
         return features
     
     def get_global_feature_importance(self, db: Session) -> Dict:
-        """获取全局特征重要性"""
-        feature_importance = self.model.get_feature_importance()
-        return {"features": feature_importance}
+        """获取全局特征重要性
+        
+        优先返回后台计算的全局SHAP重要性缓存，未计算时回退到模型的不纯度重要性
+        """
+        from app.services.importance_service import importance_service
+        
+        model = self.model
+        cached = importance_service.get_cached(model.version)
+        if cached:
+            return {
+                "source": "shap",
+                "model_version": cached["model_version"],
+                "features": [
+                    {"feature": item["name"], "label": item["label"], "importance": item["importance"]}
+                    for item in cached["features"]
+                ]
+            }
+        
+        feature_importance = model.get_feature_importance()
+        return {"source": "impurity", "features": feature_importance}
 
 
 explain_service = ExplainService()
@@ -0,0 +1,216 @@
+"""
+全局SHAP特征重要性服务
+文件名：app/services/importance_service.py
+
+在后台对（用户画像 × 活跃活动）样本做分层抽样，分块并行计算平均 |SHAP|，
+结果按模型版本缓存（内存 + JSON文件），管理端接口直接读取缓存。
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.config_loader import rec_config
+from app.database import SessionLocal
+from app.ml.explainer import SHAPExplainer, compute_mean_abs_shap
+from app.ml.features import activity_feature_vector, user_factor_vector
+from app.ml.predict import get_model
+from app.models import Activity, UserProfile
+from app.utils.logger import logger
+
+
+class GlobalImportanceService:
+    """全局SHAP重要性后台计算与缓存"""
+
+    def __init__(self, cache_dir: str = None):
+        self.cache_dir = cache_dir or os.path.join(settings.DATA_DIR, "shap_importance")
+        self._results: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._status = {
+            "state": "idle",  # idle / pending / running / completed / failed
+            "model_version": None,
+            "progress": 0.0,
+            "error": None,
+        }
+
+    # ============ 读取缓存 ============
+
+    def get_cached(self, model_version: str) -> Optional[Dict]:
+        """读取指定模型版本的缓存结果（不存在返回None）"""
+        result = self._results.get(model_version)
+        if result is not None:
+            return result
+
+        path = self._cache_path(model_version)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    result = json.load(f)
+                # 早期结果按原始特征名标注降维后的列，缺少 feature_names 时视为无效并重新计算
+                if "feature_names" not in result:
+                    return None
+                self._results[model_version] = result
+                return result
+            except Exception as e:
+                logger.warning(f"读取全局SHAP缓存失败: {e}")
+        return None
+
+    def get_status(self) -> Dict:
+        """获取后台任务状态"""
+        with self._lock:
+            return dict(self._status)
+
+    def _cache_path(self, model_version: str) -> str:
+        return os.path.join(self.cache_dir, f"{model_version}.json")
+
+    # ============ 后台计算 ============
+
+    def mark_pending(self, model_version: str) -> bool:
+        """标记任务待执行，已有任务在执行时返回False"""
+        with self._lock:
+            if self._status["state"] in ("pending", "running"):
+                return False
+            self._status = {
+                "state": "pending",
+                "model_version": model_version,
+                "progress": 0.0,
+                "error": None,
+            }
+            return True
+
+    def _update_status(self, **kwargs):
+        with self._lock:
+            self._status.update(kwargs)
+
+    def run(self, sample_size: int = None) -> Optional[Dict]:
+        """执行全局SHAP计算（在后台任务中调用）"""
+        cfg = rec_config.get("explainability.global_shap", {}) or {}
+        sample_size = sample_size or cfg.get("sample_size", 2000)
+        chunk_size = cfg.get("chunk_size", 200)
+        n_workers = cfg.get("n_workers", 4)
+        rng = np.random.default_rng(cfg.get("random_state", 42))
+
+        # 固定本次计算使用的模型引用，避免计算期间模型切换导致版本错配
+        model = get_model()
+        model_version = model.version
+        self._update_status(state="running", model_version=model_version, progress=0.0, error=None)
+        started = time.time()
+
+        db = SessionLocal()
+        try:
+            if model.model is None or not hasattr(model.model, 'classes_'):
+                raise ValueError("模型未训练，无法计算SHAP值")
+
+            X_raw = self._draw_stratified_sample(db, sample_size, rng)
+            if len(X_raw) == 0:
+                raise ValueError("没有可用的用户画像或活动样本")
+
+            X = model.transform_features(X_raw)
+            mean_shap = compute_mean_abs_shap(
+                model.model,
+                X,
+                chunk_size=chunk_size,
+                n_workers=n_workers,
+                progress_callback=lambda done, total: self._update_status(progress=round(done / total, 4))
+            )
+
+            explainer = SHAPExplainer()
+            feature_names = model.input_feature_names()
+            result = {
+                "model_version": model_version,
+                "computed_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "sample_size": int(len(X_raw)),
+                "duration_seconds": round(time.time() - started, 2),
+                "feature_names": feature_names,
+                "features": explainer.format_global_importance(mean_shap, feature_names)["features"],
+            }
+            self._save(model_version, result)
+            self._update_status(state="completed", progress=1.0)
+            logger.info(f"全局SHAP重要性计算完成: 版本 {model_version}, 样本 {len(X_raw)}, 耗时 {result['duration_seconds']}s")
+            return result
+        except Exception as e:
+            logger.error(f"全局SHAP重要性计算失败: {e}")
+            self._update_status(state="failed", error=str(e))
+            return None
+        finally:
+            db.close()
+
+    def _save(self, model_version: str, result: Dict):
+        """保存结果到内存与文件"""
+        self._results[model_version] = result
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self._cache_path(model_version), 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.warning(f"保存全局SHAP缓存失败: {e}")
+
+    def _draw_stratified_sample(self, db: Session, sample_size: int, rng: np.random.Generator) -> np.ndarray:
+        """按（用户聚类 × 活动类型）分层抽样，返回原始特征矩阵 (n, 9)
+
+        各层样本数与该层的组合总数成正比，每层至少抽取1条；
+        总体组合数不超过 sample_size 时直接使用全量笛卡尔积。
+        """
+        profile_rows = db.query(
+            UserProfile.cluster_id,
+            UserProfile.factor_social,
+            UserProfile.factor_psych,
+            UserProfile.factor_incent,
+            UserProfile.factor_tech,
+            UserProfile.factor_env,
+            UserProfile.factor_personal
+        ).all()
+
+        activities = db.query(Activity).filter(Activity.status == "active").all()
+        if not activities:
+            activities = db.query(Activity).all()
+
+        if not profile_rows or not activities:
+            return np.empty((0, 9))
+
+        user_matrix = np.array([user_factor_vector(row[1:]) for row in profile_rows])
+        activity_matrix = np.array([
+            activity_feature_vector(a.incentive_amount, a.incentive_type, a.type)
+            for a in activities
+        ])
+
+        user_strata = self._group_indices([row[0] or 0 for row in profile_rows])
+        activity_strata = self._group_indices([a.type or "unknown" for a in activities])
+        population = len(profile_rows) * len(activities)
+
+        pairs: List[np.ndarray] = []
+        for u_idx in user_strata.values():
+            for a_idx in activity_strata.values():
+                stratum_size = len(u_idx) * len(a_idx)
+                if population <= sample_size:
+                    k = stratum_size
+                else:
+                    k = min(stratum_size, max(1, int(round(sample_size * stratum_size / population))))
+
+                if k == stratum_size:
+                    uu, aa = np.meshgrid(u_idx, a_idx, indexing='ij')
+                    pairs.append(np.column_stack([uu.ravel(), aa.ravel()]))
+                else:
+                    flat = rng.choice(stratum_size, size=k, replace=False)
+                    pairs.append(np.column_stack([u_idx[flat // len(a_idx)], a_idx[flat % len(a_idx)]]))
+
+        pair_idx = np.concatenate(pairs)
+        return np.hstack([user_matrix[pair_idx[:, 0]], activity_matrix[pair_idx[:, 1]]])
+
+    @staticmethod
+    def _group_indices(keys: List) -> Dict:
+        """按键分组，返回 {键: 下标数组}"""
+        groups: Dict = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(key, []).append(i)
+        return {k: np.array(v) for k, v in groups.items()}
+
+
+importance_service = GlobalImportanceService()
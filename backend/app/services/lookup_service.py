@@ -0,0 +1,222 @@
+"""
+分数查找表服务
+文件名：app/services/lookup_service.py
+
+inference.lookup_table.enabled 开启后，为（线上模型版本 × 活动特征组合集合）
+在后台构建分数查找表，构建完成前及构建失败时推荐仍使用精确模型打分。
+模型切换或活动目录的特征组合变化后自动重建；同一组合的表文件可跨进程、跨重启复用。
+切换到新表后只删除本进程写入的旧表文件，其它 worker 正在使用的表不受影响。
+
+表大小为 组合数 × (1/step+1)^6 格：step=0.1 时每个组合约177万格（约7MB），
+step=0.05 时每个组合约8580万格（约340MB），超过默认 max_cells（5000万格），需同时调大 max_cells 才会构建。
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+import numpy as np
+
+from app.config import settings
+from app.config_loader import rec_config
+from app.ml.lookup import N_DIMS, ScoreLookupTable, error_report, grid_points
+from app.services.catalog_service import catalog_service
+from app.utils.logger import logger
+
+
+def _dedup_scorer(model):
+    """网格点经特征对齐后常出现重复的模型输入（如三因子模型对因子两两平均），只对不同输入打分"""
+    def score(X: np.ndarray) -> np.ndarray:
+        if model.model is None:
+            return model.score_batch(X)
+        unique, inverse = np.unique(model.transform_features(X), axis=0, return_inverse=True)
+        return model.score_batch(unique)[inverse.reshape(-1)]
+    return score
+
+
+class LookupTableService:
+    """查找表的后台构建、加载与自动重建"""
+
+    def __init__(self, table_dir: str = None):
+        self.table_dir = table_dir or os.path.join(settings.DATA_DIR, "lookup_tables")
+        self._lock = threading.Lock()
+        self._table: Optional[ScoreLookupTable] = None
+        self._table_key: Optional[str] = None
+        self._building_key: Optional[str] = None
+        # 最近一次请求的表（模型版本 × 特征组合）；先启动的旧构建晚完成时不得覆盖它
+        self._target_key: Optional[str] = None
+        self._failed_key: Optional[str] = None
+        # 本进程写入过的表（切换后只清理这些文件）
+        self._written_keys: Set[str] = set()
+        self._status: Dict[str, Any] = {
+            "state": "idle",  # idle / building / ready / failed
+            "key": None,
+            "progress": 0.0,
+            "report": None,
+            "error": None,
+            "built_at": None,
+        }
+
+    @staticmethod
+    def config() -> Dict[str, Any]:
+        return rec_config.get("inference.lookup_table", {}) or {}
+
+    def enabled(self) -> bool:
+        return bool(self.config().get("enabled", False))
+
+    @staticmethod
+    def table_key(model_version: str, feature_key: str, step: float) -> str:
+        return f"{model_version}-{feature_key}-s{step:g}"
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._status)
+
+    def _update_status(self, **kwargs):
+        with self._lock:
+            self._status.update(kwargs)
+
+    # ============ 线上读取 ============
+
+    def get_table(self, model, snapshot) -> Optional[ScoreLookupTable]:
+        """返回与当前模型、活动目录匹配的查找表；不匹配时触发后台重建并返回None"""
+        if not self.enabled() or len(snapshot) == 0:
+            return None
+        step = float(self.config().get("step", 0.1))
+        key = self.table_key(model.version, snapshot.feature_key, step)
+        if self._table_key == key:
+            return self._table
+        self.ensure(model, snapshot)
+        return None
+
+    # ============ 构建 ============
+
+    def ensure(self, model, snapshot, force: bool = False) -> bool:
+        """按需在后台线程中加载或构建查找表，已在构建同一张表时返回False"""
+        step = float(self.config().get("step", 0.1))
+        key = self.table_key(model.version, snapshot.feature_key, step)
+        with self._lock:
+            if self._building_key == key:
+                return False
+            if not force and key in (self._table_key, self._failed_key):
+                return False
+            self._building_key = self._target_key = key
+            self._status.update({"state": "building", "key": key, "progress": 0.0, "error": None})
+
+        threading.Thread(
+            target=self._build,
+            args=(model, snapshot.feature_tuples.copy(), step, key, force),
+            name="lookup-table-build",
+            daemon=True
+        ).start()
+        return True
+
+    def _build(self, model, feature_tuples: np.ndarray, step: float, key: str, force: bool):
+        cfg = self.config()
+        path = os.path.join(self.table_dir, f"{key}.npy")
+        meta_path = os.path.join(self.table_dir, f"{key}.json")
+        started = time.time()
+        try:
+            cells_per_tuple = grid_points(step) ** N_DIMS
+            cells = len(feature_tuples) * cells_per_tuple
+            max_cells = cfg.get("max_cells", 50_000_000)
+            if cells > max_cells:
+                raise ValueError(
+                    f"查找表规模 {cells}（{len(feature_tuples)} 个组合 × 每组合 {cells_per_tuple} 格）"
+                    f"超过上限 max_cells={max_cells}，请增大 step 或调大 max_cells"
+                )
+
+            os.makedirs(self.table_dir, exist_ok=True)
+            if not force and os.path.exists(path) and os.path.exists(meta_path):
+                # 其它进程或上次运行已构建过同一张表
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                table = ScoreLookupTable.load(path, np.array(meta["feature_tuples"]), step)
+            else:
+                table = ScoreLookupTable.build(
+                    _dedup_scorer(model), feature_tuples, step, path,
+                    chunk_rows=cfg.get("chunk_rows", 200_000),
+                    progress_callback=lambda p: self._update_progress(key, round(p * 0.95, 4))
+                )
+                meta = {
+                    "key": key,
+                    "model_version": model.version,
+                    "step": step,
+                    "feature_tuples": feature_tuples.tolist(),
+                    "built_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    "build_seconds": round(time.time() - started, 2),
+                    "size_bytes": os.path.getsize(path),
+                    "report": error_report(
+                        table, model.score_batch,
+                        n_users=cfg.get("report_users", 200),
+                        top_k=cfg.get("report_top_k", 10)
+                    ),
+                }
+                with open(meta_path, 'w', encoding='utf-8') as f:
+                    json.dump(meta, f, ensure_ascii=False, indent=2)
+                with self._lock:
+                    self._written_keys.add(key)
+
+            with self._lock:
+                if self._building_key == key:
+                    self._building_key = None
+                if key != self._target_key:
+                    logger.info(f"分数查找表 {key} 已过时（当前目标 {self._target_key}），丢弃构建结果")
+                    return
+                self._table, self._table_key = table, key
+                self._status.update({
+                    "state": "ready",
+                    "key": key,
+                    "progress": 1.0,
+                    "report": meta["report"],
+                    "built_at": meta["built_at"],
+                    "size_bytes": meta.get("size_bytes"),
+                })
+            self._remove_stale_files(keep=key)
+            logger.info(f"分数查找表已就绪: {key}, MAE {meta['report']['mae']:.4f}")
+        except Exception as e:
+            logger.error(f"分数查找表构建失败: {e}")
+            with self._lock:
+                if self._building_key == key:
+                    self._building_key = None
+                self._failed_key = key
+                if key == self._target_key:
+                    self._status.update({"state": "failed", "error": str(e)})
+
+    def _update_progress(self, key: str, progress: float):
+        with self._lock:
+            if key == self._target_key:
+                self._status["progress"] = progress
+
+    def _remove_stale_files(self, keep: str):
+        """删除本进程写入的其它表文件（共享目录中其它 worker 的表保留）"""
+        with self._lock:
+            stale = self._written_keys - {keep}
+            self._written_keys -= stale
+        for key in stale:
+            for ext in (".npy", ".json"):
+                try:
+                    os.remove(os.path.join(self.table_dir, key + ext))
+                except OSError:
+                    pass
+
+    # ============ 自动重建 ============
+
+    def on_model_changed(self):
+        """模型切换后重建"""
+        if self.enabled():
+            from app.ml.predict import get_model
+            self.ensure(get_model(), catalog_service.get_snapshot())
+
+    def on_catalog_changed(self, snapshot):
+        """活动目录的特征组合变化后重建"""
+        if self.enabled() and len(snapshot):
+            from app.ml.predict import get_model
+            self.ensure(get_model(), snapshot)
+
+
+lookup_service = LookupTableService()
+catalog_service.add_listener(lookup_service.on_catalog_changed)
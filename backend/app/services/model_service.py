@@ -0,0 +1,180 @@
+"""
+模型版本管理服务
+文件名：app/services/model_service.py
+
+负责在后台加载新版本模型（校验文件、构建解释器、预热），
+完成后原子替换线上模型引用，并支持回滚与多进程间的版本同步。
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.ml.predict import RecommenderModel, get_model, get_registry, swap_model
+from app.utils.logger import logger
+
+
+class ModelService:
+    """模型热切换与版本管理"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = {
+            "state": "idle",  # idle / loading / ready / failed
+            "target_version": None,
+            "error": None,
+        }
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._seen_active_mtime = 0.0
+
+    # ============ 查询 ============
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            return dict(self._status)
+
+    def list_versions(self) -> List[Dict]:
+        """列出注册中心中的版本，并标注当前线上版本"""
+        registry = get_registry()
+        serving_version = get_model().version
+        active_version = registry.get_active_version()
+        return [
+            {
+                "version": m["version"],
+                "created_at": m.get("created_at"),
+                "model_type": m.get("model_type"),
+                "metrics": m.get("metrics", {}),
+                "benchmark": m.get("benchmark"),
+                "is_active": m["version"] == active_version,
+                "is_serving": m["version"] == serving_version,
+            }
+            for m in registry.list_versions()
+        ]
+
+    # ============ 激活与回滚 ============
+
+    def begin_activation(self, version: str) -> bool:
+        """校验版本存在并标记为加载中；已有加载任务时返回False
+
+        Raises:
+            ValueError: 版本不存在
+        """
+        if get_registry().get_manifest(version) is None:
+            raise ValueError(f"模型版本不存在: {version}")
+        with self._lock:
+            if self._status["state"] == "loading":
+                return False
+            self._status = {"state": "loading", "target_version": version, "error": None}
+            return True
+
+    def activate(self, version: str, record_previous: bool = True, persist_active: bool = True) -> bool:
+        """加载并切换到指定版本（在后台任务中调用）
+
+        新模型在当前线程中完成加载、校验和预热，期间线上请求继续使用旧模型；
+        写入激活文件成功后才替换线上引用，写入失败时线上模型与激活版本都保持不变。
+        切换只是一次引用替换，进行中的请求持有旧实例直至完成。
+
+        Args:
+            version: 目标版本
+            record_previous: 是否把原激活版本记入回滚历史（回滚时为False）
+            persist_active: 是否写入激活文件（跟随其它进程切换时为False）
+        """
+        registry = get_registry()
+        with self._lock:
+            self._status = {"state": "loading", "target_version": version, "error": None}
+
+        try:
+            started = time.time()
+            new_model = RecommenderModel.from_registry(registry, version)
+            new_model.warm_up()
+
+            if persist_active:
+                registry.set_active(version, record_previous=record_previous)
+                self._seen_active_mtime = registry.active_mtime()
+            swap_model(new_model)
+        except Exception as e:
+            logger.error(f"模型版本 {version} 加载失败，继续使用当前模型: {e}")
+            with self._lock:
+                self._status = {"state": "failed", "target_version": version, "error": str(e)}
+            return False
+
+        try:
+            self._on_model_swapped()
+        except Exception as e:
+            # 新模型已上线，缓存清理失败只影响旧结果的过期速度
+            logger.warning(f"模型版本 {version} 切换后清理缓存失败: {e}")
+        with self._lock:
+            self._status = {"state": "ready", "target_version": version, "error": None}
+        logger.info(f"模型版本 {version} 已上线，加载耗时 {time.time() - started:.2f}s")
+        return True
+
+    def rollback(self) -> Optional[str]:
+        """回滚到上一个激活版本，返回回滚目标（无可回滚版本时返回None）
+
+        回滚目标只在切换成功、写入激活文件时才从历史中移除；加载冲突或失败时仍可再次回滚。
+        """
+        target = get_registry().peek_rollback_target()
+        if target is None:
+            return None
+        if not self.begin_activation(target):
+            raise RuntimeError("已有模型正在加载，请稍后重试")
+        threading.Thread(
+            target=self.activate,
+            args=(target,),
+            kwargs={"record_previous": False},
+            daemon=True
+        ).start()
+        return target
+
+    def _on_model_swapped(self):
+        """模型切换后清理依赖旧模型输出的缓存
+
+        用户的推荐排序不直接清空，而是标记为过期：请求先返回旧排序，由有界的后台队列逐步用新模型重算，
+        同时为最近活跃的用户预热。
+        """
+        from app.services.lookup_service import lookup_service
+        from app.services.prewarm_service import prewarm_service
+        from app.services.ranking_cache import ranking_cache
+        from app.services.recommendation_service import mark_recommendation_cache_stale
+        from app.services.shortlist_service import shortlist_service
+        mark_recommendation_cache_stale()
+        ranking_cache.clear()
+        lookup_service.on_model_changed()
+        shortlist_service.on_model_changed()
+        # 用新模型为最近活跃的用户重算排序
+        prewarm_service.start()
+
+    # ============ 多进程同步 ============
+
+    def start_watcher(self):
+        """启动后台线程轮询激活文件，其它进程切换版本后本进程自动跟进"""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._seen_active_mtime = get_registry().active_mtime()
+        self._stop_event.clear()
+        self._watcher = threading.Thread(target=self._watch_loop, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop_event.set()
+
+    def _watch_loop(self):
+        registry = get_registry()
+        while not self._stop_event.wait(settings.MODEL_REGISTRY_POLL_SECONDS):
+            try:
+                mtime = registry.active_mtime()
+                if mtime <= self._seen_active_mtime:
+                    continue
+                self._seen_active_mtime = mtime
+                version = registry.get_active_version()
+                if version and version != get_model().version and self.get_status()["state"] != "loading":
+                    logger.info(f"检测到激活版本变更: {version}，开始加载")
+                    # 版本已由其它进程记录为激活，这里只需加载
+                    self.activate(version, persist_active=False)
+            except Exception as e:
+                logger.warning(f"模型版本同步失败: {e}")
+
+
+model_service = ModelService()
@@ -0,0 +1,126 @@
+"""
+参与记录索引
+文件名：app/services/participation_service.py
+
+每个活动每个用户只能参与一次，推荐时需排除用户已参与的活动。启动时从 rewards 表
+一次性构建 用户ID → 升序活动ID数组（int32）的内存索引，participate_activity 成功后增量更新，
+排序阶段用二分查找对候选做向量化掩码，不再每个请求查询一次奖励表。
+多进程部署时其它进程的参与记录按 inference.participation_index.reload_seconds 定期全量重载同步。
+"""
+
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.config_loader import rec_config
+from app.database import SessionLocal
+from app.models import Reward
+from app.utils.logger import logger
+
+
+_EMPTY = np.empty(0, dtype=np.int32)
+
+
+def contains_sorted(sorted_ids: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """values 中每个元素是否在升序数组 sorted_ids 中（二分查找，O(n log m)）"""
+    if len(sorted_ids) == 0:
+        return np.zeros(len(values), dtype=bool)
+    i = np.minimum(np.searchsorted(sorted_ids, values), len(sorted_ids) - 1)
+    return sorted_ids[i] == values
+
+
+class ParticipationIndex:
+    """用户已参与活动的内存索引"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._index: Dict[int, np.ndarray] = {}
+        self._loaded_at: Optional[float] = None
+
+    @staticmethod
+    def config() -> Dict[str, Any]:
+        return rec_config.get("inference.participation_index", {}) or {}
+
+    def enabled(self) -> bool:
+        return bool(self.config().get("enabled", True))
+
+    def load(self, db: Session = None):
+        """从 rewards 表全量构建索引"""
+        own_session = db is None
+        db = db or SessionLocal()
+        started = time.time()
+        try:
+            rows = np.array(
+                db.query(Reward.user_id, Reward.activity_id).order_by(Reward.user_id, Reward.activity_id).all(),
+                dtype=np.int64
+            ).reshape(-1, 2)
+        finally:
+            if own_session:
+                db.close()
+
+        index: Dict[int, np.ndarray] = {}
+        if len(rows):
+            users, starts = np.unique(rows[:, 0], return_index=True)
+            for user_id, activity_ids in zip(users, np.split(rows[:, 1].astype(np.int32), starts[1:])):
+                index[int(user_id)] = np.unique(activity_ids)
+        with self._lock:
+            self._index = index
+            self._loaded_at = time.time()
+        logger.info(
+            f"参与记录索引已构建: {len(index)} 个用户, {len(rows)} 条记录, "
+            f"{self.get_stats()['memory_bytes'] / 1024:.1f} KB, 耗时 {time.time() - started:.2f}s"
+        )
+
+    def _ensure_loaded(self, db: Session = None):
+        reload_seconds = self.config().get("reload_seconds", 600)
+        if self._loaded_at is not None and time.time() - self._loaded_at <= reload_seconds:
+            return
+        # 已有索引时只由一个线程重载，其它线程继续使用旧索引
+        if not self._load_lock.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            if self._loaded_at is None or time.time() - self._loaded_at > reload_seconds:
+                self.load(db)
+        finally:
+            self._load_lock.release()
+
+    def add(self, user_id: int, activity_id: int):
+        """记录一次参与（数组整体替换，读取方无需加锁）"""
+        with self._lock:
+            current = self._index.get(user_id, _EMPTY)
+            i = int(np.searchsorted(current, activity_id))
+            if i < len(current) and current[i] == activity_id:
+                return
+            self._index[user_id] = np.insert(current, i, activity_id).astype(np.int32)
+
+    def get(self, user_id: int, db: Session = None) -> np.ndarray:
+        """用户已参与的活动ID（升序）"""
+        self._ensure_loaded(db)
+        return self._index.get(user_id, _EMPTY)
+
+    def mask(self, user_id: int, activity_ids: np.ndarray, db: Session = None) -> np.ndarray:
+        """activity_ids 中用户已参与的位置为True"""
+        return contains_sorted(self.get(user_id, db), activity_ids)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """索引规模与内存占用（数组数据 + 数组对象 + 字典本身）"""
+        index = self._index
+        entries = sum(len(a) for a in index.values())
+        memory = sys.getsizeof(index) + sum(
+            sys.getsizeof(a) + sys.getsizeof(user_id) for user_id, a in index.items()
+        )
+        return {
+            "users": len(index),
+            "entries": entries,
+            "memory_bytes": memory,
+            "data_bytes": entries * np.dtype(np.int32).itemsize,
+            "loaded_at": self._loaded_at,
+        }
+
+
+participation_index = ParticipationIndex()
@@ -0,0 +1,261 @@
+"""
+活动热度服务
+文件名：app/services/popularity_service.py
+
+按活动维护指数衰减的曝光、点击、参与计数：推荐展示、反馈接口与 participate_activity
+在内存中增量更新，后台线程按 inference.popularity.persist_seconds 定期写入
+data/popularity.json，重启后恢复（文件不存在时从 recommendations / rewards 表回填一次）。
+
+计数采用前向衰减：时刻 t 的事件按 exp(λ·(t − t0)) 加权累加，读取时统一乘以 exp(−λ·(t − t0))，
+每次更新 O(1)，无需逐个衰减全部计数。热度 = Σ 事件权重 × 衰减计数。
+冷启动推荐返回与活动目录快照对齐、预先计算的 Top-N，不查询数据库。
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.config_loader import rec_config
+from app.database import SessionLocal
+from app.ml.ranking import top_k
+from app.models import Recommendation, Reward
+from app.utils.logger import logger
+
+
+EVENTS = ("impression", "click", "participation")
+
+# 衰减指数超过该值时把计数折算到新的参考时刻，避免权重溢出
+_RESCALE_EXPONENT = 50.0
+
+
+class PopularityService:
+    """指数衰减的活动热度计数与冷启动 Top-N"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(settings.DATA_DIR, "popularity.json")
+        self._lock = threading.Lock()
+        self._counts: Dict[int, np.ndarray] = {}
+        self._t0 = time.time()
+        self._loaded = False
+        self._revision = 0
+        self._persisted_revision = 0
+        # 预计算的 Top-N：(目录版本, 计数版本, 计算时间, 展示字段列表)
+        self._top = (None, None, 0.0, [])
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def config() -> Dict[str, Any]:
+        return rec_config.get("inference.popularity", {}) or {}
+
+    def _rate(self) -> float:
+        """衰减速率 λ（每秒）"""
+        return math.log(2) / (self.config().get("half_life_hours", 72) * 3600)
+
+    def _weights(self) -> np.ndarray:
+        weights = self.config().get("weights", {}) or {}
+        return np.array([float(weights.get(event, 0.0)) for event in EVENTS])
+
+    # ============ 计数更新 ============
+
+    def record(self, activity_id: int, event: str, count: float = 1.0, at: Optional[float] = None):
+        """记录一次事件（event 取 impression / click / participation）"""
+        self.record_many([activity_id], event, count, at)
+
+    def record_many(self, activity_ids: Iterable[int], event: str, count: float = 1.0, at: Optional[float] = None):
+        self._ensure_loaded()
+        column = EVENTS.index(event)
+        at = time.time() if at is None else at
+        rate = self._rate()
+        with self._lock:
+            if rate * (at - self._t0) > _RESCALE_EXPONENT:
+                self._rescale(at, rate)
+            weight = count * math.exp(rate * (at - self._t0))
+            for activity_id in activity_ids:
+                counts = self._counts.get(int(activity_id))
+                if counts is None:
+                    counts = self._counts[int(activity_id)] = np.zeros(len(EVENTS))
+                counts[column] += weight
+            self._revision += 1
+
+    def _rescale(self, t0: float, rate: float):
+        factor = math.exp(-rate * (t0 - self._t0))
+        for counts in self._counts.values():
+            counts *= factor
+        self._t0 = t0
+
+    # ============ 读取 ============
+
+    def counts(self, now: Optional[float] = None) -> Dict[int, np.ndarray]:
+        """各活动当前的衰减计数（曝光、点击、参与）"""
+        self._ensure_loaded()
+        now = time.time() if now is None else now
+        with self._lock:
+            factor = math.exp(-self._rate() * (now - self._t0))
+            return {activity_id: counts * factor for activity_id, counts in self._counts.items()}
+
+    def scores(self, now: Optional[float] = None) -> Dict[int, float]:
+        """活动ID → 热度"""
+        weights = self._weights()
+        return {activity_id: float(counts @ weights) for activity_id, counts in self.counts(now).items()}
+
+    def scores_for(self, snapshot) -> np.ndarray:
+        """与目录快照对齐的热度数组"""
+        scores = self.scores()
+        return np.array([scores.get(int(i), 0.0) for i in snapshot.ids])
+
+    def top(self, snapshot, limit: int) -> List[Dict]:
+        """冷启动推荐：目录中热度最高的活动（同热度按目录顺序）
+
+        Top-N 按 inference.popularity.refresh_seconds 重新计算，期间计数的更新不会逐次触发排序。
+        """
+        cfg = self.config()
+        top_n = max(limit, cfg.get("top_n", 50))
+        version, revision, computed_at, items = self._top
+        stale = revision != self._revision and time.time() - computed_at > cfg.get("refresh_seconds", 30)
+        if version != snapshot.version or stale or len(items) < min(top_n, len(snapshot)):
+            items = self._compute_top(snapshot, top_n)
+        return [dict(item) for item in items[:limit]]
+
+    def _compute_top(self, snapshot, top_n: int) -> List[Dict]:
+        revision = self._revision
+        popularity = self.scores_for(snapshot)
+        order = top_k(popularity, top_n)
+        peak = float(popularity[order[0]]) if len(order) else 0.0
+        items = []
+        for i in order:
+            activity = snapshot.activities[i]
+            items.append({
+                "activity_id": activity["activity_id"],
+                "title": activity["title"],
+                "description": activity["description"],
+                "activity_type": activity["activity_type"],
+                "incentive_type": activity["incentive_type"],
+                "incentive_amount": activity["incentive_amount"],
+                # 展示分数为相对热度（最热门为1），尚无任何热度数据时为默认分数
+                "score": round(float(popularity[i]) / peak, 4) if peak > 0 else 0.5,
+                "reason": "热门活动推荐",
+            })
+        self._top = (snapshot.version, revision, time.time(), items)
+        return items
+
+    # ============ 持久化 ============
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if self._loaded:
+                    return
+                self._loaded = True
+            try:
+                self.load()
+            except Exception as e:
+                logger.warning(f"活动热度加载失败，从零开始计数: {e}")
+
+    def load(self, db: Session = None):
+        """从持久化文件恢复计数；文件不存在或半衰期已修改时从数据库回填"""
+        self._loaded = True
+        half_life = self.config().get("half_life_hours", 72)
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("half_life_hours") == half_life:
+                with self._lock:
+                    self._t0 = float(data["t0"])
+                    self._counts = {int(k): np.array(v, dtype=float) for k, v in data["counts"].items()}
+                    self._revision += 1
+                    self._persisted_revision = self._revision
+                logger.info(f"活动热度已恢复: {len(self._counts)} 个活动")
+                return
+        self.bootstrap(db)
+
+    def bootstrap(self, db: Session = None):
+        """从 recommendations / rewards 表回填最近 bootstrap_days 天的事件（按天聚合）"""
+        own_session = db is None
+        db = db or SessionLocal()
+        since = datetime.now() - timedelta(days=self.config().get("bootstrap_days", 30))
+        try:
+            day = func.date(Recommendation.created_at)
+            impressions = db.query(
+                Recommendation.activity_id, day, func.count(Recommendation.id), func.sum(Recommendation.is_clicked)
+            ).filter(Recommendation.created_at >= since).group_by(Recommendation.activity_id, day).all()
+            day = func.date(Reward.created_at)
+            participations = db.query(
+                Reward.activity_id, day, func.count(Reward.id)
+            ).filter(Reward.created_at >= since).group_by(Reward.activity_id, day).all()
+        finally:
+            if own_session:
+                db.close()
+
+        with self._lock:
+            self._counts = {}
+            self._t0 = time.time()
+        for activity_id, day, shown, clicked in impressions:
+            at = self._day_timestamp(day)
+            self.record(activity_id, "impression", float(shown), at)
+            if clicked:
+                self.record(activity_id, "click", float(clicked), at)
+        for activity_id, day, count in participations:
+            self.record(activity_id, "participation", float(count), self._day_timestamp(day))
+        logger.info(f"活动热度已从数据库回填: {len(self._counts)} 个活动")
+
+    @staticmethod
+    def _day_timestamp(day) -> float:
+        if isinstance(day, str):
+            day = datetime.strptime(day, "%Y-%m-%d")
+        if day is None:
+            return time.time()
+        return datetime(day.year, day.month, day.day).timestamp()
+
+    def persist(self):
+        """计数有变化时写入持久化文件"""
+        with self._lock:
+            revision = self._revision
+            if revision == self._persisted_revision:
+                return
+            data = {
+                "t0": self._t0,
+                "half_life_hours": self.config().get("half_life_hours", 72),
+                "counts": {str(k): v.tolist() for k, v in self._counts.items()},
+            }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+        self._persisted_revision = revision
+
+    def start(self):
+        """加载计数并启动定期持久化线程"""
+        self._ensure_loaded()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._persist_loop, name="popularity-persist", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        try:
+            self.persist()
+        except Exception as e:
+            logger.warning(f"活动热度保存失败: {e}")
+
+    def _persist_loop(self):
+        while not self._stop_event.wait(self.config().get("persist_seconds", 60)):
+            try:
+                self.persist()
+            except Exception as e:
+                logger.warning(f"活动热度保存失败: {e}")
+
+
+popularity_service = PopularityService()
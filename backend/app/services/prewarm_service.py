@@ -0,0 +1,158 @@
+"""
+推荐缓存预热
+文件名：app/services/prewarm_service.py
+
+进程启动或模型切换后缓存为空，最初一段时间的请求都要走完整的召回打分流程。
+预热任务从 recommendations.created_at 读取最近活跃的用户，分批读取画像：每批先把不同的
+因子向量 × 目录中全部活动特征组合拼成一个矩阵，一次批量预测写入跨用户排序缓存，
+再为每个用户排序并写入推荐缓存。用户数（max_users）、单次预测行数（max_rows_per_call）
+与总耗时（max_seconds）均有上限。就绪检查在预热完成前返回未就绪。
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import numpy as np
+from sqlalchemy import desc, func
+
+from app.config_loader import rec_config
+from app.database import SessionLocal
+from app.ml.features import combine_features, user_factor_vector
+from app.ml.predict import get_model
+from app.models import Recommendation, UserProfile
+from app.services.catalog_service import catalog_service
+from app.services.ranking_cache import canonical_factors, ranking_cache
+from app.utils.logger import logger
+
+
+FACTOR_COLUMNS = (
+    "factor_social", "factor_psych", "factor_incent", "factor_tech", "factor_env", "factor_personal"
+)
+
+
+class PrewarmService:
+    """最近活跃用户的推荐缓存预热"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = {
+            "state": "idle",  # idle / running / completed / failed / disabled
+            "model_version": None,
+            "total": 0,
+            "done": 0,
+            "progress": 0.0,
+            "truncated": False,
+            "duration_seconds": None,
+            "error": None,
+        }
+        # 启动后的首次预热是否已结束（之后模型切换触发的预热不影响就绪状态）
+        self._initial_done = False
+
+    @staticmethod
+    def config() -> Dict:
+        return rec_config.get("inference.prewarm", {}) or {}
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            return dict(self._status)
+
+    def _update_status(self, **kwargs):
+        with self._lock:
+            self._status.update(kwargs)
+
+    def initial_done(self) -> bool:
+        """启动后的首次预热是否已结束（完成、失败或未启用）"""
+        return self._initial_done
+
+    def start(self) -> bool:
+        """在后台线程中执行预热，已在执行时返回False"""
+        if not self.config().get("enabled", True):
+            self._update_status(state="disabled")
+            self._initial_done = True
+            return False
+        with self._lock:
+            if self._status["state"] == "running":
+                return False
+            self._status.update(state="running", total=0, done=0, progress=0.0, truncated=False, error=None)
+        threading.Thread(target=self.run, name="recommendation-prewarm", daemon=True).start()
+        return True
+
+    def run(self):
+        """执行预热（固定本次使用的模型实例）"""
+        from app.services.recommendation_service import recommendation_service
+
+        cfg = self.config()
+        model = get_model()
+        started = time.time()
+        deadline = started + cfg.get("max_seconds", 60)
+        self._update_status(state="running", model_version=model.version)
+        db = SessionLocal()
+        try:
+            snapshot = catalog_service.get_snapshot(db)
+            user_ids = self._recent_user_ids(db, cfg)
+            self._update_status(total=len(user_ids))
+            done, truncated = 0, False
+            batch_size = cfg.get("batch_size", 200)
+            for start in range(0, len(user_ids), batch_size):
+                if time.time() >= deadline:
+                    truncated = True
+                    break
+                profiles = db.query(UserProfile).filter(
+                    UserProfile.user_id.in_(user_ids[start:start + batch_size])
+                ).all()
+                self._score_batch(model, snapshot, profiles, cfg)
+                for profile in profiles:
+                    if time.time() >= deadline:
+                        truncated = True
+                        break
+                    recommendation_service.prewarm_user(db, profile, model)
+                    done += 1
+                self._update_status(done=done, progress=round(done / len(user_ids), 4))
+                if truncated:
+                    break
+            duration = round(time.time() - started, 2)
+            self._update_status(state="completed", truncated=truncated, duration_seconds=duration)
+            logger.info(
+                f"推荐缓存预热完成: 模型 {model.version}, {done}/{len(user_ids)} 个用户, "
+                f"耗时 {duration}s{'（已达时间上限）' if truncated else ''}"
+            )
+        except Exception as e:
+            logger.error(f"推荐缓存预热失败: {e}")
+            self._update_status(state="failed", error=str(e), duration_seconds=round(time.time() - started, 2))
+        finally:
+            db.close()
+            self._initial_done = True
+
+    @staticmethod
+    def _recent_user_ids(db, cfg: Dict) -> List[int]:
+        """最近 lookback_hours 内有推荐记录的用户（按最近一次推荐时间倒序，至多 max_users 个）"""
+        since = datetime.now() - timedelta(hours=cfg.get("lookback_hours", 24))
+        last_seen = func.max(Recommendation.created_at)
+        rows = db.query(Recommendation.user_id, last_seen).filter(
+            Recommendation.created_at >= since
+        ).group_by(Recommendation.user_id).order_by(desc(last_seen)).limit(cfg.get("max_users", 2000)).all()
+        return [user_id for user_id, _ in rows]
+
+    @staticmethod
+    def _score_batch(model, snapshot, profiles: List[UserProfile], cfg: Dict):
+        """一批用户中不同的因子向量 × 全部活动特征组合，分块批量预测后写入跨用户排序缓存"""
+        if not ranking_cache.enabled() or not profiles or len(snapshot.feature_tuples) == 0:
+            return
+        decimals = ranking_cache.config().get("decimals", 4)
+        vectors = np.unique(np.array([
+            canonical_factors(user_factor_vector(getattr(p, c) for c in FACTOR_COLUMNS), decimals)
+            for p in profiles
+        ]), axis=0)
+        tuples = snapshot.feature_tuples
+        per_call = max(1, cfg.get("max_rows_per_call", 20000) // len(tuples))
+        for start in range(0, len(vectors), per_call):
+            chunk = vectors[start:start + per_call]
+            X = np.vstack([combine_features(vector, tuples) for vector in chunk])
+            scores = model.score_batch(X).reshape(len(chunk), len(tuples))
+            for vector, row in zip(chunk, scores):
+                ranking_cache.put(model, snapshot, vector, row)
+
+
+prewarm_service = PrewarmService()
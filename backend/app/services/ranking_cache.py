@@ -0,0 +1,99 @@
+"""
+跨用户排序缓存
+文件名：app/services/ranking_cache.py
+
+新用户的因子均为0.5，问卷因子是若干个1~5分答案之和除以固定分母，大量用户的因子向量完全相同。
+模型分数只取决于用户因子与活动特征组合，因此按（模型版本, 活动目录版本, 规范化因子向量）
+缓存该向量对目录中各活动特征组合的分数：同一因子向量的用户共享分数，按需补算未命中的组合。
+已参与活动、偏好等用户相关的过滤在取得分数之后进行。
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+import numpy as np
+
+from app.config_loader import rec_config
+
+
+def canonical_factors(user_vector: np.ndarray, decimals: int) -> np.ndarray:
+    """规范化因子向量：按小数位数取整，几乎相同的向量映射到同一个键"""
+    return np.round(np.asarray(user_vector, dtype=float), decimals) + 0.0  # +0.0 消除 -0.0
+
+
+class RankingCache:
+    """规范化因子向量 → 各活动特征组合的分数（LRU）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "rows_scored": 0, "evictions": 0}
+
+    @staticmethod
+    def config() -> Dict[str, Any]:
+        return rec_config.get("inference.ranking_cache", {}) or {}
+
+    def enabled(self) -> bool:
+        return bool(self.config().get("enabled", False))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def scores(
+        self,
+        model,
+        snapshot,
+        user_vector: np.ndarray,
+        positions: np.ndarray,
+        score_tuples: Callable[[np.ndarray, np.ndarray], np.ndarray]
+    ) -> np.ndarray:
+        """候选活动（目录快照下标）的分数
+
+        Args:
+            score_tuples: (规范化因子向量, 活动特征组合下标) → 分数，只对缓存中缺少的组合调用
+        """
+        vector = canonical_factors(user_vector, self.config().get("decimals", 4))
+        entry = self._entry(model, snapshot, vector)
+
+        rows = snapshot.tuple_index[positions]
+        missing = np.unique(rows[np.isnan(entry[rows])])
+        with self._lock:
+            self._stats["hits" if len(missing) == 0 else "misses"] += 1
+            self._stats["rows_scored"] += len(missing)
+        if len(missing):
+            # 并发补算同一组合只会重复计算，写入的值相同
+            entry[missing] = score_tuples(vector, missing)
+        return entry[rows]
+
+    def put(self, model, snapshot, user_vector: np.ndarray, tuple_scores: np.ndarray):
+        """写入因子向量对目录全部活动特征组合的分数（预热时批量计算后调用）"""
+        vector = canonical_factors(user_vector, self.config().get("decimals", 4))
+        self._entry(model, snapshot, vector)[:] = tuple_scores
+
+    def _entry(self, model, snapshot, vector: np.ndarray) -> np.ndarray:
+        """取出（不存在时创建）缓存条目并标记为最近使用"""
+        key = (model.version, snapshot.version, vector.tobytes())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = np.full(len(snapshot.feature_tuples), np.nan)
+                self._entries[key] = entry
+                while len(self._entries) > self.config().get("max_entries", 10000):
+                    self._entries.popitem(last=False)
+                    self._stats["evictions"] += 1
+            else:
+                self._entries.move_to_end(key)
+        return entry
+
+
+ranking_cache = RankingCache()
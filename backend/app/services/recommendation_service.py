@@ -4,51 +4,144 @@
 """
 
 import numpy as np
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, func
 from datetime import datetime, timedelta
 from functools import lru_cache
+from types import SimpleNamespace
+import base64
 import hashlib
+import json
 import time
-import random
+import uuid
 
-from app.models import Activity, Recommendation, UserProfile
+from app.models import Activity, Recommendation, Reward, UserProfile
+from app.config_loader import rec_config
+from app.database import SessionLocal
 from app.ml.predict import get_model
+from app.ml.features import (
+    combine_features, encode_activity_type, encode_incentive_type, features_to_vector,
+    matches_preference, preference_mask, user_factor_vector
+)
+from app.ml.batching import micro_batcher
+from app.ml.ranking import diversity_codes, mmr_rerank, sample_head, top_k
 from app.ml.explainer import SHAPExplainer
+from app.services.catalog_service import catalog_service
+from app.services.lookup_service import lookup_service
+from app.services.participation_service import contains_sorted, participation_index
+from app.services.popularity_service import popularity_service
+from app.services.ranking_cache import ranking_cache
+from app.services.retrieval_service import retrieval_service
+from app.services.shortlist_service import shortlist_service
+from app.services.strategy_service import strategy_service
+from app.utils.deadline import Deadline, DeadlineExceeded, run_in_worker, statement_timeout
 from app.utils.logger import logger
+from app.utils.metrics import serving_metrics
+from app.utils.refresh_queue import RefreshQueue
+from app.utils.singleflight import SingleFlight
 
 
-# 简单内存缓存
-_recommendation_cache: Dict[str, tuple] = {}
-CACHE_TTL = 60  # 缓存60秒
+# 同一用户并发的排序计算合并为一次
+ranking_flight = SingleFlight("recommendations")
+
+# 简单内存缓存：rec_{user_id} → {排序版本: (UserRanking, 缓存时间)}，最后插入的是当前排序
+_recommendation_cache: Dict[str, Dict[str, tuple]] = {}
+CACHE_TTL = 60  # 缓存60秒，之后在 inference.cache.max_stale_seconds 内先返回旧排序再后台刷新
+MAX_RANKINGS_PER_USER = 5  # 刷新后旧排序仍保留，正在翻页的游标不失效
+
+# 首页请求的缓存命中情况：hit 未过期，stale_hit 已过期但在最大陈旧时间内，miss 同步计算
+_cache_stats = {"hit": 0, "stale_hit": 0, "miss": 0}
 
 
 def clear_recommendation_cache(user_id: int = None):
     """清除推荐缓存"""
     global _recommendation_cache
     if user_id:
-        keys_to_remove = [k for k in _recommendation_cache if k.startswith(f"rec_{user_id}_")]
-        for k in keys_to_remove:
-            del _recommendation_cache[k]
+        _recommendation_cache.pop(f"rec_{user_id}", None)
     else:
         _recommendation_cache.clear()
 
 
+def mark_recommendation_cache_stale():
+    """把全部缓存排序标记为已过期（模型切换后使用）：请求先返回旧排序，由后台队列逐步刷新，避免同时重算"""
+    stale_at = time.time() - CACHE_TTL
+    for key, rankings in list(_recommendation_cache.items()):
+        _recommendation_cache[key] = {
+            version: (ranking, min(cached_at, stale_at)) for version, (ranking, cached_at) in rankings.items()
+        }
+
+
+def max_stale_seconds() -> float:
+    """缓存排序可被返回的最长时间（超过后请求同步重算）"""
+    return max(CACHE_TTL, rec_config.get("inference.cache.max_stale_seconds", 300))
+
+
+def encode_cursor(version: str, offset: int) -> str:
+    """生成翻页游标（对客户端不透明）"""
+    payload = json.dumps({"v": version, "o": offset}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """解析翻页游标，返回 (排序版本, 偏移量)"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        version, offset = str(payload["v"]), int(payload["o"])
+    except Exception:
+        raise ValueError("无效的翻页游标")
+    if offset < 0:
+        raise ValueError("无效的翻页游标")
+    return version, offset
+
+
+class UserRanking:
+    """用户的完整推荐排序（翻页与刷新都在其上切片，不重新打分）"""
+
+    def __init__(
+        self, snapshot, factors: SimpleNamespace, positions: np.ndarray, scores: np.ndarray, tier: str = "model"
+    ):
+        self.version = uuid.uuid4().hex[:12]
+        self.snapshot = snapshot
+        self.factors = factors
+        self.positions = positions
+        self.scores = scores
+        # 生成该排序的服务层级：model，或超时降级的 cached / shortlist / rule
+        self.tier = tier
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def reshuffled(self, limit: int) -> "UserRanking":
+        """新排序：从前 3*limit 名中随机选 limit 个排在最前（保持原有先后），其余按原顺序"""
+        head = sample_head(len(self), limit, pool=limit * 3)
+        order = np.concatenate([head, np.setdiff1d(np.arange(len(self)), head)])
+        return UserRanking(self.snapshot, self.factors, self.positions[order], self.scores[order], self.tier)
+
+
 class RecommendationService:
     """推荐服务类"""
     
     def __init__(self):
-        # 使用全局模型实例（已加载预训练模型）
-        self.model = get_model()
-        self.explainer = SHAPExplainer()
-        # 尝试拟合解释器
-        try:
-            if self.model.model is not None:
-                self.explainer.fit(self.model.model)
-                logger.info("✅ 推荐服务已使用预训练模型初始化")
-        except Exception as e:
-            logger.warning(f"SHAP解释器初始化失败: {e}")
+        # 使用全局模型实例（已加载预训练模型），并预先构建解释器
+        get_model().warm_up()
+        # 过期排序的后台刷新（按 (用户ID, 条数) 去重）
+        cfg = rec_config.get("inference.cache.refresh", {}) or {}
+        self.refresher = RefreshQueue(
+            self._refresh_ranking, "ranking-refresh",
+            max_size=cfg.get("queue_size", 256), workers=cfg.get("workers", 2)
+        )
+        logger.info("✅ 推荐服务已使用预训练模型初始化")
+    
+    @property
+    def model(self):
+        """当前线上模型（模型热切换后自动指向新版本）"""
+        return get_model()
+    
+    @property
+    def explainer(self) -> SHAPExplainer:
+        """与当前线上模型绑定的SHAP解释器"""
+        return self.model.get_explainer()
     
     def calculate_factor_scores(self, answers: List[int]) -> Dict[str, float]:
         """
@@ -86,121 +179,401 @@ class RecommendationService:
         limit: int = 10,
         refresh: bool = False
     ) -> List[Dict]:
-        """获取个性化推荐列表"""
+        """获取个性化推荐列表（推荐流的第一页）"""
+        return self.get_feed(db, user_id, limit, refresh=refresh)["items"]
+    
+    def get_feed(
+        self,
+        db: Session,
+        user_id: int,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        refresh: bool = False,
+        deadline: Optional[Deadline] = None
+    ) -> Dict:
+        """
+        分页获取推荐流
+        
+        首次请求计算并缓存用户的完整排序，不同 limit 与后续翻页都从同一排序切片；
+        游标携带排序版本，翻页期间排序不变。刷新时在缓存的排序内重新洗牌，不重新打分。
+        缓存排序超过 CACHE_TTL 后仍在 inference.cache.max_stale_seconds 内时直接返回（stale），并提交后台刷新。
+        请求受 inference.timeout.total_request_ms 约束，超时按 缓存 → 聚类短名单 → 规则评分 → 热门活动 降级，
+        实际使用的层级记录在返回值的 serving_tier 中。
+        
+        Raises:
+            ValueError: 游标无效或对应的排序已过期
+        """
+        deadline = deadline or Deadline.from_config()
+        tier = "cached"
+        if cursor and not refresh:
+            version, offset = decode_cursor(cursor)
+            ranking = self._cached_ranking(user_id, version, max_age=max_stale_seconds())
+            if ranking is None:
+                raise ValueError("推荐列表已更新，请从第一页重新加载")
+        else:
+            offset = 0
+            ranking = self._cached_ranking(user_id, max_age=max_stale_seconds())
+            if ranking is not None and self._ranking_age(user_id, ranking) >= CACHE_TTL:
+                # 已过期但未超过最大陈旧时间：先返回旧排序，后台刷新
+                tier = "stale"
+                self.refresher.enqueue((user_id, limit))
+            _cache_stats["miss" if ranking is None else "stale_hit" if tier == "stale" else "hit"] += 1
+            if ranking is not None and not refresh:
+                logger.info(f"用户 {user_id} 使用缓存推荐 ({tier})")
+            else:
+                if ranking is None:
+                    ranking, tier = self._coalesced_ranking(db, user_id, limit, deadline)
+                    if ranking is None:
+                        items = self._get_popular_activities(db, limit)
+                        popularity_service.record_many([item["activity_id"] for item in items], "impression")
+                        serving_metrics.record("recommendations", "popularity", deadline.elapsed_ms())
+                        return {"items": items, "next_cursor": None, "ranking_version": None, "serving_tier": "popularity"}
+                if refresh:
+                    # 如果是刷新，增加随机性：从前 3*limit 名中随机选择
+                    reshuffled = ranking.reshuffled(limit)
+                    if tier == "stale" or ranking.tier != "model":
+                        # 由旧排序洗牌得到，只供翻页使用，下次请求不复用
+                        reshuffled.tier = "cached"
+                    ranking = reshuffled
+                    self._store_ranking(user_id, ranking)
+                elif tier != "cached":
+                    self._store_ranking(user_id, ranking)
         
-        # 检查缓存 (如果不是刷新操作)
-        cache_key = f"rec_{user_id}_{limit}"
-        if not refresh and cache_key in _recommendation_cache:
-            cached_data, cached_time = _recommendation_cache[cache_key]
-            if time.time() - cached_time < CACHE_TTL:
-                logger.info(f"用户 {user_id} 使用缓存推荐")
-                return cached_data
+        # 只对当前页的活动生成展示字段
+        page = slice(offset, offset + limit)
+        items = self._materialize(ranking.snapshot, ranking.factors, ranking.positions[page], ranking.scores[page])
+        popularity_service.record_many(ranking.snapshot.ids[ranking.positions[page]], "impression")
+        next_cursor = encode_cursor(ranking.version, offset + limit) if offset + limit < len(ranking) else None
+        serving_metrics.record("recommendations", tier, deadline.elapsed_ms())
         
-        # 获取用户画像
-        profile = db.query(UserProfile).filter(
-            UserProfile.user_id == user_id
-        ).first()
+        logger.info(f"为用户 {user_id} 生成 {len(items)} 条推荐 (Refresh={refresh}, offset={offset}, tier={tier})")
+        return {"items": items, "next_cursor": next_cursor, "ranking_version": ranking.version, "serving_tier": tier}
+    
+    def _coalesced_ranking(
+        self, db: Session, user_id: int, limit: int, deadline: Deadline
+    ) -> Tuple[Optional[UserRanking], str]:
+        """同一用户并发的缓存未命中只计算一次排序，其余请求等待并共享结果
+
+        等待不超过 inference.singleflight.timeout_ms 与请求剩余时间，超时后自行计算（此时多半已超出预算，直接降级）。
+        """
+        depth = self._feed_depth(limit)
+        ok, result = ranking_flight.do(
+            (user_id, depth),
+            lambda: self._compute_ranking(db, user_id, limit, deadline),
+            deadline.timeout_ms(ranking_flight.default_timeout_ms())
+        )
+        if ok:
+            return result
+        logger.warning(f"等待用户 {user_id} 进行中的推荐计算超时，单独计算")
+        return self._compute_ranking(db, user_id, limit, deadline)
+    
+    def _compute_ranking(
+        self, db: Session, user_id: int, limit: int, deadline: Deadline,
+        profile: Optional[UserProfile] = None, model=None
+    ) -> Tuple[Optional[UserRanking], str]:
+        """召回、打分并排序，返回 (排序, 服务层级)；无画像或没有可推荐活动时排序为None（使用热门活动）
+        
+        Args:
+            profile: 已批量读取的用户画像（预热时传入，不再逐个查询）
+            model: 指定使用的模型实例（默认为当前线上模型）
+        """
+        # 固定本次请求使用的模型实例，模型热切换不影响进行中的请求
+        model = model or self.model
+        
+        # 读取画像、活动目录与参与记录（数据库语句受 inference.timeout.db_query_ms 与剩余时间限制）
+        try:
+            with statement_timeout(db, deadline, "profile", Deadline.stage_budget("db_query_ms")):
+                if profile is None:
+                    profile = db.query(UserProfile).filter(
+                        UserProfile.user_id == user_id
+                    ).first()
+                if profile:
+                    # 候选活动来自内存中的活动目录快照（进行中活动，没有时为全部活动）
+                    snapshot = catalog_service.get_snapshot(db)
+                    participated = self._participated_ids(db, user_id)
+        except DeadlineExceeded as e:
+            logger.warning(f"用户 {user_id} 推荐{e}（已用 {deadline.elapsed_ms():.0f}ms），使用热门活动")
+            return None, "popularity"
         
         if not profile:
             # 冷启动：返回热门活动
             logger.info(f"用户 {user_id} 无画像，使用冷启动推荐")
-            return self._get_popular_activities(db, limit)
+            return None, "popularity"
         
-        # 获取候选活动（活跃状态）
-        activities = db.query(Activity).filter(
-            Activity.status == "active"
-        ).all()
+        if len(snapshot) == 0:
+            logger.info("没有可推荐的活动")
+            return None, "popularity"
         
-        if not activities:
-            # 如果没有活跃活动，尝试获取所有活动
-            activities = db.query(Activity).all()
+        depth = self._feed_depth(limit)
+        factors = self._build_user_features(profile)
+        user_vector = user_factor_vector(factors.values())
         
-        if not activities:
-            logger.info("没有可推荐的活动")
-            return self._get_popular_activities(db, limit)
+        positions = None
+        try:
+            deadline.check("profile")
+            # 第一阶段：召回候选（只为一页所需条数与已参与的活动补足，不突破召回上限）
+            positions = retrieval_service.retrieve(
+                profile, snapshot, min_candidates=limit + len(participated), model=model
+            )
+            deadline.check("retrieval")
+            # 第二阶段：一次性为全部候选打分（因子向量相同的用户共享分数缓存）
+            scores = self._score_candidates(model, user_vector, snapshot, positions, deadline)
+        except DeadlineExceeded as e:
+            logger.warning(f"用户 {user_id} 推荐{e}（已用 {deadline.elapsed_ms():.0f}ms），降级处理")
+            return self._degraded_ranking(user_id, model, profile, snapshot, factors, positions, participated, depth)
         
-        # 构建特征向量
-        user_features = self._build_user_features(profile)
+        # 用户相关的过滤与排序在打分之后进行：排序分数乘以所在聚类的策略乘数，展示分数仍为接受概率
+        ranking_scores = strategy_service.apply(snapshot, profile.cluster_id, positions, scores)
+        order = self._rank(profile, snapshot, positions, ranking_scores, participated, depth)
+        return UserRanking(snapshot, SimpleNamespace(**factors), positions[order], scores[order]), "model"
+    
+    @staticmethod
+    def _feed_depth(limit: int) -> int:
+        """缓存排序的深度：inference.feed.depth 与召回上限中的较小者（召回上限优先），至少为一页"""
+        return max(limit, min(rec_config.get("inference.feed.depth", 100), retrieval_service.max_candidates()))
+    
+    def _degraded_ranking(
+        self, user_id: int, model, profile: UserProfile, snapshot, factors: Dict[str, float],
+        positions: Optional[np.ndarray], participated: np.ndarray, depth: int
+    ) -> Tuple[Optional[UserRanking], str]:
+        """超时降级：已过期的缓存排序 → 聚类短名单 → 规则评分 → 热门活动（排序为None）"""
+        stale = self._cached_ranking(user_id, max_age=rec_config.get("inference.timeout.stale_fallback_seconds", 600))
+        if stale is not None:
+            return stale, "cached"
         
-        # 对每个活动计算接受概率
-        recommendations = []
-        for activity in activities:
-            # 构建活动特征
-            activity_features = self._build_activity_features(activity)
-            
-            # 合并特征
-            features = {**user_features, **activity_features}
-            feature_vector = self._features_to_vector(features)
-            
-            # 预测接受概率
-            probability = self.model.predict_proba_single(feature_vector)
-            
-            # 使用快速规则生成推荐理由（SHAP解释在详情页按需生成）
-            reason = self._quick_reason(activity, profile, probability)
+        user_vector = user_factor_vector(factors.values())
+        try:
+            shortlist = shortlist_service.get_shortlist(model, snapshot, profile.cluster_id)
+            if shortlist is not None and len(shortlist):
+                # 短名单已按聚类中心的模型分数排好序，展示分数使用规则评分
+                shortlist = shortlist[~contains_sorted(participated, snapshot.ids[shortlist])][:depth]
+                scores = self._rule_scores(model, user_vector, snapshot, shortlist)
+                return UserRanking(snapshot, SimpleNamespace(**factors), shortlist, scores, "shortlist"), "shortlist"
             
+            # 召回未完成时对全部活动使用规则评分
+            if positions is None:
+                positions = np.arange(len(snapshot))
+            scores = self._rule_scores(model, user_vector, snapshot, positions)
+            order = self._rank(profile, snapshot, positions, scores, participated, depth)
+            return UserRanking(snapshot, SimpleNamespace(**factors), positions[order], scores[order], "rule"), "rule"
+        except Exception as e:
+            logger.warning(f"降级排序失败，使用热门活动: {e}")
+            return None, "popularity"
+    
+    def _cached_ranking(
+        self, user_id: int, version: Optional[str] = None, max_age: float = CACHE_TTL
+    ) -> Optional[UserRanking]:
+        """缓存中未过期的排序；未指定版本时为当前排序，且只接受模型打分的排序（降级排序不复用）"""
+        rankings = _recommendation_cache.get(f"rec_{user_id}")
+        if not rankings:
+            return None
+        if version is None:
+            version = next(reversed(rankings), None)
+            if version is not None and rankings[version][0].tier != "model":
+                return None
+        entry = rankings.get(version)
+        if entry is None or time.time() - entry[1] >= max_age:
+            return None
+        return entry[0]
+    
+    @staticmethod
+    def _ranking_age(user_id: int, ranking: UserRanking) -> float:
+        entry = _recommendation_cache.get(f"rec_{user_id}", {}).get(ranking.version)
+        return time.time() - entry[1] if entry else float("inf")
+    
+    def _refresh_ranking(self, key: Tuple[int, int]):
+        """后台刷新用户的排序（不受请求截止时间约束，只保存模型打分的结果）"""
+        user_id, limit = key
+        db = SessionLocal()
+        try:
+            ranking, tier = self._coalesced_ranking(db, user_id, limit, Deadline(None))
+        finally:
+            db.close()
+        if ranking is not None and tier == "model":
+            self._store_ranking(user_id, ranking)
+    
+    def get_cache_stats(self) -> Dict:
+        """首页请求的缓存命中（hit / stale_hit / miss）与后台刷新队列统计"""
+        stats = dict(_cache_stats)
+        lookups = sum(stats.values())
+        stats["hit_rate"] = (stats["hit"] + stats["stale_hit"]) / lookups if lookups else 0.0
+        stats["users"] = len(_recommendation_cache)
+        stats["refresh"] = self.refresher.get_stats()
+        return stats
+    
+    def cached_score(self, user_id: int, activity_id: int) -> Optional[float]:
+        """用户缓存排序（含降级可用的过期排序）中该活动的接受概率，不在排序中时返回None"""
+        ranking = self._cached_ranking(user_id, max_age=rec_config.get("inference.timeout.stale_fallback_seconds", 600))
+        if ranking is None:
+            return None
+        position = ranking.snapshot.index.get(activity_id)
+        hits = np.flatnonzero(ranking.positions == position) if position is not None else []
+        return float(ranking.scores[hits[0]]) if len(hits) else None
+    
+    def prewarm_user(self, db: Session, profile: UserProfile, model, limit: int = 10) -> bool:
+        """为用户计算并缓存排序（缓存预热使用，不受请求截止时间约束），成功返回True"""
+        ranking, tier = self._compute_ranking(db, profile.user_id, limit, Deadline(None), profile=profile, model=model)
+        if ranking is None or tier != "model":
+            return False
+        self._store_ranking(profile.user_id, ranking)
+        return True
+    
+    def _store_ranking(self, user_id: int, ranking: UserRanking):
+        """保存为用户的当前排序，同时清理超过降级可用时长的旧排序"""
+        now = time.time()
+        max_age = max(max_stale_seconds(), rec_config.get("inference.timeout.stale_fallback_seconds", 600))
+        rankings = {
+            version: entry for version, entry in _recommendation_cache.get(f"rec_{user_id}", {}).items()
+            if now - entry[1] < max_age
+        }
+        rankings[ranking.version] = (ranking, now)
+        while len(rankings) > MAX_RANKINGS_PER_USER:
+            rankings.pop(next(iter(rankings)))
+        _recommendation_cache[f"rec_{user_id}"] = rankings
+    
+    def _materialize(self, snapshot, profile, positions: np.ndarray, scores: np.ndarray) -> List[Dict]:
+        """按目录快照生成推荐结果的展示字段"""
+        recommendations = []
+        for position, probability in zip(positions, scores):
+            activity = snapshot.activities[position]
             recommendations.append({
-                "activity_id": activity.id,
-                "title": activity.title,
-                "description": activity.description,
-                "incentive_type": activity.incentive_type,
-                "incentive_amount": float(activity.incentive_amount or 0),
+                "activity_id": activity["activity_id"],
+                "title": activity["title"],
+                "description": activity["description"],
+                "incentive_type": activity["incentive_type"],
+                "incentive_amount": activity["incentive_amount"],
                 "score": float(probability),
-                "reason": reason,
-                "start_time": getattr(activity, 'start_time', None),
-                "end_time": getattr(activity, 'end_time', None)
+                # 使用快速规则生成推荐理由（SHAP解释在详情页按需生成）
+                "reason": self._quick_reason(activity, profile, probability),
+                "start_time": activity["start_time"],
+                "end_time": activity["end_time"]
             })
-        
-        # 按分数排序
-        recommendations.sort(key=lambda x: x["score"], reverse=True)
-        
-        # 如果是刷新，增加随机性：从Top N中随机选择
-        if refresh and len(recommendations) > limit:
-            # 取Top 2*limit个候选
-            candidates = recommendations[:min(len(recommendations), limit * 3)]
-            # 随机打乱
-            random.shuffle(candidates)
-            result = candidates[:limit]
-            # 重新按分数排序以便展示
-            result.sort(key=lambda x: x["score"], reverse=True)
+        return recommendations
+    
+    def _score_candidates(
+        self, model, user_vector: np.ndarray, snapshot, positions: np.ndarray, deadline: Optional[Deadline] = None
+    ) -> np.ndarray:
+        """为候选活动（目录快照下标）计算接受概率"""
+        def score_tuples(vector: np.ndarray, tuple_rows: np.ndarray) -> np.ndarray:
+            return self._score_tuples(model, vector, snapshot, tuple_rows, deadline)
+
+        if ranking_cache.enabled():
+            return ranking_cache.scores(model, snapshot, user_vector, positions, score_tuples)
+        unique_rows, inverse = np.unique(snapshot.tuple_index[positions], return_inverse=True)
+        return score_tuples(user_vector, unique_rows)[inverse.reshape(-1)]
+    
+    def _score_tuples(
+        self, model, user_vector: np.ndarray, snapshot, tuple_rows: np.ndarray, deadline: Optional[Deadline] = None
+    ) -> np.ndarray:
+        """为活动特征组合（快照 feature_tuples 下标）打分：查找表就绪时插值，否则精确模型批量预测
+
+        传入 deadline 时模型预测最多等待 min(model_predict_ms, 剩余时间)，超时抛出 DeadlineExceeded。
+        """
+        table = lookup_service.get_table(model, snapshot)
+        if table is not None:
+            return table.score(user_vector, tuple_rows)
+        X = combine_features(user_vector, snapshot.feature_tuples[tuple_rows])
+        # 并发请求合并为一次批量预测
+        if micro_batcher.enabled():
+            future = micro_batcher.submit(model, X, direct=run_in_worker if deadline is not None else None)
+        elif deadline is not None:
+            future = run_in_worker(model.score_batch, X)
         else:
-            result = recommendations[:limit]
-        
-        # 缓存结果
-        _recommendation_cache[cache_key] = (result, time.time())
+            return model.score_batch(X)
+        if deadline is None:
+            return future.result()
+        return deadline.wait(future, "model_predict", Deadline.stage_budget("model_predict_ms"))
+    
+    def _rule_scores(self, model, user_vector: np.ndarray, snapshot, positions: np.ndarray) -> np.ndarray:
+        """规则评分（模型超时时的降级，只按不同的活动特征组合计算）"""
+        unique_rows, inverse = np.unique(snapshot.tuple_index[positions], return_inverse=True)
+        X = combine_features(user_vector, snapshot.feature_tuples[unique_rows])
+        return model.rule_based_scores(X)[inverse.reshape(-1)]
+    
+    def _participated_ids(self, db: Session, user_id: int) -> np.ndarray:
+        """用户已参与的活动ID（升序）：优先读取内存索引，未启用时查询奖励表"""
+        if participation_index.enabled():
+            return participation_index.get(user_id, db)
+        rows = db.query(Reward.activity_id).filter(Reward.user_id == user_id).all()
+        return np.unique(np.array([r[0] for r in rows], dtype=np.int64))
+    
+    def _rank(
+        self,
+        profile: UserProfile,
+        snapshot,
+        positions: np.ndarray,
+        scores: np.ndarray,
+        participated: np.ndarray,
+        depth: int
+    ) -> np.ndarray:
+        """去掉已参与的活动（participated 为升序活动ID）后排序，返回候选数组中的下标：符合偏好（活动类型与激励类型）的活动在前，
+        其余在后，各自按分数降序，取前 depth 个"""
+        keep = np.flatnonzero(~contains_sorted(participated, snapshot.ids[positions]))
+        positions, scores = positions[keep], scores[keep]
         
-        logger.info(f"为用户 {user_id} 生成 {len(result)} 条推荐 (Refresh={refresh})")
+        mask = matches_preference(
+            snapshot.type_bits[positions],
+            preference_mask(profile.preference_activity_types, profile.preference_incentive_types)
+        )
+        first = np.flatnonzero(mask)
+        first = first[top_k(scores[first], depth)]
+        rest = np.flatnonzero(~mask)
+        rest = rest[top_k(scores[rest], depth - len(first))]
+        order = np.concatenate(self._diversify(snapshot, positions, scores, [first, rest]))
+        return keep[order]
+    
+    def _diversify(self, snapshot, positions: np.ndarray, scores: np.ndarray, tiers: List[np.ndarray]) -> List[np.ndarray]:
+        """对排序最前的 inference.diversity.rerank_depth 名做 MMR 多样性重排（各层内分别进行，层间顺序不变）"""
+        try:
+            weight = min(1.0, max(0.0, float(rec_config.get("inference.diversity_weight", 0.2))))
+        except (TypeError, ValueError):
+            weight = 0.2
+        budget = rec_config.get("inference.diversity.rerank_depth", 20)
+        if weight <= 0:
+            return tiers
+        buckets = rec_config.get("inference.diversity.amount_buckets", [10, 20, 50, 100])
+        result = []
+        for tier in tiers:
+            if budget > 0 and len(tier) > 1:
+                codes = diversity_codes(snapshot.features[positions[tier]], buckets)
+                head = mmr_rerank(scores[tier], codes, budget, weight)
+                tier = np.concatenate([tier[head], np.delete(tier, head)])
+                budget -= len(head)
+            result.append(tier)
         return result
     
-    def _quick_reason(self, activity: Activity, profile: UserProfile, probability: float) -> str:
+    def _quick_reason(self, activity: Dict, profile: UserProfile, probability: float) -> str:
         """快速生成推荐理由（不使用SHAP，提升性能）"""
         reasons = []
+        incentive_type = activity["incentive_type"]
+        activity_type = activity["activity_type"]
         
         # 基于激励类型匹配（降低阈值）
-        if activity.incentive_type == 'red_packet':
+        if incentive_type == 'red_packet':
             if profile.factor_incent > 0.5:
                 reasons.append('红包奖励符合您的激励偏好')
             else:
                 reasons.append('丰厚红包等您领取')
-        elif activity.incentive_type == 'points':
+        elif incentive_type == 'points':
             if profile.factor_psych > 0.5:
                 reasons.append('积分奖励适合您的消费习惯')
             else:
                 reasons.append('轻松获取积分奖励')
-        elif activity.incentive_type == 'coupon':
+        elif incentive_type == 'coupon':
             reasons.append('专属优惠券等您领取')
         
         # 基于活动类型匹配
-        if activity.type == 'invite':
+        if activity_type == 'invite':
             if profile.factor_social > 0.5:
                 reasons.append('邀请活动契合您的社交特质')
             else:
                 reasons.append('邀请好友一起参与')
-        elif activity.type == 'share':
+        elif activity_type == 'share':
             if profile.factor_personal > 0.5:
                 reasons.append('分享活动适合您的个性')
             else:
                 reasons.append('分享即可获得奖励')
-        elif activity.type == 'quiz':
+        elif activity_type == 'quiz':
             if profile.factor_tech > 0.5:
                 reasons.append('答题活动符合您的技术兴趣')
             else:
@@ -219,10 +592,11 @@ class RecommendationService:
     
     def _generate_reason(self, feature_vector: np.ndarray, probability: float) -> str:
         """生成详细推荐理由（使用SHAP，用于详情页）"""
+        model = self.model
         try:
-            reason = self.explainer.explain_prediction(
-                feature_vector, 
-                self.model.feature_names
+            reason = model.get_explainer().explain_prediction(
+                model.transform_features(feature_vector), 
+                model.feature_names
             )
             return reason
         except Exception as e:
@@ -254,46 +628,20 @@ class RecommendationService:
         }
     
     def _features_to_vector(self, features: Dict[str, float]) -> np.ndarray:
-        """特征字典转为向量"""
-        # 按照模型训练时的特征顺序
-        feature_order = [
-            "factor_social", "factor_psych", "factor_incent", 
-            "factor_tech", "factor_env", "factor_personal",
-            "incentive_amount", "incentive_type_encoded", "activity_type_encoded"
-        ]
-        return np.array([[features.get(f, 0) for f in feature_order]])
+        """特征字典转为向量（按照模型训练时的特征顺序）"""
+        return features_to_vector(features)
     
     def _encode_incentive_type(self, incentive_type: str) -> int:
         """编码激励类型"""
-        type_mapping = {"red_packet": 0, "points": 1, "coupon": 2}
-        return type_mapping.get(incentive_type, 0)
+        return encode_incentive_type(incentive_type)
     
     def _encode_activity_type(self, activity_type: str) -> int:
         """编码活动类型"""
-        type_mapping = {"invite": 0, "quiz": 1, "share": 2}
-        return type_mapping.get(activity_type, 0)
+        return encode_activity_type(activity_type)
     
     def _get_popular_activities(self, db: Session, limit: int) -> List[Dict]:
-        """获取热门活动（冷启动）"""
-        # 先尝试获取活跃活动
-        activities = db.query(Activity).filter(
-            Activity.status == "active"
-        ).limit(limit).all()
-        
-        # 如果没有，获取所有活动
-        if not activities:
-            activities = db.query(Activity).limit(limit).all()
-        
-        return [{
-            "activity_id": a.id,
-            "title": a.title,
-            "description": a.description,
-            "activity_type": getattr(a, 'type', None),
-            "incentive_type": getattr(a, 'incentive_type', None),
-            "incentive_amount": float(a.incentive_amount or 0),
-            "score": 0.5,  # 默认分数
-            "reason": "热门活动推荐"
-        } for a in activities]
+        """获取热门活动（冷启动）：活动热度服务预先计算的 Top-N，不查询数据库"""
+        return popularity_service.top(catalog_service.get_snapshot(db), limit)
     
     def _save_recommendation_log(
         self, 
@@ -351,6 +699,9 @@ class RecommendationService:
             db.commit()
             logger.info(f"创建新反馈记录: user={user_id}, activity={activity_id}")
         
+        if is_clicked or is_accepted:
+            popularity_service.record(activity_id, "click")
+        
         # 触发用户画像更新
         from app.services.profile_service import profile_service
         profile_service.update_profile_from_feedback(
@@ -0,0 +1,235 @@
+"""
+候选召回服务
+文件名：app/services/retrieval_service.py
+
+两阶段推荐的第一阶段：由多个召回器从活动目录中廉价地选出至多
+inference.batch.max_activities_per_request 个候选，再交给排序模型打分。
+召回器按 inference.retrieval.generators 的顺序与配额依次填充候选，
+配额未用完的名额由后续召回器补足。新增召回器只需继承 CandidateGenerator
+并用 register_generator 注册，然后加入配置。
+"""
+
+import time
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Type
+
+import numpy as np
+
+from app.config_loader import rec_config
+from app.ml.features import matches_preference, preference_mask
+from app.models import UserProfile
+from app.services.popularity_service import popularity_service
+from app.services.shortlist_service import shortlist_service
+from app.utils.logger import logger
+
+
+GENERATORS: Dict[str, Type["CandidateGenerator"]] = {}
+
+
+def register_generator(cls: Type["CandidateGenerator"]) -> Type["CandidateGenerator"]:
+    """注册召回器（按类属性 name 索引）"""
+    GENERATORS[cls.name] = cls
+    return cls
+
+
+class PopularityIndex:
+    """时间衰减的活动热度（取自 popularity_service 的衰减计数，定时刷新）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scores: Dict[int, float] = {}
+        self._computed_at = 0.0
+        # 最近一次对齐结果：(目录快照, 热度计算时间, 数组)
+        self._aligned = (None, None, None)
+
+    def scores_for(self, snapshot) -> np.ndarray:
+        """与目录快照对齐的热度数组（目录与热度都未变化时复用）"""
+        cfg = rec_config.get("inference.retrieval.popularity", {}) or {}
+        if time.time() - self._computed_at > cfg.get("refresh_seconds", 300):
+            self._refresh(cfg)
+        cached_snapshot, computed_at, aligned = self._aligned
+        if cached_snapshot is snapshot and computed_at == self._computed_at:
+            return aligned
+        scores = self._scores
+        aligned = np.array([scores.get(int(i), 0.0) for i in snapshot.ids])
+        self._aligned = (snapshot, self._computed_at, aligned)
+        return aligned
+
+    def _refresh(self, cfg: Dict):
+        with self._lock:
+            if time.time() - self._computed_at <= cfg.get("refresh_seconds", 300):
+                return
+            try:
+                self._scores = popularity_service.scores()
+            except Exception as e:
+                logger.warning(f"活动热度计算失败: {e}")
+            finally:
+                self._computed_at = time.time()
+
+
+class RetrievalContext:
+    """一次召回的用户上下文"""
+
+    def __init__(self, profile: UserProfile, snapshot, popularity: np.ndarray, rng: np.random.Generator, model=None):
+        self.profile = profile
+        self.snapshot = snapshot
+        self.popularity = popularity
+        self.rng = rng
+        self.model = model
+
+    def top_by_popularity(self, positions: np.ndarray, k: int) -> np.ndarray:
+        """在给定下标中取热度最高的 k 个"""
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        if len(positions) <= k:
+            return positions[np.argsort(-self.popularity[positions], kind='stable')]
+        top = np.argpartition(-self.popularity[positions], k - 1)[:k]
+        top = top[np.argsort(-self.popularity[positions][top], kind='stable')]
+        return positions[top]
+
+
+class CandidateGenerator(ABC):
+    """召回器基类"""
+
+    name = ""
+
+    @abstractmethod
+    def generate(self, ctx: RetrievalContext, k: int, exclude: np.ndarray) -> np.ndarray:
+        """返回至多 k 个活动下标（不含 exclude 中已选中的）"""
+
+
+def _without(positions: np.ndarray, exclude: np.ndarray) -> np.ndarray:
+    return positions[~np.isin(positions, exclude)] if len(exclude) else positions
+
+
+@register_generator
+class ClusterShortlistGenerator(CandidateGenerator):
+    """用户所在聚类的预计算短名单（按聚类中心得分降序）"""
+
+    name = "cluster_shortlist"
+
+    def generate(self, ctx, k, exclude):
+        if k <= 0 or ctx.model is None:
+            return np.empty(0, dtype=np.int64)
+        shortlist = shortlist_service.get_shortlist(ctx.model, ctx.snapshot, ctx.profile.cluster_id)
+        if shortlist is None:
+            return np.empty(0, dtype=np.int64)
+        return _without(shortlist, exclude)[:k]
+
+
+@register_generator
+class TargetClusterGenerator(CandidateGenerator):
+    """面向用户所在聚类（target_cluster 为聚类ID或聚类标签）的活动"""
+
+    name = "target_cluster"
+
+    def generate(self, ctx, k, exclude):
+        index = ctx.snapshot.by_target_cluster
+        keys = {str(ctx.profile.cluster_id), ctx.profile.cluster_tag}
+        groups = [index[key] for key in keys if key in index]
+        if not groups:
+            return np.empty(0, dtype=np.int64)
+        return ctx.top_by_popularity(_without(np.unique(np.concatenate(groups)), exclude), k)
+
+
+@register_generator
+class PreferenceGenerator(CandidateGenerator):
+    """符合用户偏好的活动类型与激励类型（两者都符合的优先）"""
+
+    name = "preference"
+
+    def generate(self, ctx, k, exclude):
+        mask = preference_mask(ctx.profile.preference_activity_types, ctx.profile.preference_incentive_types)
+        type_bits = ctx.snapshot.type_bits
+        both = _without(np.flatnonzero(matches_preference(type_bits, mask)), exclude)
+        result = ctx.top_by_popularity(both, k)
+        if len(result) < k:
+            either = _without(np.flatnonzero(type_bits & mask), np.concatenate([exclude, result]))
+            result = np.concatenate([result, ctx.top_by_popularity(either, k - len(result))])
+        return result
+
+
+@register_generator
+class PopularityGenerator(CandidateGenerator):
+    """近期参与热度（按时间衰减）最高的活动"""
+
+    name = "popularity"
+
+    def generate(self, ctx, k, exclude):
+        return ctx.top_by_popularity(_without(np.arange(len(ctx.snapshot)), exclude), k)
+
+
+@register_generator
+class ExplorationGenerator(CandidateGenerator):
+    """随机探索：给冷门和新上线的活动曝光机会"""
+
+    name = "exploration"
+
+    def generate(self, ctx, k, exclude):
+        n = len(ctx.snapshot)
+        if k <= 0 or n == 0:
+            return np.empty(0, dtype=np.int64)
+        # 过采样后去重，避免为大目录构造全量下标
+        draw = np.unique(ctx.rng.integers(0, n, size=min(n, 2 * k + len(exclude))))
+        draw = _without(draw, exclude)
+        return ctx.rng.permutation(draw)[:k]
+
+
+class RetrievalService:
+    """候选召回"""
+
+    def __init__(self):
+        self.popularity = PopularityIndex()
+
+    @staticmethod
+    def max_candidates() -> int:
+        return rec_config.get("inference.batch.max_activities_per_request", 50)
+
+    def retrieve(
+        self,
+        profile: UserProfile,
+        snapshot,
+        min_candidates: int = 0,
+        seed: Optional[int] = None,
+        model=None
+    ) -> np.ndarray:
+        """返回候选活动在目录快照中的下标；目录不超过上限或未启用召回时返回全部
+
+        Args:
+            min_candidates: 候选数下限（不少于请求的推荐条数）
+            model: 本次请求使用的模型（聚类短名单须与之匹配）
+        """
+        cfg = rec_config.get("inference.retrieval", {}) or {}
+        n = len(snapshot)
+        limit = max(self.max_candidates(), min_candidates)
+        if not cfg.get("enabled", True) or n <= limit:
+            return np.arange(n)
+
+        ctx = RetrievalContext(
+            profile, snapshot, self.popularity.scores_for(snapshot), np.random.default_rng(seed), model=model
+        )
+        selected = np.empty(0, dtype=np.int64)
+        generators = cfg.get("generators") or [{"name": "popularity", "quota": 1.0}]
+        for i, item in enumerate(generators):
+            generator_cls = GENERATORS.get(item["name"])
+            if generator_cls is None:
+                logger.warning(f"未知的召回器: {item['name']}")
+                continue
+            remaining = limit - len(selected)
+            if remaining <= 0:
+                break
+            # 最后一个召回器补足全部剩余名额
+            quota = remaining if i == len(generators) - 1 else min(remaining, int(round(limit * item.get("quota", 0))))
+            found = generator_cls().generate(ctx, quota, selected)
+            selected = np.concatenate([selected, found.astype(np.int64)])
+
+        # 召回不足时按热度补齐
+        if len(selected) < limit:
+            selected = np.concatenate([
+                selected, ctx.top_by_popularity(_without(np.arange(n), selected), limit - len(selected))
+            ])
+        return selected
+
+
+retrieval_service = RetrievalService()
@@ -0,0 +1,135 @@
+"""
+超参数搜索服务
+文件名：app/services/search_service.py
+
+后台执行随机森林超参数搜索，排行榜写入 data/hyperparameter_search/，
+可选用推荐候选（满足目标指标且推理最快）的参数训练并发布新模型版本。
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from app.config import settings
+from app.database import SessionLocal
+from app.ml.search import HyperparameterSearch
+from app.services.training_service import MIN_SAMPLES_PER_CLASS, training_service
+from app.utils.logger import logger
+
+
+class SearchService:
+    """后台超参数搜索任务"""
+
+    def __init__(self, output_dir: str = None):
+        self.output_dir = output_dir or os.path.join(settings.DATA_DIR, "hyperparameter_search")
+        self._lock = threading.Lock()
+        self._status: Dict[str, Any] = {
+            "state": "idle",  # idle / pending / running / completed / failed
+            "rung": None,
+            "progress": 0.0,
+            "message": None,
+            "error": None,
+            "started_at": None,
+            "finished_at": None,
+        }
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._status)
+
+    def _update_status(self, **kwargs):
+        with self._lock:
+            self._status.update(kwargs)
+
+    def mark_pending(self) -> bool:
+        """标记搜索任务待执行，已有任务时返回False"""
+        with self._lock:
+            if self._status["state"] in ("pending", "running"):
+                return False
+            self._status.update({
+                "state": "pending",
+                "rung": None,
+                "progress": 0.0,
+                "message": "等待执行",
+                "error": None,
+                "started_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "finished_at": None,
+            })
+            return True
+
+    def get_latest_leaderboard(self) -> Optional[Dict[str, Any]]:
+        """读取最近一次搜索的排行榜"""
+        path = os.path.join(self.output_dir, "latest.json")
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"读取超参数搜索排行榜失败: {e}")
+            return None
+
+    def run(self, search_cfg: Dict[str, Any] = None, train_best: bool = False, activate: bool = False):
+        """执行搜索任务（在后台任务中调用）
+
+        Args:
+            search_cfg: 覆盖 training.search 的搜索配置
+            train_best: 搜索完成后是否用推荐候选（达标且最快）的参数训练并发布新版本
+            activate: 发布后是否立即激活
+        """
+        self._update_status(state="running", message="读取训练数据", error=None)
+        db = SessionLocal()
+        try:
+            X, y = training_service.load_training_data(db)
+            db.close()
+
+            positives = int(y.sum())
+            if min(positives, len(y) - positives) < MIN_SAMPLES_PER_CLASS:
+                raise ValueError(f"训练样本不足：共 {len(y)} 条，正样本 {positives} 条")
+
+            search = HyperparameterSearch(search_cfg)
+
+            def on_progress(rung: int, done: int, total: int):
+                self._update_status(
+                    rung=rung,
+                    progress=round(done / total, 4),
+                    message=f"第 {rung + 1} 轮: {done}/{total}"
+                )
+
+            result = search.run(X, y, progress_callback=on_progress)
+            result["searched_at"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self._save(result)
+
+            self._update_status(
+                state="completed",
+                progress=1.0,
+                message=f"搜索完成，最佳 AUC {result['leaderboard'][0]['auc']:.4f}",
+                finished_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            )
+        except Exception as e:
+            logger.error(f"超参数搜索失败: {e}")
+            self._update_status(
+                state="failed",
+                error=str(e),
+                finished_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            )
+            return None
+        finally:
+            db.close()
+
+        if train_best and training_service.mark_pending():
+            training_service.run(params=result["selected_params"], activate=activate)
+        return result
+
+    def _save(self, result: Dict[str, Any]):
+        """排行榜按时间存档，并覆盖 latest.json"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        for name in (f"leaderboard_{stamp}.json", "latest.json"):
+            with open(os.path.join(self.output_dir, name), 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+search_service = SearchService()
@@ -0,0 +1,234 @@
+"""
+聚类候选短名单服务
+文件名：app/services/shortlist_service.py
+
+同一聚类的用户因子相近，对活动的排序也大体一致。后台任务用每个聚类的中心
+（该聚类用户因子的均值）对全部可推荐活动打分，保存得分最高的 top_m 个活动；
+线上召回直接取用户所在聚类的短名单，再由排序阶段用用户自己的因子精确打分。
+活动目录、线上模型或用户聚类变化后自动重建。构建时抽样真实用户，报告短名单
+重排后的 Top-K 相对全量排序的召回率（recall@K），用于调整 top_m。
+"""
+
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import func
+
+from app.config_loader import rec_config
+from app.database import SessionLocal
+from app.ml.features import combine_features
+from app.models import UserProfile
+from app.services.catalog_service import catalog_service
+from app.utils.logger import logger
+
+
+FACTOR_COLUMNS = [
+    UserProfile.factor_social,
+    UserProfile.factor_psych,
+    UserProfile.factor_incent,
+    UserProfile.factor_tech,
+    UserProfile.factor_env,
+    UserProfile.factor_personal,
+]
+
+
+def score_catalog(model, user_vector: np.ndarray, snapshot) -> np.ndarray:
+    """一个用户对目录中全部活动的接受概率（只对不同的活动特征组合打分）"""
+    scores = model.score_batch(combine_features(user_vector, snapshot.feature_tuples))
+    return scores[snapshot.tuple_index]
+
+
+def shortlist_recall(full_scores: np.ndarray, shortlist: np.ndarray, k: int) -> float:
+    """短名单重排后的 Top-K 对全量排序 Top-K 的召回率
+
+    活动特征组合相同的活动得分相同，按 ID 比较会把并列活动之间的取舍算作漏召回，
+    因此以全量第K名的分数为界：短名单 Top-K 中分数不低于该分数的都算命中。
+    """
+    k = min(k, len(full_scores))
+    if k == 0:
+        return 1.0
+    kth = np.partition(-full_scores, k - 1)[k - 1]
+    candidate = np.sort(full_scores[shortlist])[::-1][:k]
+    return float(np.sum(-candidate <= kth)) / k
+
+
+class ClusterShortlistService:
+    """各聚类短名单的后台构建与自动重建"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._shortlists: Dict[int, np.ndarray] = {}
+        self._key: Optional[str] = None
+        self._building_key: Optional[str] = None
+        self._failed_key: Optional[str] = None
+        # 用户重新聚类后递增，使短名单失效
+        self._generation = 0
+        self._status: Dict[str, Any] = {
+            "state": "idle",  # idle / building / ready / failed
+            "key": None,
+            "clusters": {},
+            "report": None,
+            "error": None,
+            "built_at": None,
+        }
+
+    @staticmethod
+    def config() -> Dict[str, Any]:
+        return rec_config.get("inference.cluster_shortlist", {}) or {}
+
+    def enabled(self) -> bool:
+        return bool(self.config().get("enabled", False))
+
+    def shortlist_key(self, model_version: str, catalog_version: int) -> str:
+        return f"{model_version}-c{catalog_version}-g{self._generation}"
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._status)
+
+    # ============ 线上读取 ============
+
+    def get_shortlist(self, model, snapshot, cluster_id: Optional[int]) -> Optional[np.ndarray]:
+        """返回聚类的短名单（目录快照下标，按聚类中心得分降序）；未就绪时触发后台构建并返回None"""
+        if not self.enabled() or cluster_id is None or len(snapshot) == 0:
+            return None
+        if self._key == self.shortlist_key(model.version, snapshot.version):
+            return self._shortlists.get(int(cluster_id))
+        self.ensure(model, snapshot)
+        return None
+
+    # ============ 构建 ============
+
+    def ensure(self, model, snapshot, force: bool = False) -> bool:
+        """按需在后台线程中构建短名单，已在构建同一版本时返回False"""
+        key = self.shortlist_key(model.version, snapshot.version)
+        with self._lock:
+            if self._building_key == key:
+                return False
+            if not force and key in (self._key, self._failed_key):
+                return False
+            self._building_key = key
+            self._status.update({"state": "building", "key": key, "error": None})
+
+        threading.Thread(
+            target=self._build,
+            args=(model, snapshot, key),
+            name="cluster-shortlist-build",
+            daemon=True
+        ).start()
+        return True
+
+    def _build(self, model, snapshot, key: str):
+        cfg = self.config()
+        top_m = min(int(cfg.get("top_m", 100)), len(snapshot))
+        started = time.time()
+        db = SessionLocal()
+        try:
+            centroids = self._load_centroids(db)
+            if not centroids:
+                raise ValueError("没有已聚类的用户画像，请先执行用户聚类")
+
+            # 按中心得分排序的完整下标，报告中用于比较不同 top_m
+            rankings = {
+                cluster_id: np.argsort(-score_catalog(model, centroid, snapshot), kind='stable')
+                for cluster_id, centroid in centroids.items()
+            }
+            shortlists = {cluster_id: order[:top_m] for cluster_id, order in rankings.items()}
+            report = self._recall_report(db, model, snapshot, rankings, top_m, cfg)
+            report["build_seconds"] = round(time.time() - started, 3)
+
+            with self._lock:
+                if self._building_key == key:
+                    self._building_key = None
+                self._shortlists, self._key = shortlists, key
+                self._status.update({
+                    "state": "ready",
+                    "key": key,
+                    "top_m": top_m,
+                    "clusters": {str(c): len(s) for c, s in sorted(shortlists.items())},
+                    "report": report,
+                    "built_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                })
+            logger.info(
+                f"聚类短名单已就绪: {key}, {len(shortlists)} 个聚类, "
+                f"recall@{report['top_k']} {report['recall_at_k']:.3f}"
+            )
+        except Exception as e:
+            logger.error(f"聚类短名单构建失败: {e}")
+            with self._lock:
+                if self._building_key == key:
+                    self._building_key = None
+                self._failed_key = key
+                self._status.update({"state": "failed", "error": str(e)})
+        finally:
+            db.close()
+
+    @staticmethod
+    def _load_centroids(db) -> Dict[int, np.ndarray]:
+        """各聚类的用户因子均值（即聚类时 KMeans 的中心）"""
+        rows = db.query(
+            UserProfile.cluster_id, *[func.avg(column) for column in FACTOR_COLUMNS]
+        ).filter(UserProfile.cluster_id.isnot(None)).group_by(UserProfile.cluster_id).all()
+        return {
+            int(row[0]): np.array([0.5 if v is None else float(v) for v in row[1:]])
+            for row in rows
+        }
+
+    @staticmethod
+    def _recall_report(db, model, snapshot, rankings: Dict[int, np.ndarray], top_m: int, cfg: Dict) -> Dict[str, Any]:
+        """抽样已聚类用户，比较短名单重排与全量排序的 Top-K"""
+        top_k = int(cfg.get("report_top_k", 10))
+        m_values = sorted({m for m in cfg.get("report_top_m", []) if m <= len(snapshot)} | {top_m})
+        profiles = db.query(UserProfile).filter(
+            UserProfile.cluster_id.in_(list(rankings))
+        ).order_by(func.random()).limit(cfg.get("report_users", 200)).all()
+
+        recalls: Dict[int, List[float]] = {m: [] for m in m_values}
+        by_cluster: Dict[int, List[float]] = {}
+        for profile in profiles:
+            full_scores = score_catalog(model, np.array(profile.get_factors_vector(), dtype=float), snapshot)
+            order = rankings[profile.cluster_id]
+            for m in m_values:
+                recall = shortlist_recall(full_scores, order[:m], top_k)
+                recalls[m].append(recall)
+                if m == top_m:
+                    by_cluster.setdefault(profile.cluster_id, []).append(recall)
+
+        def mean(values: List[float]) -> Optional[float]:
+            return round(float(np.mean(values)), 4) if values else None
+
+        return {
+            "users": len(profiles),
+            "top_k": top_k,
+            "top_m": top_m,
+            "recall_at_k": mean(recalls[top_m]),
+            "by_top_m": [{"top_m": m, "recall_at_k": mean(recalls[m])} for m in m_values],
+            "by_cluster": {str(c): mean(v) for c, v in sorted(by_cluster.items())},
+        }
+
+    # ============ 自动重建 ============
+
+    def on_model_changed(self):
+        """模型切换后重建"""
+        if self.enabled():
+            from app.ml.predict import get_model
+            self.ensure(get_model(), catalog_service.get_snapshot())
+
+    def on_catalog_changed(self, snapshot):
+        """活动目录变化后重建"""
+        if self.enabled() and len(snapshot):
+            from app.ml.predict import get_model
+            self.ensure(get_model(), snapshot)
+
+    def on_clusters_changed(self):
+        """用户重新聚类后重建"""
+        with self._lock:
+            self._generation += 1
+        self.on_model_changed()
+
+
+shortlist_service = ClusterShortlistService()
+catalog_service.add_listener(shortlist_service.on_catalog_changed)
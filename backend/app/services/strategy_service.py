@@ -0,0 +1,125 @@
+"""
+聚类运营策略服务
+文件名：app/services/strategy_service.py
+
+把 cluster_strategies 中每个聚类的 score_boost 与 incentive_preference.preferred_types
+编译为按活动的分数乘数向量（聚类数 × 活动数），排序时对候选分数做一次向量乘法。
+preferred_types 中的运营名称（如 team_reward）经 inference.cluster_strategy.type_aliases
+映射为活动目录中的激励类型（red_packet / points / coupon）或活动类型（invite / quiz / share），
+映射后仍不在目录中的名称记录警告。配置修改（配置版本号变化）或活动目录变化后重新编译。
+"""
+
+import threading
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+from app.config_loader import rec_config
+from app.utils.logger import logger
+
+
+class CompiledStrategies:
+    """某一配置版本下各聚类策略的编译结果"""
+
+    def __init__(
+        self, revision: int, strategies: Dict[str, Any], default_boost: float,
+        type_aliases: Optional[Dict[str, Any]] = None
+    ):
+        self.revision = revision
+        self.cluster_row: Dict[int, int] = {}
+        self.type_aliases = type_aliases or {}
+        # 最近一次编译时在活动目录中没有对应类型的 preferred_types 名称
+        self.unmatched: List[str] = []
+        boosts, preferred, preference_boosts = [], [], []
+        for key, strategy in strategies.items():
+            try:
+                cluster_id = int(key)
+            except (TypeError, ValueError):
+                continue
+            incentive_preference = strategy.get("incentive_preference", {}) or {}
+            self.cluster_row[cluster_id] = len(boosts)
+            boosts.append(float(strategy.get("score_boost", 1.0)))
+            preferred.append(frozenset(incentive_preference.get("preferred_types", []) or []))
+            preference_boosts.append(float(incentive_preference.get("boost", default_boost)))
+        self.boosts = np.array(boosts)
+        self.preferred = preferred
+        self.preference_boosts = np.array(preference_boosts)
+
+    def resolve(self, name: str) -> FrozenSet[str]:
+        """preferred_types 名称对应的目录类型（未配置映射时按原名匹配）"""
+        alias = self.type_aliases.get(name, name)
+        return frozenset([alias] if isinstance(alias, str) else alias)
+
+    def build_matrix(self, snapshot) -> np.ndarray:
+        """活动目录上的乘数矩阵：score_boost × 偏好类型加成（激励类型或活动类型命中 preferred_types）"""
+        matrix = np.repeat(self.boosts[:, None], len(snapshot), axis=1)
+        indexes = (snapshot.by_incentive_type, snapshot.by_activity_type)
+        unmatched = set()
+        for row, names in enumerate(self.preferred):
+            groups = []
+            for name in names:
+                found = [index[t] for t in self.resolve(name) for index in indexes if t in index]
+                if not found:
+                    unmatched.add(name)
+                groups += found
+            if groups:
+                matrix[row, np.unique(np.concatenate(groups))] *= self.preference_boosts[row]
+        self.unmatched = sorted(unmatched)
+        if self.unmatched:
+            logger.warning(
+                f"聚类策略 preferred_types 在活动目录中没有对应的激励类型或活动类型（未加成）: {self.unmatched}，"
+                f"可在 inference.cluster_strategy.type_aliases 中配置映射"
+            )
+        return matrix
+
+
+class ClusterStrategyService:
+    """聚类策略乘数（按配置版本与活动目录版本缓存）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._compiled: Tuple[Optional[int], Optional[CompiledStrategies]] = (None, None)
+        self._matrix: Tuple[Optional[tuple], Optional[np.ndarray]] = (None, None)
+
+    @staticmethod
+    def enabled() -> bool:
+        return bool(rec_config.get("inference.cluster_strategy.enabled", True))
+
+    def compiled(self) -> CompiledStrategies:
+        """当前配置版本的编译结果"""
+        revision, compiled = self._compiled
+        if revision != rec_config.revision:
+            with self._lock:
+                revision, compiled = self._compiled
+                if revision != rec_config.revision:
+                    compiled = CompiledStrategies(
+                        rec_config.revision,
+                        rec_config.cluster_strategies,
+                        rec_config.get("inference.cluster_strategy.preferred_type_boost", 1.1),
+                        rec_config.get("inference.cluster_strategy.type_aliases", {})
+                    )
+                    self._compiled = (rec_config.revision, compiled)
+        return compiled
+
+    def multipliers(self, snapshot, cluster_id: Optional[int]) -> Optional[np.ndarray]:
+        """聚类在活动目录上的乘数向量；未启用或该聚类没有策略时返回None"""
+        if cluster_id is None or not self.enabled():
+            return None
+        compiled = self.compiled()
+        row = compiled.cluster_row.get(int(cluster_id))
+        if row is None:
+            return None
+        key = (compiled.revision, snapshot.version, len(snapshot))
+        cached_key, matrix = self._matrix
+        if cached_key != key:
+            matrix = compiled.build_matrix(snapshot)
+            self._matrix = (key, matrix)
+        return matrix[row]
+
+    def apply(self, snapshot, cluster_id: Optional[int], positions: np.ndarray, scores: np.ndarray) -> np.ndarray:
+        """候选分数乘以所在聚类的策略乘数"""
+        vector = self.multipliers(snapshot, cluster_id)
+        return scores if vector is None else scores * vector[positions]
+
+
+strategy_service = ClusterStrategyService()
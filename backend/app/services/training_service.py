@@ -0,0 +1,223 @@
+"""
+模型训练服务
+文件名：app/services/training_service.py
+
+后台训练任务：从 recommendations 表分块流式读取带标签的样本
+（用户因子 + 活动特征 + is_accepted），按配置训练随机森林，
+并将模型发布到模型注册中心供线上加载。
+"""
+
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+import joblib
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.ml.features import FEATURE_NAMES, activity_feature_vector, user_factor_vector
+from app.ml.predict import get_registry
+from app.ml.train_model import ModelTrainer
+from app.models import Activity, Recommendation, UserProfile
+from app.utils.logger import logger
+
+
+STREAM_CHUNK_SIZE = 5000
+MIN_SAMPLES_PER_CLASS = 10
+
+
+class TrainingService:
+    """后台模型训练任务"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status: Dict[str, Any] = {
+            "state": "idle",  # idle / pending / running / completed / failed
+            "stage": None,
+            "progress": 0.0,
+            "message": None,
+            "version": None,
+            "metrics": None,
+            "error": None,
+            "started_at": None,
+            "finished_at": None,
+        }
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._status)
+
+    def _update_status(self, **kwargs):
+        with self._lock:
+            self._status.update(kwargs)
+
+    def mark_pending(self) -> bool:
+        """标记训练任务待执行，已有任务时返回False"""
+        with self._lock:
+            if self._status["state"] in ("pending", "running"):
+                return False
+            self._status.update({
+                "state": "pending",
+                "stage": None,
+                "progress": 0.0,
+                "message": "等待执行",
+                "version": None,
+                "metrics": None,
+                "error": None,
+                "started_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "finished_at": None,
+            })
+            return True
+
+    # ============ 数据读取 ============
+
+    def load_training_data(self, db: Session, chunk_size: int = STREAM_CHUNK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+        """分块流式读取带标签的训练样本
+
+        只选取需要的列，服务端游标按 chunk_size 分批拉取，
+        每批直接转换为 numpy 数组，避免一次性构造大量ORM对象。
+        """
+        query = db.query(
+            UserProfile.factor_social,
+            UserProfile.factor_psych,
+            UserProfile.factor_incent,
+            UserProfile.factor_tech,
+            UserProfile.factor_env,
+            UserProfile.factor_personal,
+            Activity.incentive_amount,
+            Activity.incentive_type,
+            Activity.type,
+            Recommendation.is_accepted
+        ).join(
+            UserProfile, UserProfile.user_id == Recommendation.user_id
+        ).join(
+            Activity, Activity.id == Recommendation.activity_id
+        ).execution_options(stream_results=True, yield_per=chunk_size)
+
+        X_chunks, y_chunks = [], []
+        buffer = []
+        for row in query:
+            buffer.append(row)
+            if len(buffer) >= chunk_size:
+                X_chunk, y_chunk = self._rows_to_arrays(buffer)
+                X_chunks.append(X_chunk)
+                y_chunks.append(y_chunk)
+                buffer = []
+                self._update_status(message=f"已读取 {sum(len(c) for c in y_chunks)} 条样本")
+        if buffer:
+            X_chunk, y_chunk = self._rows_to_arrays(buffer)
+            X_chunks.append(X_chunk)
+            y_chunks.append(y_chunk)
+
+        if not X_chunks:
+            return np.empty((0, len(FEATURE_NAMES))), np.empty(0, dtype=int)
+        return np.vstack(X_chunks), np.concatenate(y_chunks)
+
+    @staticmethod
+    def _rows_to_arrays(rows) -> Tuple[np.ndarray, np.ndarray]:
+        X = np.array([
+            np.concatenate([
+                user_factor_vector(row[:6]),
+                activity_feature_vector(row[6], row[7], row[8])
+            ])
+            for row in rows
+        ])
+        y = np.array([1 if row[9] else 0 for row in rows], dtype=int)
+        return X, y
+
+    # ============ 训练任务 ============
+
+    def run(self, params: Dict[str, Any] = None, activate: bool = False) -> Optional[Dict[str, Any]]:
+        """执行训练任务（在后台任务中调用）
+
+        Args:
+            params: 覆盖 training.random_forest 的参数
+            activate: 训练完成后是否立即激活新版本
+        """
+        self._update_status(state="running", stage="loading_data", progress=0.0, error=None)
+        started = time.time()
+        db = SessionLocal()
+        try:
+            X, y = self.load_training_data(db)
+            db.close()
+
+            positives = int(y.sum())
+            negatives = int(len(y) - positives)
+            if min(positives, negatives) < MIN_SAMPLES_PER_CLASS:
+                raise ValueError(
+                    f"训练样本不足：正样本 {positives} 条，负样本 {negatives} 条，"
+                    f"每类至少需要 {MIN_SAMPLES_PER_CLASS} 条"
+                )
+            self._update_status(message=f"共 {len(y)} 条样本（正样本 {positives}）")
+
+            # 进度：数据读取 10%，交叉验证 10%-80%，最终训练 80%-95%，发布 95%-100%
+            stage_ranges = {"cross_validation": (0.1, 0.8), "final_fit": (0.8, 0.95)}
+
+            def on_progress(stage: str, fraction: float):
+                low, high = stage_ranges[stage]
+                self._update_status(stage=stage, progress=round(low + (high - low) * fraction, 4))
+
+            trainer = ModelTrainer()
+            result = trainer.train_with_config(X, y, params=params, progress_callback=on_progress)
+
+            self._update_status(stage="publishing", progress=0.95)
+            manifest = self._publish(result, positives)
+
+            self._update_status(
+                state="completed",
+                stage="done",
+                progress=1.0,
+                version=manifest["version"],
+                metrics=manifest["metrics"],
+                message=f"训练完成，耗时 {time.time() - started:.1f}s",
+                finished_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            )
+
+            if activate:
+                from app.services.model_service import model_service
+                if model_service.begin_activation(manifest["version"]):
+                    model_service.activate(manifest["version"])
+            return manifest
+        except Exception as e:
+            logger.error(f"模型训练失败: {e}")
+            self._update_status(
+                state="failed",
+                error=str(e),
+                finished_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            )
+            return None
+        finally:
+            db.close()
+
+    def _publish(self, result: Dict[str, Any], positives: int) -> Dict[str, Any]:
+        """将训练结果发布为注册中心的新版本"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model_path = os.path.join(tmp_dir, "model.pkl")
+            joblib.dump(result["model"], model_path)
+            return get_registry().publish(
+                files={"model": model_path},
+                metrics={
+                    **result["test_metrics"],
+                    "cv": result["cv_summary"],
+                },
+                metadata={
+                    "model_type": type(result["model"]).__name__,
+                    "feature_names": FEATURE_NAMES,
+                    "params": result["params"],
+                    "threshold": result["threshold"],
+                    "train_samples": result["train_samples"],
+                    "test_samples": result["test_samples"],
+                    "positive_samples": positives,
+                    "cv_folds": result["cv_folds"],
+                    "benchmark": result["benchmark"],
+                    "meets_targets": result["meets_targets"],
+                    "source": "training_service",
+                }
+            )
+
+
+training_service = TrainingService()
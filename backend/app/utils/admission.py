@@ -0,0 +1,159 @@
+"""
+准入控制与过载丢弃
+文件名：app/utils/admission.py
+
+按 inference.admission.routes 把请求分为优先级类别（推荐流 feed > 反馈写入 feedback > 管理分析 admin），
+反馈写入只包括点击、反馈、参与等用户行为接口，活动的创建、修改与删除归入管理类别；
+共享 max_concurrent 个并发名额，各类别还可以单独限制并发数（管理接口再多也只占少量名额）。
+名额用完时请求进入本类别的有界队列；名额释放后按优先级依次放行排队的请求。
+队列已满或排队超过 queue_timeout_ms 的请求直接返回503与Retry-After，避免线程池与数据库连接池被占满后
+所有请求一起变慢。未匹配任何规则的请求（健康检查、登录等）不受限制。
+
+在事件循环中使用（HTTP中间件），状态只在事件循环线程中修改。
+"""
+
+import asyncio
+import re
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from app.config_loader import rec_config
+
+
+class AdmissionRejected(Exception):
+    """请求被丢弃（队列已满或排队超时）"""
+
+    def __init__(self, request_class: str, reason: str):
+        super().__init__(f"{request_class}: {reason}")
+        self.request_class = request_class
+        self.reason = reason
+
+
+class AdmissionController:
+    """带优先级类别的并发限制器"""
+
+    def __init__(self):
+        self._in_flight = 0
+        self._in_flight_by_class: Dict[str, int] = {}
+        self._queues: Dict[str, Deque[asyncio.Future]] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def config() -> Dict[str, Any]:
+        return rec_config.get("inference.admission", {}) or {}
+
+    def enabled(self) -> bool:
+        return bool(self.config().get("enabled", False))
+
+    def retry_after_seconds(self) -> int:
+        return int(self.config().get("retry_after_seconds", 1))
+
+    def classify(self, method: str, path: str) -> Optional[str]:
+        """按顺序匹配路由规则（路径前缀 prefix 或完整匹配的正则 pattern + 方法），返回请求类别"""
+        for rule in self.config().get("routes", []):
+            methods = rule.get("methods")
+            if methods and method not in methods:
+                continue
+            if "pattern" in rule:
+                if re.fullmatch(rule["pattern"], path):
+                    return rule["class"]
+            elif path.startswith(rule["prefix"]):
+                return rule["class"]
+        return None
+
+    def _class_config(self, request_class: str) -> Dict[str, Any]:
+        return self.config().get("classes", {}).get(request_class, {})
+
+    def _counters(self, request_class: str) -> Dict[str, int]:
+        stats = self._stats.get(request_class)
+        if stats is None:
+            stats = self._stats[request_class] = {
+                "admitted": 0, "queued": 0, "shed_queue_full": 0, "shed_timeout": 0, "max_queue_depth": 0
+            }
+            self._queues[request_class] = deque()
+            self._in_flight_by_class[request_class] = 0
+        return stats
+
+    def _can_run(self, request_class: str) -> bool:
+        class_limit = self._class_config(request_class).get("max_concurrent")
+        return (
+            self._in_flight < self.config().get("max_concurrent", 32)
+            and (class_limit is None or self._in_flight_by_class[request_class] < class_limit)
+        )
+
+    def _admit(self, request_class: str):
+        self._in_flight += 1
+        self._in_flight_by_class[request_class] += 1
+        self._stats[request_class]["admitted"] += 1
+
+    async def acquire(self, request_class: str):
+        """取得并发名额，必要时排队；被丢弃时抛出 AdmissionRejected"""
+        stats = self._counters(request_class)
+        queue = self._queues[request_class]
+        if not queue and self._can_run(request_class):
+            self._admit(request_class)
+            return
+
+        class_cfg = self._class_config(request_class)
+        if len(queue) >= class_cfg.get("queue_size", 64):
+            stats["shed_queue_full"] += 1
+            raise AdmissionRejected(request_class, "queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        stats["queued"] += 1
+        stats["max_queue_depth"] = max(stats["max_queue_depth"], len(queue))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), class_cfg.get("queue_timeout_ms", 500) / 1000)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # 超时的同时被放行：名额已计入，照常处理
+                return
+            waiter.cancel()
+            queue.remove(waiter)
+            stats["shed_timeout"] += 1
+            raise AdmissionRejected(request_class, "timeout")
+        except asyncio.CancelledError:
+            # 客户端断开：已被放行则归还名额，否则移出队列
+            if waiter.done() and not waiter.cancelled():
+                self.release(request_class)
+            else:
+                waiter.cancel()
+                queue.remove(waiter)
+            raise
+
+    def release(self, request_class: str):
+        """归还名额并按优先级放行排队的请求"""
+        self._in_flight -= 1
+        self._in_flight_by_class[request_class] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        classes = self.config().get("classes", {})
+        for request_class in sorted(self._queues, key=lambda c: classes.get(c, {}).get("priority", 100)):
+            queue = self._queues[request_class]
+            while queue and self._can_run(request_class):
+                waiter = queue.popleft()
+                if waiter.done():
+                    continue
+                self._admit(request_class)
+                waiter.set_result(True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """{in_flight, max_concurrent, classes: {类别: {in_flight, queue_depth, admitted, queued, shed_*}}}"""
+        classes: Dict[str, Any] = {}
+        for request_class in list(self._stats):
+            classes[request_class] = {
+                "in_flight": self._in_flight_by_class[request_class],
+                "queue_depth": len(self._queues[request_class]),
+                **self._stats[request_class],
+            }
+        return {
+            "enabled": self.enabled(),
+            "in_flight": self._in_flight,
+            "max_concurrent": self.config().get("max_concurrent", 32),
+            "classes": classes,
+        }
+
+
+admission_controller = AdmissionController()
@@ -0,0 +1,170 @@
+"""
+请求截止时间
+文件名：app/utils/deadline.py
+
+每个推荐/解释请求按 inference.timeout.total_request_ms 创建一个 Deadline，沿调用链传递；
+各阶段在开始前检查剩余时间，模型打分等可能阻塞的调用放到工作线程中执行，
+最多等待 min(阶段预算, 剩余时间)，超时后调用方改用降级结果（尚未开始的调用被取消，已开始的仍会执行完毕）。
+工作线程池的排队数有上限（inference.timeout.worker_queue_size），排满时直接按超时处理，不再堆积被放弃的调用。
+
+数据库读取不能放到工作线程中（会话不是线程安全的），由 statement_timeout 在数据库侧限制语句执行时间：
+MySQL 设置会话的 max_execution_time，SQLite 注册进度回调在超时后中断查询，其他数据库只在阶段开始前检查。
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.config_loader import rec_config
+
+
+class DeadlineExceeded(Exception):
+    """某个阶段超出预算"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"阶段超时: {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """请求的截止时间（单调时钟）"""
+
+    def __init__(self, budget_ms: Optional[float]):
+        self.budget_ms = budget_ms
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + budget_ms / 1000 if budget_ms else None
+
+    @classmethod
+    def from_config(cls, key: str = "total_request_ms") -> "Deadline":
+        """按 inference.timeout 中的预算创建（未配置或为0时不限时）"""
+        return cls(rec_config.get(f"inference.timeout.{key}"))
+
+    @staticmethod
+    def stage_budget(key: str) -> Optional[float]:
+        return rec_config.get(f"inference.timeout.{key}")
+
+    def remaining_ms(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return max(0.0, (self.expires_at - time.monotonic()) * 1000)
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self.started_at) * 1000
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self, stage: str):
+        """已超时则抛出 DeadlineExceeded"""
+        if self.expired():
+            raise DeadlineExceeded(stage)
+
+    def timeout_ms(self, stage_budget_ms: Optional[float] = None) -> Optional[float]:
+        """阶段可等待的时间：阶段预算与剩余时间中的较小者（均未设置时为None）"""
+        limits = [v for v in (stage_budget_ms, self.remaining_ms()) if v is not None]
+        return min(limits) if limits else None
+
+    def wait(self, future: Future, stage: str, stage_budget_ms: Optional[float] = None):
+        """在预算内等待 future 的结果，超时抛出 DeadlineExceeded"""
+        timeout = self.timeout_ms(stage_budget_ms)
+        try:
+            return future.result(timeout=None if timeout is None else timeout / 1000)
+        except FutureTimeoutError:
+            # 还在排队的调用不再执行
+            future.cancel()
+            raise DeadlineExceeded(stage)
+
+
+@contextmanager
+def statement_timeout(db: Session, deadline: Deadline, stage: str, stage_budget_ms: Optional[float] = None):
+    """在 min(阶段预算, 剩余时间) 内执行块中的数据库读取，超时回滚会话并抛出 DeadlineExceeded"""
+    timeout = deadline.timeout_ms(stage_budget_ms)
+    if timeout is None:
+        yield
+        return
+    deadline.check(stage)
+    expires_at = time.monotonic() + timeout / 1000
+    connection = db.connection()
+    dialect = connection.dialect.name
+    driver_connection = connection.connection.driver_connection
+    if dialect == "mysql":
+        connection.exec_driver_sql(f"SET SESSION max_execution_time = {max(1, int(timeout))}")
+    elif dialect == "sqlite":
+        driver_connection.set_progress_handler(lambda: time.monotonic() >= expires_at, 1000)
+    try:
+        try:
+            yield
+        finally:
+            # 连接归还连接池前恢复默认设置
+            if dialect == "mysql":
+                connection.exec_driver_sql("SET SESSION max_execution_time = DEFAULT")
+            elif dialect == "sqlite":
+                driver_connection.set_progress_handler(None, 0)
+    except OperationalError as e:
+        if time.monotonic() < expires_at:
+            raise
+        db.rollback()
+        raise DeadlineExceeded(stage) from e
+
+
+class WorkerPool:
+    """排队数有上限的线程池：正在执行与排队的调用总数达到 max_workers + max_queue 时拒绝提交"""
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="deadline")
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "rejected": 0, "cancelled": 0}
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """提交调用；已排满时抛出 DeadlineExceeded("worker_queue")"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise DeadlineExceeded("worker_queue")
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._stats["submitted"] += 1
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future):
+        self._slots.release()
+        if future.cancelled():
+            with self._lock:
+                self._stats["cancelled"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats)
+
+
+_pool: Optional[WorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def worker_pool() -> WorkerPool:
+    """截止时间工作线程池（线程数 inference.timeout.worker_threads，排队上限 worker_queue_size）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = WorkerPool(
+                    max_workers=rec_config.get("inference.timeout.worker_threads", 8),
+                    max_queue=rec_config.get("inference.timeout.worker_queue_size", 32)
+                )
+    return _pool
+
+
+def run_in_worker(fn: Callable, *args) -> Future:
+    """在截止时间工作线程池中执行；排队已满时抛出 DeadlineExceeded"""
+    return worker_pool().submit(fn, *args)
@@ -0,0 +1,54 @@
+"""
+线上服务指标
+文件名：app/utils/metrics.py
+
+按（接口, 服务层级）统计请求数与最近若干次耗时的分位数，用于观察降级比例与尾延迟。
+"""
+
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+
+import numpy as np
+
+
+class ServingMetrics:
+    """请求计数与耗时分位数（每个接口/层级保留最近 window 次耗时）"""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counts: Dict[Tuple[str, str], int] = {}
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+
+    def record(self, endpoint: str, tier: str, elapsed_ms: float):
+        key = (endpoint, tier)
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+            latencies = self._latencies.get(key)
+            if latencies is None:
+                latencies = self._latencies[key] = deque(maxlen=self.window)
+            latencies.append(elapsed_ms)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """{接口: {层级: {count, p50_ms, p99_ms, max_ms}}}"""
+        with self._lock:
+            items = [(key, count, list(self._latencies[key])) for key, count in self._counts.items()]
+        stats: Dict[str, Dict[str, Any]] = {}
+        for (endpoint, tier), count, latencies in items:
+            values = np.array(latencies)
+            stats.setdefault(endpoint, {})[tier] = {
+                "count": count,
+                "p50_ms": round(float(np.percentile(values, 50)), 2),
+                "p99_ms": round(float(np.percentile(values, 99)), 2),
+                "max_ms": round(float(values.max()), 2),
+            }
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+            self._latencies.clear()
+
+
+serving_metrics = ServingMetrics()
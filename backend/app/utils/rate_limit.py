@@ -0,0 +1,233 @@
+"""
+按用户限流
+文件名：app/utils/rate_limit.py
+
+按 inference.rate_limit 的每秒/每分钟请求数为每个登录用户维护令牌桶，每次请求 O(1) 检查：
+按距上次请求的时间补充令牌，所有桶都至少有一个令牌时各扣一个并放行，否则返回需等待的秒数。
+
+- local：进程内存储，按 key 的哈希分到多个带锁的分段，单 worker 部署时使用；
+- redis：Lua 脚本在 Redis 中原子地完成补充与扣减，多 worker 共享限额（REDIS_URL）。
+  LocalScriptClient 提供与 redis-py 相同的 register_script 接口，在进程内执行同样的逻辑，用于测试。
+
+配置为 redis 但无法连接时启动失败（start()），不会静默退回各 worker 独立计数；
+运行中存储出错时放行请求（只记录错误次数），限流不应成为服务的单点。
+"""
+
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.config_loader import rec_config
+from app.utils.logger import logger
+
+
+# (桶容量, 每秒补充的令牌数)
+Rule = Tuple[float, float]
+
+
+def take_token(state: Optional[List[float]], rules: Sequence[Rule], now: float) -> Tuple[bool, float, List[float]]:
+    """补充令牌并尝试扣减
+
+    Args:
+        state: [上次时间, 各桶令牌数...]，新用户或规则变化后为 None
+
+    Returns:
+        (是否放行, 需等待的秒数, 新状态)
+    """
+    if state is None or len(state) != len(rules) + 1:
+        tokens = [float(capacity) for capacity, _ in rules]
+    else:
+        elapsed = max(0.0, now - state[0])
+        tokens = [min(capacity, t + elapsed * rate) for t, (capacity, rate) in zip(state[1:], rules)]
+    wait = max(((1 - t) / rate for t, (_, rate) in zip(tokens, rules) if t < 1), default=0.0)
+    if wait == 0:
+        tokens = [t - 1 for t in tokens]
+    return wait == 0, wait, [now] + tokens
+
+
+def refill_seconds(rules: Sequence[Rule]) -> float:
+    """空桶补满所需时间（超过该时间未访问的桶与新桶等价，可以丢弃）"""
+    return max(capacity / rate for capacity, rate in rules)
+
+
+class LocalBucketStore:
+    """进程内令牌桶存储（分段加锁）"""
+
+    def __init__(self, stripes: int = 64, max_keys_per_stripe: int = 10000, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._max_keys = max_keys_per_stripe
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._buckets: List[Dict[str, List[float]]] = [{} for _ in range(stripes)]
+
+    def acquire(self, key: str, rules: Sequence[Rule]) -> Tuple[bool, float]:
+        stripe = hash(key) % len(self._locks)
+        buckets = self._buckets[stripe]
+        with self._locks[stripe]:
+            now = self._clock()
+            allowed, wait, buckets[key] = take_token(buckets.get(key), rules, now)
+            if len(buckets) > self._max_keys:
+                self._evict_idle(buckets, now - refill_seconds(rules))
+        return allowed, wait
+
+    @staticmethod
+    def _evict_idle(buckets: Dict[str, List[float]], before: float):
+        for key in [k for k, state in buckets.items() if state[0] < before]:
+            del buckets[key]
+
+    def size(self) -> int:
+        return sum(len(b) for b in self._buckets)
+
+
+# KEYS[1] = 桶的键；ARGV = [过期秒数, 容量1, 速率1, 容量2, 速率2, ...]
+# 使用 Redis 服务器时间，各 worker 的时钟差异不影响结果
+TOKEN_BUCKET_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local n = (#ARGV - 1) / 2
+local last = tonumber(redis.call('HGET', KEYS[1], 'ts'))
+local tokens = {}
+local wait = 0
+for i = 1, n do
+  local capacity = tonumber(ARGV[2 * i])
+  local rate = tonumber(ARGV[2 * i + 1])
+  local value = tonumber(redis.call('HGET', KEYS[1], 't' .. i))
+  if last == nil or value == nil then
+    value = capacity
+  else
+    value = math.min(capacity, value + math.max(0, now - last) * rate)
+  end
+  if value < 1 then
+    wait = math.max(wait, (1 - value) / rate)
+  end
+  tokens[i] = value
+end
+local allowed = 0
+if wait == 0 then
+  allowed = 1
+end
+for i = 1, n do
+  redis.call('HSET', KEYS[1], 't' .. i, tostring(tokens[i] - allowed))
+end
+redis.call('HSET', KEYS[1], 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[1]))
+return {allowed, tostring(wait)}
+"""
+
+
+class ScriptBucketStore:
+    """脚本型共享令牌桶存储（redis-py 客户端或 LocalScriptClient）"""
+
+    def __init__(self, client, prefix: str = "rate_limit:"):
+        self._prefix = prefix
+        self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def acquire(self, key: str, rules: Sequence[Rule]) -> Tuple[bool, float]:
+        args: List[Any] = [math.ceil(refill_seconds(rules)) + 1]
+        for capacity, rate in rules:
+            args += [capacity, rate]
+        allowed, wait = self._script(keys=[self._prefix + key], args=args)
+        return bool(int(allowed)), float(wait)
+
+
+class LocalScriptClient:
+    """进程内替身：register_script 返回的脚本与 TOKEN_BUCKET_SCRIPT 行为一致（整体加锁执行）"""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._hashes: Dict[str, List[float]] = {}
+
+    def register_script(self, script: str) -> Callable:
+        def run(keys: Sequence[str], args: Sequence[Any]):
+            values = [float(a) for a in args[1:]]
+            rules = list(zip(values[0::2], values[1::2]))
+            with self._lock:
+                allowed, wait, self._hashes[keys[0]] = take_token(self._hashes.get(keys[0]), rules, self._clock())
+            return [int(allowed), str(wait)]
+        return run
+
+
+class RateLimiter:
+    """按用户的请求限流"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._store = None
+        self._backend = None
+        self._stats = {"allowed": 0, "limited": 0, "errors": 0}
+
+    @staticmethod
+    def config() -> Dict[str, Any]:
+        return rec_config.get("inference.rate_limit", {}) or {}
+
+    def enabled(self) -> bool:
+        return bool(self.config().get("enabled", True)) and bool(self.rules())
+
+    def rules(self) -> List[Rule]:
+        cfg = self.config()
+        rules = []
+        per_second = cfg.get("requests_per_second_per_user")
+        if per_second:
+            rules.append((float(per_second), float(per_second)))
+        per_minute = cfg.get("requests_per_minute_per_user")
+        if per_minute:
+            rules.append((float(per_minute), per_minute / 60.0))
+        return rules
+
+    def is_shared(self) -> bool:
+        """存储是否在多个 worker 间共享（共享存储的网络调用不应在事件循环中执行）"""
+        return self._get_store() is not None and self._backend != "local"
+
+    def start(self):
+        """启动时创建存储；配置为 redis 但不可用时抛出 RuntimeError"""
+        if self.enabled():
+            self._get_store()
+
+    def use_store(self, store, backend: str):
+        """替换存储（测试或运行时切换）"""
+        with self._lock:
+            self._store, self._backend = store, backend
+
+    def _get_store(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store, self._backend = self._create_store(self.config())
+        return self._store
+
+    @staticmethod
+    def _create_store(cfg: Dict[str, Any]):
+        if cfg.get("backend", "local") == "redis":
+            try:
+                import redis
+                from app.config import settings
+
+                client = redis.Redis.from_url(settings.REDIS_URL)
+                client.ping()
+            except Exception as e:
+                raise RuntimeError(f"限流配置为 redis 但 Redis 不可用（REDIS_URL）: {e}") from e
+            return ScriptBucketStore(client, cfg.get("key_prefix", "rate_limit:")), "redis"
+        return LocalBucketStore(
+            stripes=cfg.get("stripes", 64), max_keys_per_stripe=cfg.get("max_keys_per_stripe", 10000)
+        ), "local"
+
+    def check(self, user_key: str) -> Tuple[bool, float]:
+        """(是否放行, 建议的重试等待秒数)"""
+        try:
+            allowed, wait = self._get_store().acquire(user_key, self.rules())
+        except Exception as e:
+            logger.warning(f"限流检查失败，放行请求: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+            return True, 0.0
+        with self._lock:
+            self._stats["allowed" if allowed else "limited"] += 1
+        return allowed, wait
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "backend": self._backend, "rules": self.rules()}
+
+
+rate_limiter = RateLimiter()
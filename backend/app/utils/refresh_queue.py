@@ -0,0 +1,72 @@
+"""
+后台刷新队列
+文件名：app/utils/refresh_queue.py
+
+有界队列 + 固定数量的工作线程：同一个 key 排队或执行期间不重复入队，队列满时直接丢弃
+（调用方继续使用旧数据），避免模型切换或发布后大量缓存同时过期造成的刷新风暴。
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Set
+
+from app.utils.logger import logger
+
+
+class RefreshQueue:
+    """去重的有界后台刷新队列"""
+
+    def __init__(self, worker: Callable[[Hashable], None], name: str, max_size: int = 256, workers: int = 2):
+        self.name = name
+        self._worker = worker
+        self._workers = workers
+        self._queue: "queue.Queue[Hashable]" = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._pending: Set[Hashable] = set()
+        self._threads: List[threading.Thread] = []
+        self._stats = {"enqueued": 0, "deduplicated": 0, "dropped": 0, "completed": 0, "failed": 0}
+
+    def enqueue(self, key: Hashable) -> bool:
+        """提交刷新任务；已在排队/执行中或队列已满时返回False"""
+        with self._lock:
+            if key in self._pending:
+                self._stats["deduplicated"] += 1
+                return False
+            try:
+                self._queue.put_nowait(key)
+            except queue.Full:
+                self._stats["dropped"] += 1
+                return False
+            self._pending.add(key)
+            self._stats["enqueued"] += 1
+        self._ensure_workers()
+        return True
+
+    def _ensure_workers(self):
+        if len(self._threads) == self._workers and all(t.is_alive() for t in self._threads):
+            return
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self._workers:
+                thread = threading.Thread(
+                    target=self._run, name=f"{self.name}-{len(self._threads)}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            key = self._queue.get()
+            try:
+                self._worker(key)
+                outcome = "completed"
+            except Exception as e:
+                logger.warning(f"后台刷新失败 ({self.name}, {key}): {e}")
+                outcome = "failed"
+            with self._lock:
+                self._pending.discard(key)
+                self._stats[outcome] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "pending": len(self._pending), "capacity": self._queue.maxsize}
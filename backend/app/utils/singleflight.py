@@ -0,0 +1,86 @@
+"""
+并发请求合并（single-flight）
+文件名：app/utils/singleflight.py
+
+同一 key 同时只执行一次计算：第一个调用方执行，其余并发调用方等待同一个 Future 并共享结果
+（或异常）。等待超过超时时间的调用方返回 None 由调用方自行处理。计算结束后立即移除 key，
+不缓存结果。
+"""
+
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from app.config_loader import rec_config
+
+
+_registry: Dict[str, "SingleFlight"] = {}
+
+
+def get_all_stats() -> Dict[str, Dict[str, Any]]:
+    """各合并组的执行、共享、等待超时次数"""
+    return {name: group.get_stats() for name, group in _registry.items()}
+
+
+class SingleFlight:
+    """按 key 合并并发计算"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._stats = {"executions": 0, "shared": 0, "timeouts": 0}
+        _registry[name] = self
+
+    @staticmethod
+    def config() -> Dict[str, Any]:
+        return rec_config.get("inference.singleflight", {}) or {}
+
+    def default_timeout_ms(self) -> Optional[float]:
+        return self.config().get("timeout_ms", 2000)
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout_ms: Optional[float] = None) -> Tuple[bool, Any]:
+        """执行或等待 key 对应的计算
+
+        Returns:
+            (是否取得结果, 结果)；等待其它调用方超时时返回 (False, None)
+        """
+        if not self.config().get("enabled", True):
+            return True, fn()
+
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self._stats["executions"] += 1
+            else:
+                self._stats["shared"] += 1
+
+        if leader:
+            try:
+                result = fn()
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            else:
+                future.set_result(result)
+                return True, result
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+
+        timeout_ms = self.default_timeout_ms() if timeout_ms is None else timeout_ms
+        try:
+            return True, future.result(timeout=None if timeout_ms is None else timeout_ms / 1000)
+        except FutureTimeoutError:
+            with self._lock:
+                self._stats["timeouts"] += 1
+            return False, None
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls)}
@@ -0,0 +1,97 @@
+"""
+哈希时间轮
+文件名：app/utils/timer_wheel.py
+
+定时任务按到期时间落入 slots 个槽位之一，后台线程每个刻度只检查当前槽位中的任务，
+代价与到期任务数相关，而与已登记任务总数无关。超过一圈的任务留在槽位中，到期后才触发。
+同一个 key 重复登记时替换原任务。
+"""
+
+import math
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.utils.logger import logger
+
+
+class TimerWheel:
+    """单线程时间轮调度器（回调在调度线程中执行，应尽快返回）"""
+
+    def __init__(self, tick_seconds: float = 1.0, slots: int = 3600, name: str = "timer-wheel"):
+        self.tick_seconds = tick_seconds
+        self.slots = slots
+        self.name = name
+        self._lock = threading.Lock()
+        self._wheel: List[Dict[Hashable, Tuple[float, Callable[[], None]]]] = [{} for _ in range(slots)]
+        self._slot_of: Dict[Hashable, int] = {}
+        self._last_tick = self._tick(time.time())
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def _tick(self, timestamp: float) -> int:
+        return int(timestamp // self.tick_seconds)
+
+    def schedule(self, key: Hashable, when: float, callback: Callable[[], None]):
+        """登记任务：到达时间戳 when 后执行 callback（when 已过去时在下一个刻度执行）"""
+        with self._lock:
+            self._remove(key)
+            # 落在到期时刻之后的第一个刻度，处理该刻度时任务必然已到期
+            slot = max(math.ceil(when / self.tick_seconds), self._last_tick + 1) % self.slots
+            self._wheel[slot][key] = (when, callback)
+            self._slot_of[key] = slot
+
+    def cancel(self, key: Hashable):
+        with self._lock:
+            self._remove(key)
+
+    def keys(self) -> List[Hashable]:
+        with self._lock:
+            return list(self._slot_of)
+
+    def _remove(self, key: Hashable):
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            self._wheel[slot].pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def start(self):
+        """启动调度线程（未启动时可调用 advance() 手动推进）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def advance(self, now: Optional[float] = None) -> int:
+        """处理截至 now 的所有刻度，返回执行的任务数"""
+        now = time.time() if now is None else now
+        due: List[Callable[[], None]] = []
+        with self._lock:
+            current = self._tick(now)
+            # 落后超过一圈时每个槽位只需检查一次
+            for tick in range(max(self._last_tick + 1, current - self.slots + 1), current + 1):
+                bucket = self._wheel[tick % self.slots]
+                for key in [k for k, (when, _) in bucket.items() if when <= now]:
+                    due.append(bucket.pop(key)[1])
+                    self._slot_of.pop(key, None)
+            self._last_tick = max(self._last_tick, current)
+
+        for callback in due:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"定时任务执行失败: {e}")
+        return len(due)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            next_tick = (self._tick(time.time()) + 1) * self.tick_seconds
+            if self._stop_event.wait(max(0.0, next_tick - time.time())):
+                break
+            self.advance()
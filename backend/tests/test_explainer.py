@@ -0,0 +1,26 @@
+"""
+SHAP解释器测试
+文件名：tests/test_explainer.py
+"""
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from app.ml.explainer import SHAPExplainer
+from app.ml.predict import RecommenderModel
+
+
+def test_global_importance_labels_follow_model_inputs():
+    """3维（降维后）模型的SHAP列不使用原始因子名称；清单记录了特征名时按清单标注"""
+    model = RecommenderModel(model_path=None, scaler_path=None, fa_path=None)
+    model.model = RandomForestClassifier(n_estimators=3, max_depth=2, random_state=0)
+    model.model.fit([[0.1] * 3, [0.9] * 3, [0.2] * 3, [0.8] * 3], [0, 1, 0, 1])
+    assert model.input_feature_names() == ["feature_0", "feature_1", "feature_2"]
+
+    model.manifest = {"feature_names": ["latent_1", "latent_2", "latent_3"]}
+    assert model.input_feature_names() == ["latent_1", "latent_2", "latent_3"]
+
+    features = SHAPExplainer().format_global_importance(np.array([0.1, 0.3, 0.2]))["features"]
+    assert [f["name"] for f in features] == ["feature_1", "feature_2", "feature_0"]
+    features = SHAPExplainer().format_global_importance(np.array([0.1, 0.3, 0.2]), model.input_feature_names())["features"]
+    assert features[0]["name"] == "latent_2"
@@ -0,0 +1,79 @@
+"""
+模型注册中心测试
+文件名：tests/test_model_registry.py
+"""
+
+import joblib
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from app.ml.registry import ModelRegistry
+
+
+@pytest.fixture
+def model_file(tmp_path):
+    """训练一个极小的模型并保存"""
+    model = RandomForestClassifier(n_estimators=3, max_depth=2, random_state=0)
+    model.fit([[0.1] * 9, [0.9] * 9, [0.2] * 9, [0.8] * 9], [0, 1, 0, 1])
+    path = tmp_path / "model.pkl"
+    joblib.dump(model, path)
+    return str(path)
+
+
+def test_publish_and_verify(tmp_path, model_file):
+    """发布后可按清单解析文件，篡改后校验失败"""
+    registry = ModelRegistry(str(tmp_path / "registry"))
+    manifest = registry.publish({"model": model_file}, metrics={"auc": 0.9})
+
+    version = manifest["version"]
+    assert registry.get_manifest(version)["metrics"]["auc"] == 0.9
+    assert "model" in registry.resolve_files(version)
+
+    with open(registry.resolve_files(version)["model"], "ab") as f:
+        f.write(b"tampered")
+    with pytest.raises(ValueError):
+        registry.resolve_files(version)
+
+
+def test_activate_and_rollback(tmp_path, model_file):
+    """激活历史支持逐级回滚"""
+    registry = ModelRegistry(str(tmp_path / "registry"))
+    v1 = registry.publish({"model": model_file}, version="v1")["version"]
+    v2 = registry.publish({"model": model_file}, version="v2")["version"]
+    v3 = registry.publish({"model": model_file}, version="v3")["version"]
+
+    for version in (v1, v2, v3):
+        registry.set_active(version)
+    assert registry.get_active_version() == v3
+
+    # 查看回滚目标不修改历史，切换成功写入激活版本时才移除
+    target = registry.peek_rollback_target()
+    assert target == v2
+    assert registry.peek_rollback_target() == v2
+    registry.set_active(target, record_previous=False)
+    assert registry.get_active_history() == [v1]
+    assert registry.peek_rollback_target() == v1
+    registry.set_active(v1, record_previous=False)
+    assert registry.peek_rollback_target() is None
+
+
+def test_activate_keeps_serving_model_when_persisting_fails(tmp_path, model_file, monkeypatch):
+    """写入激活文件失败时不切换线上模型，状态为 failed"""
+    from app.ml import predict
+    from app.services import model_service as model_service_module
+
+    registry = ModelRegistry(str(tmp_path / "registry"))
+    registry.publish({"model": model_file}, version="v1")
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(registry, "set_active", fail)
+    monkeypatch.setattr(model_service_module, "get_registry", lambda: registry)
+    serving = predict.get_model()
+    service = model_service_module.ModelService()
+
+    assert service.activate("v1") is False
+    assert predict.get_model() is serving
+    assert service.get_status()["state"] == "failed"
+    assert registry.get_active_version() is None
@@ -0,0 +1,668 @@
+"""
+线上打分与排序测试
+文件名：tests/test_serving.py
+"""
+
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.config_loader import rec_config
+from app.ml.batching import MicroBatcher
+from app.ml.lookup import ScoreLookupTable
+from app.ml.ranking import mmr_rerank, sample_head, top_k
+from app.services.catalog_service import CatalogSnapshot
+from app.services.ranking_cache import RankingCache
+from app.services.retrieval_service import RetrievalService
+from app.services.shortlist_service import shortlist_recall
+
+
+def test_lookup_table_interpolates_linear_scores(tmp_path):
+    """多线性插值对线性打分函数精确还原，各活动组合互不干扰"""
+    def score_fn(X):
+        return X[:, :6].mean(axis=1) * 0.5 + X[:, 6] / 100
+
+    tuples = np.array([[10.0, 0, 1], [50.0, 2, 0]])
+    table = ScoreLookupTable.build(score_fn, tuples, step=0.25, path=str(tmp_path / "table.npy"))
+
+    user = np.array([0.13, 0.5, 0.77, 0.9, 0.01, 0.42])
+    scores = table.score(user, np.array([1, 0, 1]))
+    expected = user.mean() * 0.5 + np.array([0.5, 0.1, 0.5])
+    assert np.allclose(scores, expected, atol=1e-6)
+
+
+def test_lookup_table_build_for_superseded_key_is_discarded(tmp_path):
+    """旧模型/目录的构建晚于新目标完成时，不替换当前表也不删除新表的文件"""
+    from app.services.lookup_service import LookupTableService
+
+    service = LookupTableService(table_dir=str(tmp_path))
+    model = SimpleNamespace(version="v1", model=None, score_batch=lambda X: X[:, :6].mean(axis=1))
+    (tmp_path / "v2-table.npy").write_bytes(b"")
+    service._target_key = "v2-table"
+
+    service._build(model, np.array([[10.0, 0, 1]]), 0.5, "v1-table", force=True)
+
+    assert service._table is None and service._table_key is None
+    assert (tmp_path / "v2-table.npy").exists()
+
+
+def test_lookup_table_switch_removes_only_files_this_process_wrote(tmp_path):
+    """切换到新表后删除本进程写入的旧表，共享目录中其它 worker 的表保留"""
+    from app.services.lookup_service import LookupTableService
+
+    service = LookupTableService(table_dir=str(tmp_path))
+    model = SimpleNamespace(version="v1", model=None, score_batch=lambda X: X[:, :6].mean(axis=1))
+    tuples = np.array([[10.0, 0, 1]])
+    (tmp_path / "other-worker.npy").write_bytes(b"")
+    (tmp_path / "other-worker.json").write_text("{}")
+
+    for key in ("v1-table", "v2-table"):
+        service._target_key = key
+        service._build(model, tuples, 0.5, key, force=True)
+        assert service._table_key == key
+
+    names = sorted(p.name for p in tmp_path.iterdir())
+    assert names == ["other-worker.json", "other-worker.npy", "v2-table.json", "v2-table.npy"]
+
+
+def test_lookup_table_rejects_step_above_max_cells(tmp_path, monkeypatch):
+    """step=0.05 每个组合 21^6 格，超过默认 max_cells，构建失败并给出原因"""
+    from app.services.lookup_service import LookupTableService
+
+    service = LookupTableService(table_dir=str(tmp_path))
+    monkeypatch.setattr(LookupTableService, "config", staticmethod(lambda: {"max_cells": 50_000_000}))
+    model = SimpleNamespace(version="v1", model=None, score_batch=lambda X: X[:, :6].mean(axis=1))
+    service._target_key = "v1-fine"
+    service._build(model, np.array([[10.0, 0, 1]]), 0.05, "v1-fine", force=True)
+
+    status = service.get_status()
+    assert status["state"] == "failed" and "85766121" in status["error"]
+    assert not list(tmp_path.iterdir())
+
+
+class _CountingModel:
+    """记录 score_batch 调用次数的模型替身"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def score_batch(self, X):
+        self.calls += 1
+        time.sleep(0.02)  # 打分期间到达的请求进入合并队列
+        return X[:, 0] * 2
+
+
+def test_micro_batcher_merges_concurrent_requests():
+    """窗口内的并发请求合并为一次预测，各调用方拿回自己的切片"""
+    model = _CountingModel()
+    batcher = MicroBatcher(max_wait_ms=50, max_rows=10_000)
+    requests = [np.full((3, 9), i, dtype=float) for i in range(8)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda X: batcher.score(model, X), requests))
+
+    for i, result in enumerate(results):
+        assert np.array_equal(result, np.full(3, 2.0 * i))
+    assert model.calls < len(requests)
+    stats = batcher.get_stats()
+    assert stats["requests"] + stats["bypassed"] == len(requests)
+
+    # 没有并发请求时直接打分，不经过合并线程
+    before = stats["bypassed"]
+    assert np.array_equal(batcher.score(model, np.ones((2, 9))), np.full(2, 2.0))
+    assert batcher.get_stats()["bypassed"] == before + 1
+
+
+def test_micro_batcher_close_drains_queue_and_benchmark_leaves_no_threads():
+    """close() 处理完已排队的请求后停止后台线程；吞吐对比结束后不残留合并线程"""
+    import threading
+
+    from app.ml.batching import benchmark_throughput
+
+    model = _CountingModel()
+    batcher = MicroBatcher(max_wait_ms=50, max_rows=10_000)
+    batcher._ensure_worker()
+    futures = []
+    for i in range(3):
+        future = Future()
+        batcher._queue.put((model, np.full((2, 9), i, dtype=float), future))
+        futures.append(future)
+    batcher.close()
+    assert [f.result(timeout=0)[0] for f in futures] == [0.0, 2.0, 4.0]
+
+    before = {t for t in threading.enumerate() if t.name == "micro-batcher"}
+    benchmark_throughput(model, n_activities=5, concurrency_levels=[1, 4], requests_per_worker=2)
+    assert {t for t in threading.enumerate() if t.name == "micro-batcher"} <= before
+
+def _catalog(n):
+    activities = [
+        {
+            "activity_id": i + 1,
+            "title": f"活动{i + 1}",
+            "description": "",
+            "activity_type": ["invite", "quiz", "share"][i % 3],
+            "incentive_type": ["red_packet", "points", "coupon"][i % 3 if i % 2 else 0],
+            "incentive_amount": float(i % 50),
+            "target_cluster": "2" if i % 10 == 0 else None,
+            "start_time": None,
+            "end_time": None,
+            "status": "active",
+        }
+        for i in range(n)
+    ]
+    return CatalogSnapshot(1, "test", activities, True)
+
+
+def test_retrieval_caps_candidates_and_includes_target_cluster():
+    """候选数不超过上限、互不重复，并包含面向用户聚类的活动"""
+    snapshot = _catalog(500)
+    service = RetrievalService()
+    service.popularity._computed_at = time.time()  # 不读取数据库
+    profile = SimpleNamespace(
+        cluster_id=2, cluster_tag="观望保守型",
+        preference_activity_types="quiz", preference_incentive_types="points"
+    )
+
+    positions = service.retrieve(profile, snapshot, seed=0)
+
+    assert len(positions) == service.max_candidates()
+    assert len(np.unique(positions)) == len(positions)
+    quota = {g["name"]: g["quota"] for g in rec_config.get("inference.retrieval.generators")}["target_cluster"]
+    targeted = set(snapshot.by_target_cluster["2"].tolist())
+    assert len(targeted & set(positions.tolist())) >= int(quota * service.max_candidates())
+    assert np.array_equal(service.retrieve(profile, _catalog(20)), np.arange(20))
+
+
+def test_feed_depth_does_not_lift_candidate_cap():
+    """推荐流排序深度不超过召回上限，召回只为一页与已参与的活动补足"""
+    from app.services.recommendation_service import RecommendationService
+
+    cap = RetrievalService.max_candidates()
+    assert rec_config.get("inference.feed.depth") > cap
+    assert RecommendationService._feed_depth(10) == cap
+    assert RecommendationService._feed_depth(cap + 5) == cap + 5
+
+    service = RetrievalService()
+    service.popularity._computed_at = time.time()  # 不读取数据库
+    profile = SimpleNamespace(
+        cluster_id=2, cluster_tag="观望保守型",
+        preference_activity_types="quiz", preference_incentive_types="points"
+    )
+    assert len(service.retrieve(profile, _catalog(500), min_candidates=10 + 5, seed=0)) == cap
+
+
+def test_shortlist_recall_counts_tied_scores_as_hits():
+    """短名单召回率按分数比较，与全量第K名并列的活动算作命中"""
+    full_scores = np.array([0.9, 0.8, 0.8, 0.8, 0.1, 0.0])
+
+    assert shortlist_recall(full_scores, np.array([0, 3, 4]), k=2) == 1.0
+    assert shortlist_recall(full_scores, np.array([1, 4, 5]), k=2) == 0.5
+    assert shortlist_recall(full_scores, np.array([4, 5]), k=2) == 0.0
+
+
+def test_ranking_cache_shares_scores_across_near_identical_vectors():
+    """规范化后相同的因子向量共享分数，只补算缺少的活动特征组合"""
+    snapshot = _catalog(60)
+    model = SimpleNamespace(version="test")
+    calls = []
+
+    def score_tuples(vector, tuple_rows):
+        calls.append(len(tuple_rows))
+        return vector[0] + tuple_rows / 1000.0
+
+    cache = RankingCache()
+    first = cache.scores(model, snapshot, np.full(6, 0.5), np.arange(10), score_tuples)
+    second = cache.scores(model, snapshot, np.full(6, 0.50000001), np.arange(10), score_tuples)
+    cache.scores(model, snapshot, np.full(6, 0.5), np.arange(20), score_tuples)
+
+    assert np.array_equal(first, second)
+    assert len(calls) == 2
+    assert sum(calls) == len(np.unique(snapshot.tuple_index[:20]))
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_top_k_matches_full_sort():
+    """argpartition 选出的前K个与完整排序一致，刷新抽样只取自前 pool 名"""
+    scores = np.random.default_rng(0).random(1000)
+    order = np.argsort(-scores, kind='stable')
+
+    assert np.array_equal(top_k(scores, 10), order[:10])
+    assert np.array_equal(top_k(scores[:5], 10), order[np.isin(order, np.arange(5))])
+    head = sample_head(len(scores), 10, pool=30, rng=np.random.default_rng(1))
+    assert len(head) == 10 and head.max() < 30 and np.all(np.diff(head) > 0)
+
+
+def test_feed_cursor_roundtrip_and_rejects_garbage():
+    """翻页游标可还原排序版本与偏移量，无效游标报错"""
+    from app.services.recommendation_service import decode_cursor, encode_cursor
+
+    assert decode_cursor(encode_cursor("abc123", 20)) == ("abc123", 20)
+    for cursor in ("not-a-cursor", encode_cursor("abc123", -1)):
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            continue
+        raise AssertionError(f"游标应被拒绝: {cursor}")
+
+
+def test_mmr_rerank_spreads_similar_activities():
+    """MMR 在分数接近时优先选择与已选活动不同类的活动；权重为0时等同于按分数排序"""
+    relevance = np.array([0.90, 0.89, 0.88, 0.70])
+    codes = np.array([[0, 0, 1], [0, 0, 1], [0, 0, 1], [1, 2, 0]])
+
+    assert np.array_equal(mmr_rerank(relevance, codes, 2, 0.3), [0, 3])
+    assert np.array_equal(mmr_rerank(relevance, codes, 4, 0.0), [0, 1, 2, 3])
+
+
+def test_cluster_strategies_compile_to_multiplier_vectors():
+    """score_boost 与偏好类型加成编译为按活动的乘数，命中激励类型或活动类型的活动额外加成"""
+    from app.services.strategy_service import CompiledStrategies
+
+    snapshot = _catalog(6)
+    compiled = CompiledStrategies(1, {
+        "0": {"score_boost": 1.2, "incentive_preference": {"preferred_types": ["points", "quiz"]}},
+        "1": {"score_boost": 1.0, "incentive_preference": {"preferred_types": ["team_reward"]}},
+        "name": {},
+    }, default_boost=1.5)
+    matrix = compiled.build_matrix(snapshot)
+
+    types = [(a["incentive_type"], a["activity_type"]) for a in snapshot.activities]
+    expected = [1.2 * (1.5 if "points" in t or "quiz" in t else 1.0) for t in types]
+    assert np.allclose(matrix[compiled.cluster_row[0]], expected)
+    assert np.allclose(matrix[compiled.cluster_row[1]], 1.0)
+    assert set(compiled.cluster_row) == {0, 1}
+
+
+def test_shipped_cluster_strategies_match_catalog_types():
+    """实际配置中每个聚类的 preferred_types 都能映射到活动目录的激励类型或活动类型"""
+    from app.services.strategy_service import strategy_service
+
+    compiled = strategy_service.compiled()
+    matrix = compiled.build_matrix(_catalog(6))
+    assert compiled.unmatched == []
+    assert len(compiled.cluster_row) == len(rec_config.cluster_strategies)
+    boosts = compiled.boosts[:, None]
+    assert (matrix > boosts + 1e-9).any(axis=1).all()
+
+
+def test_participation_index_masks_joined_activities():
+    """参与记录增量写入后保持升序去重，掩码只标记已参与的活动"""
+    from app.services.participation_service import ParticipationIndex
+
+    index = ParticipationIndex()
+    index._loaded_at = time.time()  # 不读取数据库
+    for activity_id in (7, 3, 7, 12):
+        index.add(1, activity_id)
+
+    assert index.get(1).tolist() == [3, 7, 12]
+    assert index.mask(1, np.array([1, 3, 8, 12, 20])).tolist() == [False, True, False, True, False]
+    assert not index.mask(2, np.array([3])).any()
+    assert index.get_stats()["entries"] == 3
+
+
+def test_preference_mask_filters_with_one_bitwise_and():
+    """偏好字符串编译为位掩码，与活动类型位按位与即得到两种类型都符合偏好的活动"""
+    from app.ml.features import matches_preference, preference_mask
+
+    snapshot = _catalog(12)
+    mask = preference_mask("quiz,share", "points")
+    expected = [
+        a["activity_type"] in ("quiz", "share") and a["incentive_type"] == "points"
+        for a in snapshot.activities
+    ]
+    assert matches_preference(snapshot.type_bits, mask).tolist() == expected
+    assert matches_preference(snapshot.type_bits, preference_mask("", None)).all()
+
+
+def test_activity_window_index_and_timer_wheel():
+    """时间区间索引给出进行中的活动与下一个边界时刻；时间轮只在到期后执行任务"""
+    from datetime import datetime, timedelta
+
+    from app.services.catalog_service import ActivityWindowIndex
+    from app.utils.timer_wheel import TimerWheel
+
+    base = datetime(2030, 1, 1)
+    activities = [
+        {"start_time": None, "end_time": None},
+        {"start_time": base, "end_time": base + timedelta(hours=2)},
+        {"start_time": base + timedelta(hours=1), "end_time": None},
+        {"start_time": None, "end_time": base},
+    ]
+    index = ActivityWindowIndex(activities)
+    now = (base + timedelta(minutes=30)).timestamp()
+    assert index.live(now).tolist() == [0, 1]
+    assert index.next_boundary(now) == (base + timedelta(hours=1)).timestamp()
+    assert index.live((base + timedelta(hours=3)).timestamp()).tolist() == [0, 2]
+    assert index.next_boundary((base + timedelta(hours=3)).timestamp()) == np.inf
+
+    wheel = TimerWheel(tick_seconds=1.0, slots=8)
+    fired = []
+    start = time.time()
+    wheel.schedule("a", start + 2.5, lambda: fired.append("a"))
+    wheel.schedule("b", start + 20, lambda: fired.append("b"))  # 超过一圈
+    wheel.schedule("c", start + 3, lambda: fired.append("c"))
+    wheel.cancel("c")
+    assert wheel.advance(start + 2) == 0
+    assert wheel.advance(start + 4) == 1 and fired == ["a"]
+    assert wheel.advance(start + 12) == 0
+    assert wheel.advance(start + 21) == 1 and fired == ["a", "b"]
+    assert len(wheel) == 0
+
+
+def test_catalog_falls_back_when_no_activity_is_in_its_window():
+    """进行中状态的活动都不在时间窗口内时，快照退回尚未结束的活动，都已结束时退回全部，不返回空目录"""
+    from datetime import datetime, timedelta
+
+    from app.services.catalog_service import ActivityCatalogService, ActivityWindowIndex
+
+    base = datetime(2030, 1, 1)
+    rows = [
+        {**_catalog(3).activities[i], "start_time": start, "end_time": end}
+        for i, (start, end) in enumerate([
+            (None, base),
+            (base + timedelta(days=1), None),
+            (base + timedelta(days=2), base + timedelta(days=3)),
+        ])
+    ]
+    service = ActivityCatalogService()
+    service._rows, service._only_active, service._windows = rows, True, ActivityWindowIndex(rows)
+
+    upcoming = service._build((base + timedelta(hours=1)).timestamp())
+    assert [a["activity_id"] for a in upcoming.activities] == [2, 3]
+    assert service._next_boundary == (base + timedelta(days=1)).timestamp()
+    assert len(service._build((base + timedelta(days=4)).timestamp())) == 1
+    rows[1]["end_time"] = base
+    service._windows = ActivityWindowIndex(rows)
+    assert len(service._build((base + timedelta(days=4)).timestamp())) == 3
+
+
+def test_popularity_counters_decay_and_rank(tmp_path):
+    """前向衰减：一个半衰期后计数减半；冷启动 Top-N 按热度排序并可持久化恢复"""
+    from app.services.popularity_service import PopularityService
+
+    service = PopularityService(path=str(tmp_path / "popularity.json"))
+    service._loaded = True  # 不读取数据库
+    half_life = rec_config.get("inference.popularity.half_life_hours", 72) * 3600
+    now = time.time()
+    service.record(3, "participation", at=now - half_life)
+    service.record_many([2, 3], "click", at=now)
+    service.record(5, "participation", at=now)
+
+    counts = service.counts(now)
+    assert np.allclose(counts[3], [0, 1, 0.5])
+    assert np.allclose(counts[5], [0, 0, 1])
+
+    snapshot = _catalog(6)
+    top = service.top(snapshot, 3)
+    assert [item["activity_id"] for item in top] == [5, 3, 2]
+    assert top[0]["score"] == 1.0
+
+    service.persist()
+    restored = PopularityService(path=service.path)
+    restored.load()
+    assert np.allclose(restored.counts(now)[3], counts[3])
+
+
+def test_deadline_wait_times_out_at_stage_budget():
+    """等待时间取阶段预算与剩余时间的较小者，超时抛出 DeadlineExceeded"""
+    from app.utils.deadline import Deadline, DeadlineExceeded, run_in_worker
+
+    deadline = Deadline(2000)
+    assert deadline.wait(run_in_worker(lambda: 42), "fast", 100) == 42
+
+    started = time.monotonic()
+    try:
+        deadline.wait(run_in_worker(time.sleep, 0.5), "model_predict", 50)
+    except DeadlineExceeded as e:
+        assert e.stage == "model_predict"
+    else:
+        raise AssertionError("应超时")
+    assert time.monotonic() - started < 0.3
+    assert not deadline.expired()
+    assert Deadline(None).timeout_ms() is None
+
+
+def test_worker_pool_rejects_when_queue_full_and_cancels_abandoned_calls():
+    """排队数达到上限时直接拒绝；等待超时放弃的调用若尚未开始则不再执行"""
+    import threading
+
+    from app.utils.deadline import Deadline, DeadlineExceeded, WorkerPool
+
+    pool = WorkerPool(max_workers=1, max_queue=1)
+    release = threading.Event()
+    ran = []
+    blocker = pool.submit(release.wait)
+    queued = pool.submit(ran.append, 1)
+    with pytest.raises(DeadlineExceeded) as exc:
+        pool.submit(ran.append, 2)
+    assert exc.value.stage == "worker_queue"
+
+    with pytest.raises(DeadlineExceeded):
+        Deadline(2000).wait(queued, "model_predict", 20)
+    release.set()
+    blocker.result(timeout=1)
+    assert pool.submit(lambda: 3).result(timeout=1) == 3
+    assert ran == [] and queued.cancelled()
+    assert pool.get_stats() == {"submitted": 3, "rejected": 1, "cancelled": 1}
+
+
+def test_statement_timeout_interrupts_slow_sqlite_query():
+    """数据库语句超出阶段预算时被中断，抛出 DeadlineExceeded，会话之后仍可使用"""
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import sessionmaker
+
+    from app.utils.deadline import Deadline, DeadlineExceeded, statement_timeout
+
+    db = sessionmaker(bind=create_engine("sqlite://"))()
+    slow = text(
+        "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 100000000) SELECT count(*) FROM n"
+    )
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded) as exc:
+        with statement_timeout(db, Deadline(2000), "profile", 50):
+            db.execute(slow).scalar()
+    assert exc.value.stage == "profile"
+    assert time.monotonic() - started < 1.0
+    with statement_timeout(db, Deadline(2000), "profile", 50):
+        assert db.execute(text("SELECT 1")).scalar() == 1
+    db.close()
+
+
+def test_singleflight_shares_one_computation():
+    """并发的相同 key 只执行一次计算并共享结果；等待超时的调用方得到 (False, None)"""
+    import threading
+
+    from app.utils.singleflight import SingleFlight
+
+    flight = SingleFlight("test")
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(2)
+        return {"value": 42}
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(flight.do, "user-1", compute, 2000) for _ in range(8)]
+        while flight.get_stats()["shared"] < 7:
+            time.sleep(0.01)
+        assert flight.do("user-1", compute, 10) == (False, None)
+        release.set()
+        results = [f.result() for f in futures]
+
+    assert len(calls) == 1
+    assert all(ok and result == {"value": 42} for ok, result in results)
+    stats = flight.get_stats()
+    assert stats["executions"] == 1 and stats["timeouts"] == 1 and stats["in_flight"] == 0
+
+
+def test_refresh_queue_deduplicates_and_bounds():
+    """同一 key 排队期间不重复入队，队列满时丢弃"""
+    import threading
+
+    from app.utils.refresh_queue import RefreshQueue
+
+    started, release, done = threading.Event(), threading.Event(), []
+
+    def work(key):
+        started.set()
+        release.wait(2)
+        done.append(key)
+
+    refresher = RefreshQueue(work, "test-refresh", max_size=2, workers=1)
+    assert refresher.enqueue("a")
+    started.wait(2)  # "a" 正在执行，队列为空
+    assert not refresher.enqueue("a")
+    assert refresher.enqueue("b") and refresher.enqueue("c")
+    assert not refresher.enqueue("d")
+    release.set()
+    while refresher.get_stats()["pending"]:
+        time.sleep(0.01)
+
+    stats = refresher.get_stats()
+    assert sorted(done) == ["a", "b", "c"]
+    assert (stats["enqueued"], stats["deduplicated"], stats["dropped"], stats["completed"]) == (3, 1, 1, 3)
+
+
+def test_prewarm_scores_distinct_vectors_in_bounded_chunks(monkeypatch):
+    """预热只为不同的因子向量打分，按单次行数上限分块，结果写入跨用户排序缓存"""
+    from app.services import prewarm_service as prewarm_module
+
+    snapshot = _catalog(60)
+    n_tuples = len(snapshot.feature_tuples)
+    batches = []
+    model = SimpleNamespace(version="test", score_batch=lambda X: batches.append(len(X)) or X[:, 0])
+    cache = RankingCache()
+    monkeypatch.setattr(prewarm_module, "ranking_cache", cache)
+    factors = dict.fromkeys(prewarm_module.FACTOR_COLUMNS, 0.5)
+    profiles = [SimpleNamespace(**factors) for _ in range(3)]
+    profiles += [SimpleNamespace(**{**factors, "factor_social": 0.1 * i}) for i in range(1, 4)]
+
+    prewarm_module.PrewarmService._score_batch(model, snapshot, profiles, {"max_rows_per_call": 2 * n_tuples})
+
+    assert batches == [2 * n_tuples, 2 * n_tuples]
+    rescored = []
+    scores = cache.scores(model, snapshot, np.full(6, 0.5), np.arange(60), lambda v, rows: rescored.append(rows))
+    assert not rescored and np.allclose(scores, 0.5)
+
+
+def test_token_bucket_stores_enforce_second_and_minute_limits():
+    """进程内分段存储与脚本型共享存储（进程内替身）给出相同的放行结果与等待时间"""
+    from app.utils.rate_limit import LocalBucketStore, LocalScriptClient, ScriptBucketStore
+
+    now = [0.0]
+    rules = [(3.0, 3.0), (5.0, 5 / 60)]  # 每秒3次、每分钟5次
+    for store in (LocalBucketStore(stripes=4, clock=lambda: now[0]),
+                  ScriptBucketStore(LocalScriptClient(clock=lambda: now[0]))):
+        now[0] = 0.0
+        assert [store.acquire("alice", rules)[0] for _ in range(4)] == [True, True, True, False]
+        assert store.acquire("alice", rules)[1] == pytest.approx(1 / 3)
+        assert store.acquire("bob", rules)[0]
+        now[0] = 1.0
+        assert [store.acquire("alice", rules)[0] for _ in range(3)] == [True, True, False]
+        assert store.acquire("alice", rules)[1] == pytest.approx(11.0)
+
+
+def test_token_bucket_lua_script_matches_local_stand_in():
+    """TOKEN_BUCKET_SCRIPT 在 Redis（fakeredis 的 Lua 运行时）中执行的结果与进程内替身一致"""
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    from app.utils.rate_limit import LocalScriptClient, ScriptBucketStore
+
+    # Lua 脚本使用服务器时间：补充速率取得很低，测试期间补充的令牌可以忽略
+    rules = [(3.0, 0.001), (5.0, 0.0001)]
+    results = []
+    for client in (fakeredis.FakeRedis(), LocalScriptClient()):
+        store = ScriptBucketStore(client)
+        results.append((
+            [store.acquire("alice", rules) for _ in range(4)],
+            [store.acquire("bob", rules)[0] for _ in range(6)],
+        ))
+    (redis_alice, redis_bob), (local_alice, local_bob) = results
+    assert [a for a, _ in redis_alice] == [a for a, _ in local_alice] == [True, True, True, False]
+    assert redis_alice[3][1] == pytest.approx(local_alice[3][1], rel=1e-3)
+    assert redis_bob == local_bob == [True, True, True, False, False, False]
+
+
+def test_redis_rate_limit_backend_fails_fast_when_unavailable(monkeypatch):
+    """配置为 redis 但无法连接时启动报错，而不是静默退回进程内存储"""
+    pytest.importorskip("redis")
+    from app.config import settings
+    from app.utils.rate_limit import RateLimiter
+
+    monkeypatch.setattr(settings, "REDIS_URL", "redis://127.0.0.1:1/0")
+    limiter = RateLimiter()
+    limiter.config = lambda: {"backend": "redis", "requests_per_second_per_user": 5}
+    with pytest.raises(RuntimeError):
+        limiter.start()
+
+
+def test_admission_control_prefers_feed_and_sheds_admin():
+    """名额释放后先放行推荐流；管理接口队列已满或排队超时时被丢弃"""
+    import asyncio
+
+    from app.utils.admission import AdmissionController, AdmissionRejected
+
+    controller = AdmissionController()
+    cfg = {
+        "enabled": True,
+        "max_concurrent": 1,
+        "classes": {
+            "feed": {"priority": 0, "queue_size": 2, "queue_timeout_ms": 1000},
+            "admin": {"priority": 2, "queue_size": 1, "queue_timeout_ms": 50},
+        },
+    }
+    controller.config = lambda: cfg
+
+    async def scenario():
+        await controller.acquire("feed")
+        admin = asyncio.ensure_future(controller.acquire("admin"))
+        feed = asyncio.ensure_future(controller.acquire("feed"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected, match="queue_full"):
+            await controller.acquire("admin")
+        controller.release("feed")
+        await feed
+        with pytest.raises(AdmissionRejected, match="timeout"):
+            await admin
+        controller.release("feed")
+
+    asyncio.run(scenario())
+    stats = controller.get_stats()
+    assert stats["in_flight"] == 0
+    assert stats["classes"]["feed"]["admitted"] == 2
+    admin_stats = stats["classes"]["admin"]
+    assert (admin_stats["admitted"], admin_stats["shed_queue_full"], admin_stats["shed_timeout"]) == (0, 1, 1)
+    assert admin_stats["queue_depth"] == 0
+
+
+def test_admission_routes_classify_only_user_actions_as_feedback():
+    """按实际配置：点击、反馈与参与属于反馈写入，活动的创建、修改与删除属于管理接口"""
+    from app.utils.admission import AdmissionController
+
+    classify = AdmissionController().classify
+    assert classify("GET", "/api/v1/recommendations/feed") == "feed"
+    assert classify("POST", "/api/v1/recommendations/12/click") == "feedback"
+    assert classify("POST", "/api/v1/recommendations/12/feedback/") == "feedback"
+    assert classify("POST", "/api/v1/activities/12/participate") == "feedback"
+    assert classify("POST", "/api/v1/activities/") == "admin"
+    assert classify("PUT", "/api/v1/activities/12") == "admin"
+    assert classify("DELETE", "/api/v1/activities/12") == "admin"
+    assert classify("GET", "/api/v1/activities/") is None
+    assert classify("POST", "/api/v1/auth/login") is None
+
+def test_config_update_request_rejects_invalid_values():
+    """在线修改配置时拒绝类型错误或超出范围的值，未提供的字段不写入"""
+    from pydantic import ValidationError
+
+    from app.schemas.admin import ConfigUpdateRequest
+
+    for bad in ({"diversity_weight": "high"}, {"diversity_weight": 1.5}, {"min_score": -0.1},
+                {"max_recommendations": 0}, {"cold_start_count": -3}):
+        with pytest.raises(ValidationError):
+            ConfigUpdateRequest(**bad)
+    assert ConfigUpdateRequest(diversity_weight=0.3).model_dump(exclude_none=True) == {"diversity_weight": 0.3}
@@ -0,0 +1,118 @@
+"""
+模型训练测试
+文件名：tests/test_training.py
+"""
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from app.ml.benchmark import benchmark_estimator, select_fastest
+from app.ml.compression import prune_forest
+from app.ml.search import HyperparameterSearch, _mean_or_none, sample_candidates
+from app.ml.train_model import smote_oversample
+
+
+def test_smote_reaches_sampling_strategy():
+    """过采样后少数类达到目标比例，新样本位于少数类样本的凸包内"""
+    rng = np.random.default_rng(0)
+    X = np.vstack([rng.random((90, 4)), 2 + rng.random((10, 4))])
+    y = np.array([0] * 90 + [1] * 10)
+
+    X_res, y_res = smote_oversample(X, y, sampling_strategy=0.8, k_neighbors=3)
+
+    assert (y_res == 1).sum() == int(0.8 * 90)
+    assert (y_res == 0).sum() == 90
+    synthetic = X_res[len(X):]
+    assert synthetic.min() >= 2 and synthetic.max() <= 3
+
+
+def test_search_candidates_and_halving_schedule():
+    """网格搜索枚举全部组合；逐次减半的首轮数据比例不低于下限"""
+    space = {"n_estimators": [10, 20], "max_depth": [3, 5, 8]}
+    assert len(sample_candidates(space, method="grid")) == 6
+    assert len(sample_candidates(space, method="random", n_candidates=4)) == 4
+
+    search = HyperparameterSearch({
+        "successive_halving": {"enabled": True, "eta": 3, "min_resource_fraction": 0.1}
+    })
+    schedule = search._resource_schedule(27)
+    assert schedule[-1] == 1.0
+    assert schedule[0] >= 0.1
+    assert len(schedule) == 3
+
+    # 跳过批量基准测试的折没有吞吐值，平均时忽略
+    assert _mean_or_none([100.0, None, 300.0]) == 200.0
+    assert _mean_or_none([None, None]) is None
+
+
+def test_select_fastest_meeting_targets():
+    """优先选择达标候选中 p99 延迟最低的，均不达标时取 AUC 最高的"""
+    targets = {"min_auc": 0.85, "min_recall": 0.8}
+    candidates = [
+        {"id": "big", "auc": 0.91, "recall": 0.85, "latency_p99_ms": 9.0},
+        {"id": "small", "auc": 0.88, "recall": 0.82, "latency_p99_ms": 2.0},
+        {"id": "fast_but_weak", "auc": 0.80, "recall": 0.90, "latency_p99_ms": 0.5},
+    ]
+    assert select_fastest(candidates, targets)["id"] == "small"
+    assert select_fastest(candidates, {"min_auc": 0.95})["id"] == "big"
+
+
+def test_resident_bytes_counts_tree_arrays():
+    """常驻内存不低于全部树节点（每个节点至少7个8字节字段）与叶子值数组的大小"""
+    rng = np.random.default_rng(0)
+    X = rng.random((400, 3))
+    forest = RandomForestClassifier(n_estimators=20, max_depth=6, random_state=0)
+    forest.fit(X, (X[:, 0] > 0.5).astype(int))
+
+    stats = benchmark_estimator(forest, X, n_single=5, batch_size=50)
+
+    nodes = sum(est.tree_.node_count for est in forest.estimators_)
+    assert stats["resident_bytes"] >= nodes * (7 * 8 + 2 * 8)
+
+
+def test_prune_forest_preserves_output():
+    """剪枝后的子森林输出与原森林接近，且树数不超过上限"""
+    rng = np.random.default_rng(0)
+    X = rng.random((400, 3))
+    y = (X[:, 0] + X[:, 1] > 1).astype(int)
+    forest = RandomForestClassifier(n_estimators=50, max_depth=4, random_state=0).fit(X, y)
+
+    pruned = prune_forest(forest, X, max_trees=10, mae_tolerance=0.0)
+
+    assert len(pruned.estimators_) == 10
+    assert len(forest.estimators_) == 50
+    mae = np.abs(pruned.predict_proba(X)[:, 1] - forest.predict_proba(X)[:, 1]).mean()
+    assert mae < 0.05
+
+
+def test_published_distilled_model_keeps_preprocessing(tmp_path):
+    """蒸馏模型随同原模型的因子分析器发布，从注册中心加载后的打分与原模型的特征对齐一致"""
+    import joblib
+    from sklearn.decomposition import FactorAnalysis
+
+    from app.ml.compression import compress_model, publish_compressed
+    from app.ml.predict import RecommenderModel
+    from app.ml.registry import ModelRegistry
+
+    rng = np.random.default_rng(0)
+    factors = rng.random((300, 6))
+    fa = FactorAnalysis(n_components=3, random_state=0).fit(factors)
+    latent = fa.transform(factors)
+    teacher = RandomForestClassifier(n_estimators=5, max_depth=3, random_state=0)
+    teacher.fit(latent, (latent[:, 0] > 0).astype(int))
+    joblib.dump(teacher, tmp_path / "teacher.pkl")
+    joblib.dump(fa, tmp_path / "fa.pkl")
+
+    source = RecommenderModel(
+        model_path=str(tmp_path / "teacher.pkl"), scaler_path=None, fa_path=str(tmp_path / "fa.pkl")
+    )
+    result = compress_model(source, "distill", cfg={"fit_users": 20, "eval_users": 5, "student_trees": 2})
+    joblib.dump(result["model"], tmp_path / "student.pkl")
+    registry = ModelRegistry(str(tmp_path / "registry"))
+    manifest = publish_compressed(registry, source, result, str(tmp_path / "student.pkl"))
+
+    assert set(manifest["files"]) == {"model", "factor_analyzer"}
+    loaded = RecommenderModel.from_registry(registry, manifest["version"])
+    X = np.hstack([rng.random((10, 6)), np.tile([10.0, 0, 1], (10, 1))])
+    expected = result["model"].predict_proba(source.transform_features(X))[:, 1]
+    assert np.allclose(loaded.score_batch(X), expected)